@@ -0,0 +1,190 @@
+# Batch engagement analysis over everything already scraped, without a browser.
+#
+#   python analyze_all_users.py                      # every <user>/<user>_last_200_tweets.* under the current directory
+#   python analyze_all_users.py --db tweets.sqlite   # the TWEET_STORE_DB dataset instead of the per-user files
+#
+# Users are analyzed in parallel in a process pool. Each user gets the usual <base>_analyzed.csv plus
+# <base>_<bucket>_buckets.csv (tweets and mean engagement per day/week/month). One row per user, with means,
+# above-average counts, percentiles and posting rate, goes to analysis_summary.csv. analysis_index.json remembers each
+# input's size, mtime and SHA-256 (for --db: tweet count and latest scraped_at), so a rerun only re-analyzes users
+# whose tweets changed (--force re-analyzes all).
+
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+import twitter_scraping_cmds as scraper
+
+BUCKET_FREQUENCIES = {"day": "D", "week": "W", "month": "M"}
+PERCENTILES = [0.5, 0.9, 0.99]
+PERCENTILE_COLUMNS = ["favorite_count", "retweet_count", "reply_count", "views_count"]
+
+
+def find_tweets_file(user_dir):
+    """Newest <user>_last_N_tweets.{ndjson,ndjson.gz,ndjson.zst,json} in user_dir, or None. In-progress .partial files are ignored."""
+    candidates = [os.path.join(user_dir, name) for name in os.listdir(user_dir)
+                  if "_last_" in name and any(name.endswith(f"_tweets{suffix}") for suffix in scraper.TWEETS_FILE_SUFFIXES)]
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+
+def file_sha256(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""): digest.update(chunk)
+    return digest.hexdigest()
+
+
+def summarize_tweets(user, tweets_df, bucket, buckets_filename=None):
+    """One summary row for an analyzed tweets DataFrame; also writes the per-bucket table to buckets_filename if given."""
+    summary = {"user": user, "tweets": len(tweets_df)}
+    for column in scraper.ENGAGEMENT_COLUMNS:
+        summary[f"avg_{column}"] = tweets_df.get(f"average_{column}_overall", pd.Series(dtype=float)).max()
+    for flag_column in ["above_avg_favorite", "above_avg_retweet", "above_avg_reply", "above_average_engagement"]:
+        summary[flag_column] = int(tweets_df[flag_column].sum()) if flag_column in tweets_df else 0
+    quantiles = tweets_df[PERCENTILE_COLUMNS].quantile(PERCENTILES) # One pass over all columns
+    for percentile in PERCENTILES:
+        for column in PERCENTILE_COLUMNS: summary[f"p{int(percentile * 100)}_{column}"] = quantiles.at[percentile, column]
+
+    created_at = pd.to_datetime(tweets_df["created_at"], format=scraper.TWITTER_DATE_FORMAT, errors="coerce", utc=True).dt.tz_localize(None)
+    dated_df = tweets_df.assign(period=created_at.dt.to_period(BUCKET_FREQUENCIES[bucket])).dropna(subset=["period"])
+    summary["first_tweet_at"] = created_at.min(); summary["last_tweet_at"] = created_at.max()
+    if dated_df.empty:
+        summary[f"tweets_per_{bucket}"] = None
+        return summary
+    buckets_df = dated_df.groupby("period").agg(tweets=("tweet_id", "size"), avg_favorite_count=("favorite_count", "mean"),
+                                                 avg_retweet_count=("retweet_count", "mean"), avg_reply_count=("reply_count", "mean"))
+    spanned_buckets = pd.period_range(buckets_df.index.min(), buckets_df.index.max(), freq=BUCKET_FREQUENCIES[bucket])
+    summary[f"tweets_per_{bucket}"] = len(dated_df) / len(spanned_buckets) # Empty buckets in between count as zero
+    if buckets_filename:
+        buckets_df.reindex(spanned_buckets, fill_value=0).rename_axis(bucket).to_csv(buckets_filename, encoding="utf-8-sig")
+    return summary
+
+
+def analyze_user_file(task):
+    """Process-pool worker for one user directory. Returns (user_dir, index_entry); an input whose hash matches the
+    previous run keeps its previous summary."""
+    user_dir, tweets_filename, bucket, previous_entry, verbose = task
+    stat = os.stat(tweets_filename)
+    index_entry = {"tweets_file": tweets_filename, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(tweets_filename), "bucket": bucket}
+    if previous_entry and previous_entry.get("sha256") == index_entry["sha256"] and previous_entry.get("bucket") == bucket and previous_entry.get("summary"):
+        return user_dir, dict(index_entry, summary=previous_entry["summary"], skipped=True) # Touched but identical content
+
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()): # Per-user output only with --verbose
+        tweets_df = scraper.analyze_and_save_tweets(tweets_filename, user_dir)
+    if tweets_df is None: return user_dir, dict(index_entry, summary=None)
+    buckets_filename = os.path.join(user_dir, f"{scraper.tweets_base_filename(tweets_filename)}_{bucket}_buckets.csv")
+    summary = summarize_tweets(os.path.basename(os.path.normpath(user_dir)), tweets_df, bucket, buckets_filename)
+    return user_dir, dict(index_entry, summary=json_safe(summary))
+
+
+def analyze_user_from_db(task):
+    """Process-pool worker for one user of the SQLite store (no per-user files are written)."""
+    db_filename, user_id, bucket, fingerprint = task
+    with contextlib.closing(sqlite3.connect(db_filename)) as connection:
+        tweets_df = pd.read_sql_query("SELECT * FROM tweets WHERE user_id_str = ?", connection, params=(user_id,))
+    tweets_df = tweets_df.drop(columns=["scraped_at", "raw"], errors="ignore")
+    scraper.add_engagement_columns(tweets_df)
+    user = tweets_df["screen_name"].dropna().iloc[-1] if tweets_df["screen_name"].notna().any() else user_id
+    return f"db:{user_id}", dict(fingerprint, bucket=bucket, summary=json_safe(summarize_tweets(user, tweets_df, bucket)))
+
+
+def json_safe(summary):
+    """Timestamps as ISO strings and NaN as None, so summaries round-trip through analysis_index.json."""
+    safe_summary = {}
+    for key, value in summary.items():
+        if isinstance(value, pd.Timestamp): value = value.isoformat()
+        elif value is pd.NaT or (isinstance(value, float) and value != value): value = None
+        elif hasattr(value, "item"): value = value.item() # numpy scalars
+        safe_summary[key] = value
+    return safe_summary
+
+
+def load_index(index_filename):
+    try:
+        with open(index_filename, "r", encoding="utf-8") as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError): return {}
+
+
+def save_index(index_filename, index):
+    temp_filename = index_filename + ".tmp"
+    with open(temp_filename, "w", encoding="utf-8") as f: json.dump(index, f)
+    os.replace(temp_filename, index_filename)
+
+
+def file_tasks(root_dir, index, bucket, force, verbose):
+    """Yields worker tasks for user directories whose tweets file changed size or mtime since the indexed run."""
+    skipped = 0
+    for entry in os.scandir(root_dir):
+        if not entry.is_dir() or entry.name.startswith("."): continue
+        tweets_filename = find_tweets_file(entry.path)
+        if not tweets_filename: continue
+        previous_entry = index.get(entry.path)
+        stat = os.stat(tweets_filename)
+        if not force and previous_entry and previous_entry.get("tweets_file") == tweets_filename and previous_entry.get("bucket") == bucket and \
+           previous_entry.get("size") == stat.st_size and previous_entry.get("mtime_ns") == stat.st_mtime_ns:
+            skipped += 1; continue
+        yield entry.path, tweets_filename, bucket, None if force else previous_entry, verbose
+    if skipped: print(f"{skipped} users unchanged since the last analysis (size and mtime); skipping them.")
+
+
+def db_tasks(db_filename, index, bucket, force):
+    """Yields worker tasks for store users whose tweet count or latest scraped_at changed since the indexed run."""
+    with contextlib.closing(sqlite3.connect(db_filename)) as connection:
+        fingerprints = connection.execute("SELECT user_id_str, COUNT(*), MAX(scraped_at) FROM tweets WHERE user_id_str IS NOT NULL GROUP BY user_id_str").fetchall()
+    skipped = 0
+    for user_id, tweet_count, last_scraped_at in fingerprints:
+        fingerprint = {"tweets": tweet_count, "last_scraped_at": last_scraped_at}
+        previous_entry = index.get(f"db:{user_id}")
+        if not force and previous_entry and previous_entry.get("bucket") == bucket and all(previous_entry.get(key) == value for key, value in fingerprint.items()): skipped += 1; continue
+        yield db_filename, user_id, bucket, fingerprint
+    if skipped: print(f"{skipped} users unchanged in {db_filename}; skipping them.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze all scraped users in parallel, skipping unchanged inputs.")
+    parser.add_argument("root_dir", nargs="?", default=".", help="Directory holding one sub-directory per scraped user")
+    parser.add_argument("--db", help="Analyze the TWEET_STORE_DB SQLite store instead of the per-user files")
+    parser.add_argument("--bucket", choices=sorted(BUCKET_FREQUENCIES), default="week", help="Time bucket for posting/engagement rates")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--index", default="analysis_index.json", help="Change-detection index (relative to root_dir)")
+    parser.add_argument("--summary", default="analysis_summary.csv", help="Cross-user summary CSV (relative to root_dir)")
+    parser.add_argument("--force", action="store_true", help="Re-analyze every user")
+    parser.add_argument("--verbose", action="store_true", help="Show the per-user analysis output")
+    args = parser.parse_args()
+
+    index_filename = os.path.join(args.root_dir, args.index); summary_filename = os.path.join(args.root_dir, args.summary)
+    entries = load_index(index_filename).get("users", {}) # Entries analyzed with another --bucket are redone
+    tasks = list(db_tasks(args.db, entries, args.bucket, args.force) if args.db else file_tasks(args.root_dir, entries, args.bucket, args.force, args.verbose))
+    worker = analyze_user_from_db if args.db else analyze_user_file
+
+    start_time = time.time(); analyzed = unchanged = failed = 0
+    print(f"Analyzing {len(tasks)} users with {args.workers} processes...")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(worker, task): task for task in tasks}
+        for future_index, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            try: user_key, index_entry = future.result()
+            except Exception as e_user: print(f"Error analyzing {futures[future][1]}: {e_user}"); failed += 1; continue
+            if index_entry.pop("skipped", False): unchanged += 1
+            else: analyzed += 1
+            entries[user_key] = index_entry
+            if future_index % 1000 == 0: print(f"{future_index}/{len(tasks)} users done ({time.time() - start_time:.0f}s)...")
+
+    if not args.db: entries = {key: entry for key, entry in entries.items() if key.startswith("db:") or os.path.isdir(key)} # Drop deleted users
+    save_index(index_filename, {"users": entries})
+    summary_rows = [entry["summary"] for key, entry in entries.items() if entry.get("summary") and key.startswith("db:") == bool(args.db)]
+    summary_df = pd.DataFrame(summary_rows)
+    if not summary_df.empty: summary_df.sort_values("user").to_csv(summary_filename, index=False, encoding="utf-8-sig")
+    print(f"Analyzed {analyzed} users ({unchanged} unchanged by content, {failed} failed) in {time.time() - start_time:.1f}s.")
+    print(f"Summary of {len(summary_df)} users saved to {summary_filename}")
+    if not summary_df.empty:
+        print(summary_df[[f"avg_{column}" for column in scraper.ENGAGEMENT_COLUMNS] + [f"tweets_per_{args.bucket}"]].describe(percentiles=PERCENTILES).round(2).to_string())
+
+if __name__ == "__main__":
+    main()
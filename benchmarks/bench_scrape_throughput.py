@@ -0,0 +1,129 @@
+# End-to-end throughput of the scraper against a local graphql_replay_server.py: users/hour, seconds per 200 tweets and
+# peak RSS for each engine/worker count and pagination mode, without touching x.com.
+#
+#   python benchmarks/bench_scrape_throughput.py --users 20 --configs sync:1 sync:4 async:4 --modes scroll direct
+#
+# A synthetic fixture set is written to a temporary directory and served in-process. Besides the regular users it has a
+# suspended, a missing, an empty-timeline and a rate-limited (two 429s) account. Each configuration runs
+# twitter_scraping_cmds.main() in its own subprocess and working directory (fake logged-in state.json, RESUME_FROM_JOURNAL
+# off), then the outcome of every user is checked: full timelines saved, edge-case users handled. Peak RSS is the sum over
+# the whole process tree (Python, Playwright driver, Chromium) when psutil is installed, otherwise the largest single
+# process as reported by getrusage.
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import graphql_replay_server as replay
+try: import psutil # Optional: whole-tree RSS sampling
+except ImportError: psutil = None
+
+EDGE_CASE_OUTCOMES = {"bench_suspended": "problematic", "bench_missing": "problematic", "bench_empty": "no tweets", "bench_rate_limited": "full"}
+
+
+def run_child(settings):
+    """Runs inside the per-configuration subprocess: scrape every user, then print one BENCH_RESULT line."""
+    import twitter_scraping_cmds as scraper
+    os.chdir(settings["run_dir"])
+    scraper.X_BASE_URL = settings["base_url"]; scraper.SCRAPER_ENGINE = settings["engine"]; scraper.NUM_WORKERS = settings["workers"]
+    scraper.DIRECT_GRAPHQL_PAGINATION = settings["mode"] == "direct"; scraper.NUM_POSTS_TO_RETRIEVE = settings["tweets"]
+    scraper.RESUME_FROM_JOURNAL = False; scraper.HEADLESS = True
+    scraper.LOCAL_OPERATION_RETRY_BASE_DELAY_SECONDS = 5; scraper.GLOBAL_RETRY_DELAY_SECONDS = 5 # Only used without x-rate-limit-reset
+
+    start_time = time.perf_counter(); scraper.main(); elapsed = time.perf_counter() - start_time
+
+    tweet_counts = {}; mismatches = []
+    for screen_name in settings["usernames"]:
+        tweets_filename = scraper.tweets_output_filename(os.path.join(".", screen_name), screen_name)
+        tweet_counts[screen_name] = sum(1 for _ in scraper.iter_stored_tweets(tweets_filename)) if os.path.exists(tweets_filename) else 0
+        expected = EDGE_CASE_OUTCOMES.get(screen_name, "full")
+        if expected == "problematic": ok = scraper.is_username_problematic(screen_name)
+        elif expected == "no tweets": ok = tweet_counts[screen_name] == 0 and not scraper.is_username_problematic(screen_name)
+        else: ok = tweet_counts[screen_name] == settings["tweets"]
+        if not ok: mismatches.append(f"{screen_name}: expected {expected}, got {tweet_counts[screen_name]} tweets")
+    largest_process_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print("BENCH_RESULT " + json.dumps({"seconds": elapsed, "tweets": sum(tweet_counts.values()), "mismatches": mismatches, "largest_process_mb": largest_process_kb / 1024}))
+
+
+def tree_rss_bytes(process):
+    try: return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+    except psutil.Error: return 0
+
+
+def run_config(engine, workers, mode, args, base_url, host, usernames, work_dir):
+    run_dir = os.path.join(work_dir, f"{engine}{workers}_{mode}"); os.makedirs(run_dir)
+    with open(os.path.join(run_dir, "usernames.txt"), "w", encoding="utf-8") as f: f.write("\n".join(usernames) + "\n")
+    replay.write_fake_accounts(run_dir, 1, host); os.replace(os.path.join(run_dir, "replay_account_1.json"), os.path.join(run_dir, "state.json"))
+    settings = {"engine": engine, "workers": workers, "mode": mode, "tweets": args.tweets, "base_url": base_url, "run_dir": run_dir, "usernames": usernames}
+
+    log_filename = os.path.join(run_dir, "scraper.log"); peak_tree_bytes = 0
+    with open(log_filename, "w", encoding="utf-8") as log:
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", json.dumps(settings)], stdout=log, stderr=subprocess.STDOUT)
+        watched = psutil.Process(process.pid) if psutil else None
+        while process.poll() is None:
+            if watched: peak_tree_bytes = max(peak_tree_bytes, tree_rss_bytes(watched))
+            time.sleep(0.2)
+    with open(log_filename, "r", encoding="utf-8") as log: result_lines = [line for line in log if line.startswith("BENCH_RESULT ")]
+    if not result_lines: print(f"{engine}:{workers} {mode}: no result (exit code {process.returncode}), see {log_filename}"); return None
+    result = json.loads(result_lines[-1][len("BENCH_RESULT "):])
+    result.update(config=f"{engine}:{workers} {mode}", users=len(usernames), peak_rss_mb=peak_tree_bytes / 2 ** 20 if watched else None, log=log_filename)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scraper throughput against the offline replay server.")
+    parser.add_argument("--users", type=int, default=20, help="Regular synthetic users (the four edge-case users come on top)")
+    parser.add_argument("--tweets", type=int, default=200, help="Tweets per user (also NUM_POSTS_TO_RETRIEVE)")
+    parser.add_argument("--configs", nargs="+", default=["sync:1", "sync:4", "async:4"], help="engine:workers pairs")
+    parser.add_argument("--modes", nargs="+", choices=["scroll", "direct"], default=["scroll", "direct"], help="Scrolling vs DIRECT_GRAPHQL_PAGINATION")
+    parser.add_argument("--latency-ms", type=int, default=50, help="Delay the replay server adds to every GraphQL response")
+    parser.add_argument("--no-edge-cases", action="store_true", help="Only regular users")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory (fixtures, per-run output and logs)")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="scrape_bench_"); record_dir = os.path.join(work_dir, "recordings"); host = "127.0.0.1"
+    usernames = replay.write_synthetic_recordings(record_dir, args.users, args.tweets, edge_cases=not args.no_edge_cases)
+    server = replay.make_server(record_dir, host, 0, latency_ms=args.latency_ms)
+    base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Replaying {len(usernames)} synthetic users ({args.tweets} tweets each, {args.latency_ms}ms latency) on {base_url}; work dir {work_dir}")
+    if not psutil: print("psutil not installed: peak RSS is the largest single process, not the whole browser tree.")
+
+    results = []
+    try:
+        for config in args.configs:
+            engine, _, workers = config.partition(":")
+            for mode in args.modes:
+                print(f"Running {engine}:{workers or 1} {mode}...")
+                replay.ReplayHandler.reset_counters() # Every run meets the rate-limited user's 429s
+                result = run_config(engine, int(workers or 1), mode, args, base_url, host, usernames, work_dir)
+                if result: results.append(result)
+    finally:
+        server.shutdown()
+
+    print(f"\n{'config':<16}{'users':>6}{'tweets':>8}{'seconds':>9}{'users/h':>9}{'s/200tw':>9}{'peak RSS MB':>13}  checks")
+    for result in results:
+        users_per_hour = result["users"] / result["seconds"] * 3600
+        seconds_per_200 = result["seconds"] / result["tweets"] * 200 if result["tweets"] else float("nan")
+        peak_rss_mb = result["peak_rss_mb"] if result["peak_rss_mb"] is not None else result["largest_process_mb"]
+        print(f"{result['config']:<16}{result['users']:>6}{result['tweets']:>8}{result['seconds']:>9.1f}{users_per_hour:>9.0f}{seconds_per_200:>9.2f}{peak_rss_mb:>13.0f}  "
+              f"{'ok' if not result['mismatches'] else '; '.join(result['mismatches'])}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(results, f, indent=2)
+    failed = len(results) < len(args.configs) * len(args.modes) or any(result["mismatches"] for result in results)
+    if args.keep or failed: print(f"Kept {work_dir} (fixtures, per-run output and scraper.log)")
+    else: shutil.rmtree(work_dir, ignore_errors=True)
+    if failed: sys.exit(1)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child": run_child(json.loads(sys.argv[2]))
+    else: main()
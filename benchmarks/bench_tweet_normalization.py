@@ -0,0 +1,97 @@
+# Compares the per-tweet dict flattening analyze_and_save_tweets used to do with the precompiled-path column extractor
+# (extract_tweet_columns + add_engagement_columns) on a synthetic UserTweets corpus.
+#
+#   python benchmarks/bench_tweet_normalization.py --count 1000000
+#
+# Tweets are generated on the fly from a small set of templates (each with its own rest_id), so the corpus never has
+# to fit in memory; the "generate only" line is that overhead, included in both timings.
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+import twitter_scraping_cmds as scraper
+
+
+def make_template_tweet(rng, user_index):
+    screen_name = f"user{user_index}"
+    tweet = {"__typename": "Tweet", "rest_id": "0",
+             "core": {"user_results": {"result": {"__typename": "User", "rest_id": str(1000 + user_index), "is_blue_verified": rng.random() < 0.3,
+                                                  "legacy": {"name": screen_name.title(), "screen_name": screen_name, "followers_count": rng.randint(0, 10 ** 6)}}}},
+             "views": {"count": str(rng.randint(0, 10 ** 6)), "state": "EnabledWithCount"},
+             "legacy": {"created_at": "Wed Oct 10 20:19:24 +0000 2018", "favorite_count": rng.randint(0, 5000), "quote_count": rng.randint(0, 50),
+                        "reply_count": rng.randint(0, 300), "retweet_count": rng.randint(0, 1000), "bookmark_count": rng.randint(0, 100),
+                        "full_text": "synthetic tweet " * rng.randint(1, 15), "lang": rng.choice(["en", "es", "ja"]),
+                        "entities": {"hashtags": [], "urls": [], "user_mentions": []}}}
+    if rng.random() < 0.1: tweet["note_tweet"] = {"note_tweet_results": {"result": {"text": "long-form note " * 40}}}
+    return tweet
+
+
+def synthetic_tweets(count, templates):
+    for tweet_index, template in zip(range(count), itertools.cycle(templates)):
+        yield dict(template, rest_id=str(10 ** 18 + tweet_index))
+
+
+def legacy_normalize(tweets):
+    """The previous analyze_and_save_tweets body: dotted paths split per value, one dict per tweet, column-by-column to_numeric."""
+    def returnValueFromData(data_dict, key_path, default=None):
+        temp = data_dict;
+        for key_part in key_path.split('.'):
+            if isinstance(temp, dict) and key_part in temp: temp = temp[key_part]
+            elif isinstance(temp, list) and key_part.isdigit() and int(key_part) < len(temp): temp = temp[int(key_part)]
+            else: return default
+        return temp
+    tweets_list = []
+    for tweet_data in tweets:
+        tweet_json = {};
+        for key, json_path in scraper.tweet_key_to_key_mapping.items(): tweet_json[key] = returnValueFromData(tweet_data, json_path)
+        tweet_json["full_text"] = tweet_json.get("full_text_note") or tweet_json.get("full_text_legacy")
+        if "full_text_note" in tweet_json: del tweet_json["full_text_note"]
+        if "full_text_legacy" in tweet_json: del tweet_json["full_text_legacy"]
+        tweets_list.append(tweet_json)
+    tweets_df = pd.DataFrame(tweets_list)
+    for col in scraper.NUMERIC_TWEET_COLUMNS: tweets_df[col] = pd.to_numeric(tweets_df[col], errors='coerce')
+    tweets_df_for_avg = tweets_df.dropna(subset=['favorite_count', 'retweet_count', 'reply_count'])
+    avg_favorite = tweets_df_for_avg['favorite_count'].mean(); avg_retweet = tweets_df_for_avg['retweet_count'].mean(); avg_reply = tweets_df_for_avg['reply_count'].mean()
+    tweets_df['above_avg_favorite'] = tweets_df['favorite_count'] > avg_favorite; tweets_df['above_avg_retweet'] = tweets_df['retweet_count'] > avg_retweet; tweets_df['above_avg_reply'] = tweets_df['reply_count'] > avg_reply
+    tweets_df['above_average_engagement'] = (tweets_df['above_avg_favorite'] | tweets_df['above_avg_retweet'] | tweets_df['above_avg_reply'])
+    tweets_df['average_favorite_count_overall'] = avg_favorite; tweets_df['average_retweet_count_overall'] = avg_retweet; tweets_df['average_reply_count_overall'] = avg_reply
+    return tweets_df
+
+
+def columnar_normalize(tweets):
+    tweets_df = pd.DataFrame(scraper.extract_tweet_columns(tweets))
+    scraper.add_engagement_columns(tweets_df)
+    return tweets_df
+
+
+def timed(label, function, *args):
+    start_time = time.perf_counter(); result = function(*args); elapsed = time.perf_counter() - start_time
+    print(f"{label:<22} {elapsed:8.2f}s")
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tweet normalization on a synthetic corpus.")
+    parser.add_argument("--count", type=int, default=1_000_000, help="Number of synthetic tweets")
+    parser.add_argument("--templates", type=int, default=500, help="Distinct template tweets cycled through")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    templates = [make_template_tweet(rng, template_index % 50) for template_index in range(args.templates)]
+    print(f"Normalizing {args.count:,} synthetic tweets ({args.templates} templates)...")
+    timed("generate only", lambda: sum(1 for _ in synthetic_tweets(args.count, templates)))
+    legacy_seconds, legacy_df = timed("legacy (dict per row)", legacy_normalize, synthetic_tweets(args.count, templates))
+    columnar_seconds, columnar_df = timed("columnar (compiled)", columnar_normalize, synthetic_tweets(args.count, templates))
+
+    pd.testing.assert_frame_equal(legacy_df, columnar_df, check_dtype=False) # Same CSV either way
+    print(f"Speedup: {legacy_seconds / columnar_seconds:.2f}x ({args.count / columnar_seconds:,.0f} tweets/s)")
+
+if __name__ == "__main__":
+    main()
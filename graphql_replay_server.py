@@ -0,0 +1,279 @@
+# Local stand-in for x.com that replays GraphQL pages recorded with GRAPHQL_RECORD_DIR (see twitter_scraping_cmds.py).
+#
+#   python graphql_replay_server.py graphql_recordings --port 8765
+#
+# then set X_BASE_URL = "http://127.0.0.1:8765" in twitter_scraping_cmds.py to scrape offline. Each profile page
+# fires UserByScreenName and the first UserTweets XHR, and requests the next recorded page on every mouse wheel,
+# so both the scrolling loop and DIRECT_GRAPHQL_PAGINATION can run against it.
+#
+# To exercise ACCOUNT_STORAGE_STATES_DIR rotation, write fake logged-in accounts and give each a small budget:
+#
+#   python graphql_replay_server.py graphql_recordings --write-fake-accounts sessions --accounts 3
+#   python graphql_replay_server.py graphql_recordings --rate-limit 20 --window 60
+#
+# GraphQL responses then carry x-rate-limit-* headers per auth_token cookie and turn into 429s once it is used up.
+#
+# Without recordings, --write-synthetic writes a fixture set in the same format (benchmarks/bench_scrape_throughput.py
+# uses it), including the edge cases below. A scenarios.json in the record directory marks users that should behave
+# differently from a plain replay:
+#
+#   {"some_user": {"status": "suspended"}, "other_user": {"rate_limited_requests": 2, "reset_seconds": 5}}
+#
+# "suspended" serves the "Account suspended" page and a UserUnavailable UserByScreenName result, "missing" the
+# doesn't-exist page and an empty UserByScreenName result ({"data": {}}, as X does), and rate_limited_requests answers
+# the user's first N GraphQL requests with 429s (reset after reset_seconds). A user whose only UserTweets recording
+# has no entries replays as an empty timeline.
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PROFILE_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>{screen_name} / X</title></head>
+<body><div data-testid="primaryColumn" style="height: 20000px">@{screen_name}</div>
+<script>
+var nextCursor = null, loading = false;
+function graphql(operation, variables, onload) {{
+  var xhr = new XMLHttpRequest();
+  xhr.open("GET", "/i/api/graphql/replay/" + operation + "?variables=" + encodeURIComponent(JSON.stringify(variables)) + "&features=%7B%7D");
+  xhr.setRequestHeader("authorization", "Bearer replay");
+  xhr.onload = function () {{ if (onload) onload(xhr); }};
+  xhr.send();
+}}
+function findBottomCursor(node) {{
+  if (!node || typeof node !== "object") return null;
+  if (node.cursorType === "Bottom") return node.value;
+  for (var key in node) {{ var found = findBottomCursor(node[key]); if (found) return found; }}
+  return null;
+}}
+function loadTweets(cursor) {{
+  var variables = {{userId: "{user_id}", count: 20}};
+  if (cursor) variables.cursor = cursor;
+  loading = true;
+  graphql("UserTweets", variables, function (xhr) {{
+    loading = false;
+    try {{ nextCursor = findBottomCursor(JSON.parse(xhr.responseText)); }} catch (e) {{ nextCursor = null; }}
+  }});
+}}
+graphql("UserByScreenName", {{screen_name: "{screen_name}"}});
+loadTweets(null);
+window.addEventListener("wheel", function () {{ if (!loading && nextCursor) loadTweets(nextCursor); }});
+</script></body></html>"""
+
+MISSING_PROFILE_PAGE = """<!DOCTYPE html>
+<html><body><div>This account doesn’t exist</div></body></html>"""
+
+SUSPENDED_PROFILE_PAGE = """<!DOCTYPE html>
+<html><body><div data-testid="primaryColumn"><div>Account suspended</div><div>X suspends accounts which violate the X Rules.</div></div></body></html>"""
+
+EMPTY_TIMELINE = {"data": {"user": {"result": {"timeline_v2": {"timeline": {"instructions": [{"type": "TimelineAddEntries", "entries": []}]}}}}}}
+
+
+def load_recordings(record_dir):
+    """Returns (pages, user_ids): pages maps (operation, key, cursor) to a recorded response, where key is the
+    screen name for UserByScreenName and the user id for UserTweets; user_ids maps screen name to user id."""
+    pages = {}; user_ids = {}
+    for record_filename in sorted(glob.glob(os.path.join(record_dir, "*", "*.json"))):
+        with open(record_filename, "r", encoding="utf-8") as f: record = json.load(f)
+        variables = record.get("variables", {}); operation = record.get("operation")
+        if operation == "UserByScreenName":
+            pages[(operation, record["screen_name"].lower(), None)] = record["response"]
+        elif operation == "UserTweets":
+            user_ids.setdefault(record["screen_name"].lower(), variables.get("userId"))
+            pages[(operation, variables.get("userId"), variables.get("cursor"))] = record["response"]
+    return pages, user_ids
+
+
+def load_scenarios(record_dir):
+    """screen name (lower case) -> scenario dict from record_dir/scenarios.json, or {} if there is none."""
+    try:
+        with open(os.path.join(record_dir, "scenarios.json"), "r", encoding="utf-8") as f: scenarios = json.load(f)
+    except FileNotFoundError: return {}
+    return {screen_name.lower(): scenario for screen_name, scenario in scenarios.items()}
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    pages = {}
+    user_ids = {}
+    scenarios = {}
+    rate_limit = None # Requests per window per auth_token cookie; None = unlimited
+    window_seconds = 900
+    latency_seconds = 0 # Added before every GraphQL response
+    _windows = {} # auth_token -> [window_reset_epoch, requests_used]
+    _windows_lock = threading.Lock()
+    _scenario_requests = {} # screen name -> GraphQL requests seen, for rate_limited_requests
+
+    @classmethod
+    def reset_counters(cls):
+        """Forgets rate-limit windows and scenario 429s served so far, e.g. between benchmark runs."""
+        with cls._windows_lock: cls._windows.clear(); cls._scenario_requests.clear()
+
+    def log_message(self, format, *args):
+        pass # Keep scraper output readable
+
+    def send_body(self, status, body, content_type, headers=None):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(data)))
+        for name, value in (headers or {}).items(): self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def consume_rate_limit(self):
+        """Counts one request against the caller's auth_token. Returns (headers, exhausted)."""
+        if not self.rate_limit: return {}, False
+        cookie = SimpleCookie(self.headers.get("cookie", ""))
+        auth_token = cookie["auth_token"].value if "auth_token" in cookie else ""
+        now = time.time()
+        with self._windows_lock:
+            window = self._windows.get(auth_token)
+            if not window or window[0] <= now: window = self._windows[auth_token] = [now + self.window_seconds, 0]
+            window[1] += 1
+            remaining = max(0, self.rate_limit - window[1])
+            exhausted = window[1] > self.rate_limit
+        headers = {"x-rate-limit-limit": str(self.rate_limit), "x-rate-limit-remaining": str(remaining), "x-rate-limit-reset": str(int(window[0]))}
+        return headers, exhausted
+
+    def consume_scenario_rate_limit(self, screen_name):
+        """429 headers if this is one of the first rate_limited_requests GraphQL requests for screen_name, else None."""
+        scenario = self.scenarios.get(screen_name or "", {})
+        if not scenario.get("rate_limited_requests"): return None
+        with self._windows_lock:
+            requests_seen = self._scenario_requests[screen_name] = self._scenario_requests.get(screen_name, 0) + 1
+        if requests_seen > scenario["rate_limited_requests"]: return None
+        return {"x-rate-limit-limit": "50", "x-rate-limit-remaining": "0", "x-rate-limit-reset": str(int(time.time() + scenario.get("reset_seconds", 5)))}
+
+    def screen_name_for(self, operation, variables):
+        if operation == "UserByScreenName": return variables.get("screen_name", "").lower()
+        return next((screen_name for screen_name, user_id in self.user_ids.items() if user_id == variables.get("userId")), None)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/i/api/1.1/account/settings.json": # Saved-session check: any auth_token cookie counts as logged in
+            if "auth_token" in SimpleCookie(self.headers.get("cookie", "")):
+                return self.send_body(200, json.dumps({"screen_name": "replay"}), "application/json; charset=utf-8")
+            return self.send_body(401, json.dumps({"errors": [{"code": 32, "message": "Could not authenticate you."}]}), "application/json; charset=utf-8")
+        if parsed.path.startswith("/i/api/graphql/"):
+            if self.latency_seconds: time.sleep(self.latency_seconds)
+            operation = parsed.path.rsplit("/", 1)[-1]
+            variables = json.loads(parse_qs(parsed.query).get("variables", ["{}"])[0])
+            rate_limit_headers, exhausted = self.consume_rate_limit()
+            scenario_headers = self.consume_scenario_rate_limit(self.screen_name_for(operation, variables))
+            if exhausted or scenario_headers:
+                return self.send_body(429, json.dumps({"errors": [{"code": 88, "message": "Rate limit exceeded"}]}), "application/json; charset=utf-8", scenario_headers or rate_limit_headers)
+            if operation == "UserByScreenName":
+                status = self.scenarios.get(variables.get("screen_name", "").lower(), {}).get("status")
+                if status == "suspended": response = {"data": {"user": {"result": {"__typename": "UserUnavailable", "reason": "Suspended"}}}}
+                elif status == "missing": response = {"data": {}}
+                else: response = self.pages.get((operation, variables.get("screen_name", "").lower(), None), {"data": {}})
+            else:
+                response = self.pages.get((operation, variables.get("userId"), variables.get("cursor")), EMPTY_TIMELINE)
+            return self.send_body(200, json.dumps(response), "application/json; charset=utf-8", rate_limit_headers)
+
+        screen_name = parsed.path.strip("/")
+        user_id = self.user_ids.get(screen_name.lower()); status = self.scenarios.get(screen_name.lower(), {}).get("status")
+        if status == "suspended": return self.send_body(200, SUSPENDED_PROFILE_PAGE, "text/html; charset=utf-8")
+        if screen_name and user_id and status != "missing":
+            return self.send_body(200, PROFILE_PAGE_TEMPLATE.format(screen_name=screen_name, user_id=user_id), "text/html; charset=utf-8")
+        return self.send_body(404, MISSING_PROFILE_PAGE, "text/html; charset=utf-8")
+
+
+def write_fake_accounts(accounts_dir, count, host):
+    """Writes Playwright storage_state files whose only cookie is a distinct auth_token for the replay host."""
+    os.makedirs(accounts_dir, exist_ok=True)
+    for account_index in range(1, count + 1):
+        storage_state = {"cookies": [{"name": "auth_token", "value": f"replay-account-{account_index}", "domain": host, "path": "/",
+                                      "expires": -1, "httpOnly": True, "secure": False, "sameSite": "Lax"}], "origins": []}
+        with open(os.path.join(accounts_dir, f"replay_account_{account_index}.json"), "w", encoding="utf-8") as f: json.dump(storage_state, f, indent=2)
+    print(f"Wrote {count} fake account storage states to {accounts_dir}.")
+
+
+def synthetic_tweet(tweet_id, user_id, screen_name, rng):
+    return {"__typename": "Tweet", "rest_id": str(tweet_id),
+            "core": {"user_results": {"result": {"__typename": "User", "rest_id": user_id, "legacy": {"name": screen_name.title(), "screen_name": screen_name}}}},
+            "views": {"count": str(rng.randint(0, 10 ** 5)), "state": "EnabledWithCount"},
+            "legacy": {"created_at": time.strftime("%a %b %d %H:%M:%S +0000 %Y", time.gmtime(1700000000 - tweet_id % 10 ** 7)), "full_text": f"synthetic tweet {tweet_id}",
+                       "favorite_count": rng.randint(0, 2000), "retweet_count": rng.randint(0, 300), "reply_count": rng.randint(0, 100),
+                       "quote_count": rng.randint(0, 20), "bookmark_count": rng.randint(0, 50), "lang": "en", "user_id_str": user_id}}
+
+
+def synthetic_timeline_page(tweets, page_index):
+    """A UserTweets payload shaped like X's: tweet entries plus top/bottom cursors (past the last tweet, only the cursors)."""
+    entries = [{"entryId": f"tweet-{tweet['rest_id']}", "sortIndex": tweet["rest_id"],
+                "content": {"entryType": "TimelineTimelineItem", "itemContent": {"itemType": "TimelineTweet", "tweet_results": {"result": tweet}}}} for tweet in tweets]
+    entries.append({"entryId": f"cursor-top-{page_index}", "content": {"entryType": "TimelineTimelineCursor", "cursorType": "Top", "value": f"top-{page_index}"}})
+    entries.append({"entryId": f"cursor-bottom-{page_index}", "content": {"entryType": "TimelineTimelineCursor", "cursorType": "Bottom", "value": f"bottom-{page_index + 1}"}})
+    return {"data": {"user": {"result": {"__typename": "User", "timeline_v2": {"timeline": {"instructions": [{"type": "TimelineAddEntries", "entries": entries}]}}}}}}
+
+
+def write_synthetic_recordings(record_dir, users, tweets_per_user=200, page_size=20, edge_cases=True, seed=7):
+    """Writes GRAPHQL_RECORD_DIR-style recordings for users synthetic accounts (bench_user_0001, ...) with tweets_per_user
+    tweets each, plus bench_suspended, bench_missing, bench_empty and bench_rate_limited if edge_cases. Returns the screen names."""
+    import random
+    rng = random.Random(seed); screen_names = [f"bench_user_{user_index:04d}" for user_index in range(1, users + 1)]
+    scenarios = {}
+    if edge_cases:
+        screen_names += ["bench_suspended", "bench_missing", "bench_empty", "bench_rate_limited"]
+        scenarios = {"bench_suspended": {"status": "suspended"}, "bench_missing": {"status": "missing"}, "bench_rate_limited": {"rate_limited_requests": 2, "reset_seconds": 3}}
+    for user_index, screen_name in enumerate(screen_names, start=1):
+        user_id = str(10 ** 9 + user_index); record_user_dir = os.path.join(record_dir, screen_name); os.makedirs(record_user_dir, exist_ok=True)
+        records = [("UserByScreenName", {"screen_name": screen_name},
+                    {"data": {"user": {"result": {"__typename": "User", "rest_id": user_id, "legacy": {"name": screen_name.title(), "screen_name": screen_name,
+                                                                                                     "followers_count": rng.randint(0, 10 ** 6), "statuses_count": 0 if screen_name == "bench_empty" else tweets_per_user}}}}})]
+        tweet_ids = [] if screen_name == "bench_empty" else [10 ** 18 + user_index * 10 ** 6 + tweet_index for tweet_index in range(tweets_per_user, 0, -1)]
+        if not tweet_ids: records.append(("UserTweets", {"userId": user_id, "count": page_size}, EMPTY_TIMELINE))
+        for page_index, page_start in enumerate(range(0, len(tweet_ids) + page_size, page_size) if tweet_ids else []): # The last page is cursor-only, as on X
+            page_tweets = [synthetic_tweet(tweet_id, user_id, screen_name, rng) for tweet_id in tweet_ids[page_start:page_start + page_size]]
+            variables = {"userId": user_id, "count": page_size}
+            if page_index: variables["cursor"] = f"bottom-{page_index}"
+            records.append(("UserTweets", variables, synthetic_timeline_page(page_tweets, page_index)))
+        for record_index, (operation, variables, response) in enumerate(records):
+            with open(os.path.join(record_user_dir, f"{operation}_{record_index:04d}.json"), "w", encoding="utf-8") as f:
+                json.dump({"operation": operation, "screen_name": screen_name, "variables": variables, "response": response}, f)
+    with open(os.path.join(record_dir, "scenarios.json"), "w", encoding="utf-8") as f: json.dump(scenarios, f, indent=2)
+    return screen_names
+
+
+def make_server(record_dir, host="127.0.0.1", port=8765, rate_limit=None, window=900, latency_ms=0):
+    """Loads record_dir into ReplayHandler and returns a ThreadingHTTPServer (port 0 = any free port) ready for serve_forever()."""
+    ReplayHandler.rate_limit = rate_limit; ReplayHandler.window_seconds = window; ReplayHandler.latency_seconds = latency_ms / 1000
+    ReplayHandler.pages, ReplayHandler.user_ids = load_recordings(record_dir)
+    ReplayHandler.scenarios = load_scenarios(record_dir)
+    return ThreadingHTTPServer((host, port), ReplayHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded X GraphQL pages from a local HTTP server.")
+    parser.add_argument("record_dir", help="Directory written by GRAPHQL_RECORD_DIR")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate-limit", type=int, default=None, help="GraphQL requests allowed per window per auth_token cookie")
+    parser.add_argument("--window", type=int, default=900, help="Rate-limit window in seconds")
+    parser.add_argument("--write-fake-accounts", metavar="DIR", help="Write fake account storage states to DIR and exit")
+    parser.add_argument("--accounts", type=int, default=3, help="Number of fake accounts for --write-fake-accounts")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Delay added to every GraphQL response")
+    parser.add_argument("--write-synthetic", action="store_true", help="Write synthetic recordings (with edge cases) to record_dir and exit")
+    parser.add_argument("--users", type=int, default=20, help="Synthetic users for --write-synthetic")
+    parser.add_argument("--tweets", type=int, default=200, help="Tweets per synthetic user for --write-synthetic")
+    args = parser.parse_args()
+
+    if args.write_fake_accounts: return write_fake_accounts(args.write_fake_accounts, args.accounts, args.host)
+    if args.write_synthetic:
+        screen_names = write_synthetic_recordings(args.record_dir, args.users, args.tweets)
+        return print(f"Wrote synthetic recordings for {len(screen_names)} users to {args.record_dir}.")
+    server = make_server(args.record_dir, args.host, args.port, args.rate_limit, args.window, args.latency_ms)
+    print(f"Loaded {len(ReplayHandler.pages)} recorded pages for {len(ReplayHandler.user_ids)} users from {args.record_dir}.")
+    print(f"Replaying on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: server.server_close()
+
+if __name__ == "__main__":
+    main()
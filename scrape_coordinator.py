@@ -0,0 +1,43 @@
+# Coordinator for distributed runs: seeds and inspects the shared SQLite work queue (WORK_QUEUE_DB). Workers are plain
+# `python twitter_scraping_cmds.py` processes on this host with WORK_QUEUE_DB set. The queue is in WAL mode, so it must
+# live on a local disk; workers on other hosts sharing it over NFS/SMB are not supported.
+# Each claims users with a lease renewed by heartbeat; the lease of a worker that died expires and the user is handed
+# to the next claim, so no user is scraped twice at the same time or dropped. Set TWEET_STORE_DB to get every
+# worker's results merged into one SQLite store (tweets and profiles are upserted on rest_id).
+#
+#   python scrape_coordinator.py seed                  # queue usernames.txt (due users only, if PRIORITY_SCHEDULING)
+#   python scrape_coordinator.py seed --requeue        # new round: due users already done/failed go back to pending
+#   python scrape_coordinator.py status                # users per state, live/expired leases per worker
+#   python scrape_coordinator.py requeue-failed        # another round for users that used up WORK_QUEUE_MAX_ATTEMPTS
+#
+# Workers also queue any usernames.txt entries not in the queue yet when they start, so seeding is optional.
+
+import argparse
+
+import twitter_scraping_cmds as scraper
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed and inspect the shared work queue of a distributed scrape.")
+    parser.add_argument("command", choices=["seed", "status", "requeue-failed"])
+    parser.add_argument("--db", default=scraper.WORK_QUEUE_DB or "work_queue.sqlite", help="Work queue database (WORK_QUEUE_DB)")
+    parser.add_argument("--usernames", default=scraper.USERNAMES_FILE, help="Usernames file to seed from")
+    parser.add_argument("--requeue", action="store_true", help="With seed: also put finished users back to pending")
+    parser.add_argument("--no-schedule", action="store_true", help="With seed: queue every user in file order, ignoring PRIORITY_SCHEDULING")
+    args = parser.parse_args()
+
+    work_queue = scraper.WorkQueue(args.db, scraper.WORK_QUEUE_LEASE_SECONDS, scraper.WORK_QUEUE_MAX_ATTEMPTS)
+    if args.command == "seed":
+        with open(args.usernames, "r", encoding="utf-8") as f: usernames = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+        if scraper.PRIORITY_SCHEDULING and not args.no_schedule: usernames = scraper.schedule_usernames(usernames)
+        print(f"{work_queue.seed(usernames, requeue=args.requeue)} users now pending in {args.db}.")
+    elif args.command == "requeue-failed":
+        print(f"{work_queue.requeue_failed()} failed users back to pending in {args.db}.")
+
+    status = work_queue.status()
+    print(f"{args.db}: {work_queue.describe()}")
+    for worker, (live, expired) in sorted(status["leases"].items()):
+        print(f"  {worker}: {live} live leases{f', {expired} expired' if expired else ''}")
+
+if __name__ == "__main__":
+    main()
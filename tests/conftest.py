@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path: sys.path.insert(0, REPO_DIR)
+
+import twitter_scraping_cmds as scraper
+
+
+@pytest.fixture
+def scraper_env(tmp_path, monkeypatch):
+    """twitter_scraping_cmds run from an empty tmp_path: user dirs, problematic_usernames.txt and the journal land there,
+    and the module-level singletons (limiter, metrics, problematic index, journal, cache, page pools) start fresh."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scraper, "rate_limiter", scraper.RateLimitScheduler())
+    monkeypatch.setattr(scraper, "metrics", scraper.ScrapeMetrics())
+    for name, value in {"_problematic_usernames": None, "_run_journal": None, "_work_queue": None, "_graphql_cache": None, "_account_pool": None,
+                        "_page_pools": {}, "_context_accounts": {}, "_tweet_sinks": {}, "_user_by_screen_name_requests": {}}.items():
+        monkeypatch.setattr(scraper, name, value)
+    return scraper
@@ -0,0 +1,90 @@
+import glob
+import gzip
+import json
+import os
+import time
+
+import twitter_scraping_cmds as scraper
+
+TTL_SECONDS = {"UserByScreenName": 3600, "UserTweets": 60}
+
+
+def user_by_screen_name_url(screen_name):
+    return f"https://x.com/i/api/graphql/q1/UserByScreenName?variables=%7B%22screen_name%22%3A%22{screen_name}%22%7D&features=%7B%7D"
+
+
+def user_tweets_url(cursor):
+    return f"https://x.com/i/api/graphql/q2/UserTweets?variables=%7B%22userId%22%3A%2242%22%2C%22cursor%22%3A%22{cursor}%22%7D"
+
+
+def put(cache, request_url, body='{"data": {"user": {}}}'):
+    cache.put(request_url, body, {"data": {"user": {}}})
+
+
+def age_entry(cache, request_url, seconds):
+    """Backdates an entry's store time (kept in the entry and in its mtime)."""
+    entry_filename = cache.entry_filename(request_url)
+    stored_at = time.time() - seconds
+    with gzip.open(entry_filename, "rt", encoding="utf-8") as f: entry = json.load(f)
+    entry["stored_at"] = stored_at
+    with gzip.open(entry_filename, "wt", encoding="utf-8") as f: json.dump(entry, f)
+    os.utime(entry_filename, (stored_at, stored_at))
+
+
+def test_hit_miss_and_key(scraper_env, tmp_path):
+    cache = scraper.GraphQLResponseCache(str(tmp_path / "cache"), TTL_SECONDS, 10 ** 6)
+    assert cache.get(user_by_screen_name_url("alice")) is None
+    put(cache, user_by_screen_name_url("Alice"), '{"data": {"alice": 1}}')
+    assert cache.get(user_by_screen_name_url("alice")) == '{"data": {"alice": 1}}' # Screen names are case-insensitive
+    assert cache.get(user_by_screen_name_url("bob")) is None
+    cache.put(user_by_screen_name_url("bob"), '{"errors": []}', {"errors": [{"code": 88}]}) # Errors are never cached
+    assert cache.get(user_by_screen_name_url("bob")) is None
+    assert cache.entry_filename("https://x.com/i/api/graphql/q3/Likes?variables=%7B%7D") is None # Operation not cached
+    assert scraper.metrics.counter_total("graphql_cache_hits") == 1 and scraper.metrics.counter_total("graphql_cache_misses") == 3
+
+
+def test_ttl_per_operation(scraper_env, tmp_path):
+    cache = scraper.GraphQLResponseCache(str(tmp_path / "cache"), TTL_SECONDS, 10 ** 6)
+    put(cache, user_tweets_url("c1")); put(cache, user_by_screen_name_url("alice"))
+    age_entry(cache, user_tweets_url("c1"), 120); age_entry(cache, user_by_screen_name_url("alice"), 120)
+    assert cache.get(user_tweets_url("c1")) is None # Past the 60s UserTweets TTL, and removed
+    assert not os.path.exists(cache.entry_filename(user_tweets_url("c1")))
+    assert cache.get(user_by_screen_name_url("alice")) is not None
+
+
+def test_first_incremental_page_is_not_cached(scraper_env, tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "INCREMENTAL_SCRAPING", True)
+    cache = scraper.GraphQLResponseCache(str(tmp_path / "cache"), TTL_SECONDS, 10 ** 6)
+    first_page_url = "https://x.com/i/api/graphql/q2/UserTweets?variables=%7B%22userId%22%3A%2242%22%7D"
+    assert cache.entry_filename(first_page_url) is None and cache.entry_filename(user_tweets_url("c1")) is not None
+
+
+def test_lru_eviction_and_byte_total(scraper_env, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    body = '{"data": {"padding": "' + os.urandom(3000).hex() + '"}}' # Random, so gzip cannot shrink it away
+    probe = scraper.GraphQLResponseCache(str(tmp_path / "probe"), TTL_SECONDS, 10 ** 9)
+    put(probe, user_by_screen_name_url("probe"), body); entry_bytes = os.path.getsize(probe.entry_filename(user_by_screen_name_url("probe")))
+
+    cache = scraper.GraphQLResponseCache(cache_dir, TTL_SECONDS, int(entry_bytes * 4.5))
+    for index in range(4):
+        put(cache, user_by_screen_name_url(f"user{index}"), body)
+        last_used = time.time() - 100 + index; os.utime(cache.entry_filename(user_by_screen_name_url(f"user{index}")), (last_used, last_used)) # user0 least recently used
+    assert cache.get(user_by_screen_name_url("user0")) is not None # Now the most recently used
+    put(cache, user_by_screen_name_url("user4"), body) # Over 4.5 entries' worth: evict down to 90%
+    remaining = {name for name in ("user0", "user1", "user2", "user3", "user4") if os.path.exists(cache.entry_filename(user_by_screen_name_url(name)))}
+    assert remaining == {"user0", "user2", "user3", "user4"} and scraper.metrics.counter_total("graphql_cache_evictions") == 1
+    assert cache._total_bytes == sum(os.path.getsize(path) for path in glob.glob(os.path.join(cache_dir, "*.json.gz")))
+
+    put(cache, user_by_screen_name_url("user4"), body) # Replacing an entry does not double count it
+    cache._remove(cache.entry_filename(user_by_screen_name_url("user3")))
+    assert cache._total_bytes == sum(os.path.getsize(path) for path in glob.glob(os.path.join(cache_dir, "*.json.gz")))
+
+
+def test_stale_temp_files_are_swept(scraper_env, tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = scraper.GraphQLResponseCache(str(cache_dir), TTL_SECONDS, 10 ** 6)
+    stale = cache_dir / "UserTweets-abc.json.gz.1.2.tmp"; fresh = cache_dir / "UserTweets-def.json.gz.3.4.tmp"
+    stale.write_bytes(b"x"); fresh.write_bytes(b"x")
+    old = time.time() - scraper.GRAPHQL_CACHE_STALE_TEMP_SECONDS - 10; os.utime(stale, (old, old))
+    put(cache, user_by_screen_name_url("alice")) # First store scans the directory
+    assert not stale.exists() and fresh.exists()
@@ -0,0 +1,100 @@
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import twitter_scraping_cmds as scraper
+
+USER_TWEETS_URL = ("https://x.com/i/api/graphql/abc123/UserTweets?variables=%7B%22userId%22%3A%2242%22%2C%22count%22%3A20%7D"
+                   "&features=%7B%22f%22%3Atrue%7D&fieldToggles=%7B%22t%22%3Afalse%7D")
+
+
+def tweet_entry(tweet_id):
+    return {"entryId": f"tweet-{tweet_id}", "content": {"entryType": "TimelineTimelineItem", "itemContent": {
+        "itemType": "TimelineTweet", "tweet_results": {"result": {"__typename": "Tweet", "rest_id": str(tweet_id)}}}}}
+
+
+def cursor_entry(kind, value):
+    return {"entryId": f"cursor-{kind.lower()}-{value}", "content": {"entryType": "TimelineTimelineCursor", "cursorType": kind, "value": value}}
+
+
+def timeline(*entries, instructions=None):
+    instructions = instructions or [{"type": "TimelineAddEntries", "entries": list(entries)}]
+    return {"data": {"user": {"result": {"timeline_v2": {"timeline": {"instructions": instructions}}}}}}
+
+
+def variables_of(request_url):
+    return json.loads(parse_qs(urlparse(request_url).query)["variables"][0])
+
+
+def test_extract_bottom_cursor():
+    assert scraper.extract_bottom_cursor(timeline(tweet_entry(1), cursor_entry("Top", "t1"), cursor_entry("Bottom", "b1"))) == "b1"
+    replaced = timeline(instructions=[{"type": "TimelineAddEntries", "entries": [tweet_entry(1)]},
+                                      {"type": "TimelineReplaceEntry", "entry": cursor_entry("Bottom", "b2")}])
+    assert scraper.extract_bottom_cursor(replaced) == "b2"
+    assert scraper.extract_bottom_cursor(timeline(tweet_entry(1), cursor_entry("Top", "t1"))) is None
+    assert scraper.extract_bottom_cursor({}) is None
+
+
+def test_is_last_timeline_page():
+    page = timeline(tweet_entry(1), cursor_entry("Bottom", "b1"))
+    assert not scraper.is_last_timeline_page(page)
+    assert not scraper.is_last_timeline_page(page, previous_cursor="b0")
+    assert scraper.is_last_timeline_page(page, previous_cursor="b1") # Same cursor twice: X keeps answering the last page
+    assert scraper.is_last_timeline_page(timeline(tweet_entry(1))) # No cursor-bottom
+    assert scraper.is_last_timeline_page(timeline(cursor_entry("Top", "t1"), cursor_entry("Bottom", "b2"))) # Only cursors
+
+
+def user_result(**legacy):
+    return {"data": {"user": {"result": {"__typename": "User", "rest_id": "42", "legacy": {"screen_name": "someone", **legacy}}}}}
+
+
+@pytest.mark.parametrize("json_response, status", [
+    (user_result(statuses_count=10), "available"),
+    (user_result(statuses_count=10, protected=True), "protected"),
+    (user_result(statuses_count=0), "no_tweets"),
+    ({"data": {"user": {"result": {"__typename": "UserUnavailable", "reason": "Suspended"}}}}, "suspended"),
+    ({"data": {"user": {"result": {"__typename": "UserUnavailable", "reason": "NoReason"}}}}, "not_found"),
+    ({"data": {}, "errors": [{"code": 63, "message": "User has been suspended."}]}, "suspended"),
+    ({"data": {}, "errors": [{"code": 50, "message": "User not found."}]}, "not_found"),
+    ({"data": {}}, None), # Missing user without an error code: unusable, not proof the account is gone
+    ({"data": {"user": {"result": {"__typename": "User", "rest_id": "42"}}}, "errors": [{"code": 63}]}, None), # Partial error next to a user
+    ({"errors": [{"code": 88}]}, None),
+    (None, None),
+])
+def test_account_status_from_user_by_screen_name(json_response, status):
+    assert scraper.account_status_from_user_by_screen_name(json_response) == status
+
+
+def test_build_user_tweets_page_url_keeps_captured_parameters():
+    page_url = scraper.build_user_tweets_page_url(USER_TWEETS_URL, "DAABCgAB")
+    assert variables_of(page_url) == {"userId": "42", "count": 20, "cursor": "DAABCgAB"}
+    query = parse_qs(urlparse(page_url).query)
+    assert query["features"] == ['{"f":true}'] and query["fieldToggles"] == ['{"t":false}']
+    assert urlparse(page_url).path == urlparse(USER_TWEETS_URL).path
+    assert variables_of(scraper.build_user_tweets_page_url(page_url, "next"))["cursor"] == "next" # Replaces, never appends
+
+
+def test_build_user_by_screen_name_url():
+    template = "https://x.com/i/api/graphql/xyz/UserByScreenName?variables=%7B%22screen_name%22%3A%22first%22%7D&features=%7B%7D"
+    assert variables_of(scraper.build_user_by_screen_name_url(template, "second")) == {"screen_name": "second"}
+
+
+class FakeResponse:
+    def __init__(self, status=200, body="", content_type="application/json; charset=utf-8", url="https://x.com/i/api/graphql/abc/UserTweets?variables=%7B%7D"):
+        self.url = url; self.status = status; self.ok = status < 400; self.headers = {"content-type": content_type}; self.body = body
+
+    def text(self): return self.body
+
+
+def test_parse_graphql_response(scraper_env):
+    assert scraper.read_graphql_json(FakeResponse(body='{"data": {"x": 1}}')) == {"data": {"x": 1}}
+    with pytest.raises(scraper.RateLimitException) as rle:
+        scraper.read_graphql_json(FakeResponse(status=429))
+    assert rle.value.operation == "UserTweets"
+    with pytest.raises(scraper.RateLimitException):
+        scraper.read_graphql_json(FakeResponse(body="Rate limit exceeded", content_type="text/plain"))
+    assert scraper.read_graphql_json(FakeResponse(status=500, body="oops")) is None
+    assert scraper.read_graphql_json(FakeResponse(body="{not json")) is None
+    assert scraper.read_graphql_json(FakeResponse(body="")) is None
+    assert scraper.metrics.counter_total("http_429") == 1
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+import twitter_scraping_cmds as scraper
+
+USER_TWEETS_URL = "https://x.com/i/api/graphql/abc/UserTweets?variables=%7B%7D"
+PROFILE_URL = "https://x.com/i/api/graphql/abc/UserByScreenName?variables=%7B%7D"
+
+
+def budget_headers(remaining, reset_in, limit=50):
+    return {"x-rate-limit-limit": str(limit), "x-rate-limit-remaining": str(remaining), "x-rate-limit-reset": str(int(time.time() + reset_in))}
+
+
+@pytest.fixture
+def adaptive(monkeypatch):
+    monkeypatch.setattr(scraper, "ADAPTIVE_RATE_LIMITING", True)
+    monkeypatch.setattr(scraper, "RATE_LIMIT_RESERVE", 1)
+    monkeypatch.setattr(scraper, "RATE_LIMIT_BURST", 0)
+
+
+def test_header_parsing(adaptive):
+    limiter = scraper.RateLimitScheduler()
+    limiter.update_from_headers(USER_TWEETS_URL, budget_headers(40, 600))
+    limiter.update_from_headers(PROFILE_URL, {"x-rate-limit-remaining": "oops", "x-rate-limit-reset": "1"}) # Malformed: ignored
+    limiter.update_from_headers(PROFILE_URL, {"content-type": "application/json"}) # No budget headers: ignored
+    snapshot = limiter.snapshot()
+    assert list(snapshot) == ["UserTweets"]
+    assert snapshot["UserTweets"]["limit"] == 50 and snapshot["UserTweets"]["remaining"] == 40
+    assert 595 <= snapshot["UserTweets"]["reset_in_seconds"] <= 600
+    assert limiter.budget_fraction() == pytest.approx(0.8)
+
+
+def test_unknown_operations_are_not_paced(adaptive):
+    limiter = scraper.RateLimitScheduler()
+    assert limiter.delay_for("UserTweets") == 0.0 and limiter.seconds_until_reset() is None
+
+
+def test_budget_is_spread_until_reset(adaptive):
+    limiter = scraper.RateLimitScheduler()
+    limiter.update_from_headers(USER_TWEETS_URL, budget_headers(10, 100))
+    delays = [limiter.delay_for("UserTweets") for _ in range(4)]
+    assert delays[0] == pytest.approx(0.0, abs=0.5)
+    for previous, current in zip(delays, delays[1:]): assert current > previous # Each request books the next slot
+    assert delays[1] == pytest.approx(100 / 10, rel=0.2) # Roughly (reset - now) / remaining apart
+
+
+def test_exhausted_budget_waits_until_reset(adaptive):
+    limiter = scraper.RateLimitScheduler()
+    limiter.update_from_headers(USER_TWEETS_URL, budget_headers(1, 30))
+    assert limiter.delay_for("UserTweets") == pytest.approx(31, abs=1.5)
+    assert limiter.delay_for("UserByScreenName", "UserTweets") == pytest.approx(31, abs=1.5) # The slowest operation wins
+    assert limiter.seconds_until_reset("UserTweets") == pytest.approx(31, abs=1.5)
+    assert limiter.seconds_until_reset("UserByScreenName") is None # Other operations are not blocked by it
+
+
+def test_expired_window_is_not_paced(adaptive):
+    limiter = scraper.RateLimitScheduler()
+    limiter.update_from_headers(USER_TWEETS_URL, budget_headers(0, -5))
+    assert limiter.delay_for("UserTweets") == 0.0 and limiter.seconds_until_reset() is None
+
+
+def test_acquire_sleeps_for_the_delay(adaptive, scraper_env, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(scraper.time, "sleep", sleeps.append)
+    limiter = scraper.RateLimitScheduler()
+    limiter.update_from_headers(USER_TWEETS_URL, budget_headers(0, 20))
+    limiter.acquire("UserTweets")
+    assert len(sleeps) == 1 and sleeps[0] == pytest.approx(21, abs=1.5)
+    assert scraper.metrics.phase_calls["rate_limit_wait"] == 1
+
+
+def test_disabled_adaptive_rate_limiting(monkeypatch):
+    monkeypatch.setattr(scraper, "ADAPTIVE_RATE_LIMITING", False)
+    limiter = scraper.RateLimitScheduler()
+    limiter.update_from_headers(USER_TWEETS_URL, budget_headers(0, 20))
+    assert limiter.delay_for("UserTweets") == 0.0
+    assert scraper.rate_limit_retry_delay(2, limiter) == scraper.LOCAL_OPERATION_RETRY_BASE_DELAY_SECONDS + scraper.LOCAL_OPERATION_RETRY_INCREMENT_SECONDS
+
+
+def test_rate_limit_retry_delay(adaptive):
+    limiter = scraper.RateLimitScheduler()
+    assert scraper.rate_limit_retry_delay(1, limiter) == scraper.LOCAL_OPERATION_RETRY_BASE_DELAY_SECONDS # No reset known: fixed backoff
+    limiter.update_from_headers(USER_TWEETS_URL, budget_headers(0, 40))
+    assert scraper.rate_limit_retry_delay(1, limiter, operations=("UserTweets",)) == pytest.approx(41, abs=1.5)
+    assert scraper.rate_limit_retry_delay(1, limiter, operations=("UserByScreenName",)) == scraper.LOCAL_OPERATION_RETRY_BASE_DELAY_SECONDS
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+NOW = 1_700_000_000.0
+HOUR = 3600
+
+
+def store_state(scraper, username, **fields):
+    os.makedirs(username, exist_ok=True)
+    scraper.save_user_scrape_state(username, username, **fields)
+
+
+@pytest.fixture
+def scheduled_users(scraper_env):
+    scraper = scraper_env
+    store_state(scraper, "overdue", last_attempt_at=NOW - 96 * HOUR, posts_per_day=10) # 48h interval, twice overdue
+    store_state(scraper, "slightly_due", last_attempt_at=NOW - 50 * HOUR, posts_per_day=10)
+    store_state(scraper, "not_due", last_attempt_at=NOW - 10 * HOUR, posts_per_day=10)
+    store_state(scraper, "failing", last_attempt_at=NOW - 60 * HOUR, posts_per_day=10, consecutive_failures=1) # Backed off to 96h
+    scraper.mark_username_problematic("problem")
+    return scraper
+
+
+def test_due_users_in_priority_order(scheduled_users):
+    usernames = ["slightly_due", "not_due", "@problem", "overdue", "fresh", "failing"]
+    assert scheduled_users.schedule_usernames(usernames, now=NOW) == ["fresh", "overdue", "slightly_due", "@problem"]
+
+
+def test_max_users_per_run(scheduled_users, monkeypatch):
+    monkeypatch.setattr(scheduled_users, "SCHEDULE_MAX_USERS_PER_RUN", 2)
+    assert scheduled_users.schedule_usernames(["slightly_due", "overdue", "fresh"], now=NOW) == ["fresh", "overdue"]
+
+
+def test_ties_keep_file_order(scraper_env):
+    assert scraper_env.schedule_usernames(["zed", "amy", "bob"], now=NOW) == ["zed", "amy", "bob"] # All never scraped
+
+
+def test_refresh_interval(scraper_env):
+    interval = scraper_env.user_refresh_interval_hours
+    assert interval({}) == scraper_env.SCHEDULE_MIN_INTERVAL_HOURS # Rate unknown
+    assert interval({"posts_per_day": 10}) == pytest.approx(48)
+    assert interval({"posts_per_day": 10, "followers_count": 10 ** 6}) == pytest.approx(48 / 2, rel=0.01)
+    assert interval({"posts_per_day": 0}) == scraper_env.SCHEDULE_MAX_INTERVAL_HOURS # Dormant accounts are clamped
+    assert interval({"posts_per_day": 10, "consecutive_failures": 9}) == pytest.approx(48 * 16) # Backoff capped at 2**4
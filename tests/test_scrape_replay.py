@@ -0,0 +1,181 @@
+import json
+import re
+import threading
+import types
+import urllib.error
+import urllib.request
+from time import sleep as real_sleep
+from urllib.parse import quote, urlsplit
+
+import pytest
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+import graphql_replay_server
+
+RATE_LIMITED_RESET_SECONDS = 3 # bench_rate_limited's scenario in write_synthetic_recordings
+
+
+def http_get(url, headers=None):
+    """(status, lower-cased headers, body text) of a GET, 4xx/5xx included."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=10) as response:
+            return response.status, {name.lower(): value for name, value in response.headers.items()}, response.read().decode("utf-8")
+    except urllib.error.HTTPError as http_error:
+        return http_error.code, {name.lower(): value for name, value in http_error.headers.items()}, http_error.read().decode("utf-8")
+
+
+def find_bottom_cursor(node):
+    """Same walk as findBottomCursor in the replay server's page script."""
+    if isinstance(node, dict):
+        if node.get("cursorType") == "Bottom": return node.get("value")
+        node = list(node.values())
+    for child in node if isinstance(node, list) else []:
+        found = find_bottom_cursor(child)
+        if found: return found
+    return None
+
+
+class ReplayRequest:
+    resource_type = "xhr"
+
+    def __init__(self, url): self.url = url
+
+    def all_headers(self): return {"authorization": "Bearer replay"}
+
+
+class ReplayResponse:
+    def __init__(self, request):
+        self.request = request; self.url = request.url
+        self.status, self.headers, self.body = http_get(request.url, request.all_headers()); self.ok = self.status < 400
+
+    def text(self): return self.body
+
+
+class ReplayPage:
+    """Enough of a sync Playwright Page for scrape_twitter_info against graphql_replay_server: goto loads the profile
+    HTML over HTTP and does what its script does (UserByScreenName plus the first UserTweets XHR, the next page on every
+    mouse wheel), firing request/response events synchronously."""
+    def __init__(self):
+        self.url = "about:blank"; self.body_text = ""; self.has_primary_column = False
+        self.user_id = None; self.next_cursor = None; self.handlers = []; self.closed = False; self.scrolls = 0
+        self.mouse = types.SimpleNamespace(wheel=self.wheel)
+
+    def on(self, event, handler): self.handlers.append((event, handler))
+
+    def remove_listener(self, event, handler): self.handlers.remove((event, handler))
+
+    def emit(self, event, payload):
+        for handler_event, handler in list(self.handlers):
+            if handler_event == event: handler(payload)
+
+    def goto(self, url, timeout=None, wait_until=None):
+        self.url = url; self.user_id = self.next_cursor = None
+        if url == "about:blank": self.body_text = ""; self.has_primary_column = False; return
+        _, _, html = http_get(url)
+        self.body_text = re.sub(r"<script.*?</script>|<[^>]+>", " ", html, flags=re.S)
+        self.has_primary_column = 'data-testid="primaryColumn"' in html
+        user_match = re.search(r'userId: "(\d+)"', html)
+        if user_match:
+            self.user_id = user_match.group(1)
+            self.graphql("UserByScreenName", {"screen_name": re.search(r'screen_name: "([^"]+)"', html).group(1)})
+            self.load_tweets(None)
+
+    def graphql(self, operation, variables):
+        base_url = "{0.scheme}://{0.netloc}".format(urlsplit(self.url))
+        request = ReplayRequest(f"{base_url}/i/api/graphql/replay/{operation}?variables={quote(json.dumps(variables))}&features=%7B%7D")
+        self.emit("request", request); response = ReplayResponse(request); self.emit("response", response)
+        return response
+
+    def load_tweets(self, cursor):
+        variables = {"userId": self.user_id, "count": 20}
+        if cursor: variables["cursor"] = cursor
+        try: self.next_cursor = find_bottom_cursor(json.loads(self.graphql("UserTweets", variables).text()))
+        except ValueError: self.next_cursor = None
+
+    def wheel(self, delta_x, delta_y):
+        self.scrolls += 1
+        if self.next_cursor: self.load_tweets(self.next_cursor)
+
+    def evaluate(self, expression): return self.body_text
+
+    def wait_for_selector(self, selector, timeout=None):
+        if not self.has_primary_column: raise PlaywrightTimeoutError(f"Timeout {timeout}ms waiting for {selector}")
+
+    def wait_for_timeout(self, timeout): pass
+
+    def wait_for_event(self, event, predicate=None, timeout=None):
+        real_sleep(min(timeout, 50) / 1000) # Every event already fired synchronously
+        raise PlaywrightTimeoutError(f"Timeout {timeout}ms waiting for {event}")
+
+    def is_closed(self): return self.closed
+
+    def close(self): self.closed = True
+
+
+class ReplayContext:
+    browser = None # Like a persistent context: always "connected"
+
+    def __init__(self):
+        self.pages_created = 0
+        self.request = types.SimpleNamespace(get=lambda url, headers=None, timeout=None: ReplayResponse(ReplayRequest(url)))
+
+    def new_page(self):
+        self.pages_created += 1; return ReplayPage()
+
+
+@pytest.fixture(scope="module")
+def replay_base_url(tmp_path_factory):
+    record_dir = str(tmp_path_factory.mktemp("recordings"))
+    graphql_replay_server.write_synthetic_recordings(record_dir, users=1)
+    server = graphql_replay_server.make_server(record_dir, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown(); server.server_close()
+
+
+@pytest.fixture
+def replay(scraper_env, replay_base_url, monkeypatch):
+    """(scraper, base URL, recorded time.sleep delays); rate-limit scenarios start over for every test."""
+    graphql_replay_server.ReplayHandler.reset_counters()
+    sleeps = []; monkeypatch.setattr(scraper_env.time, "sleep", sleeps.append)
+    monkeypatch.setattr(scraper_env, "X_BASE_URL", replay_base_url)
+    return scraper_env, replay_base_url, sleeps
+
+
+@pytest.mark.parametrize("direct_pagination", [False, True])
+def test_combined_visit(replay, monkeypatch, direct_pagination):
+    scraper, base_url, sleeps = replay
+    monkeypatch.setattr(scraper, "DIRECT_GRAPHQL_PAGINATION", direct_pagination)
+    tweets, profile = scraper.scrape_twitter_info(ReplayContext(), f"{base_url}/bench_user_0001", True, include_profile=True)
+    assert len(tweets) == scraper.NUM_POSTS_TO_RETRIEVE and len({tweet["rest_id"] for tweet in tweets}) == len(tweets)
+    assert profile["legacy"]["screen_name"] == "bench_user_0001" and not sleeps
+
+
+def test_rate_limited_visit_retries_after_reset(replay):
+    scraper, base_url, sleeps = replay
+    context = ReplayContext()
+    tweets, profile = scraper.scrape_twitter_info(context, f"{base_url}/bench_rate_limited", True, include_profile=True)
+    assert len(tweets) == scraper.NUM_POSTS_TO_RETRIEVE and profile["rest_id"] # Second local attempt got everything
+    assert scraper.metrics.counter_total("http_429") == 2 # UserByScreenName and the first UserTweets page
+    assert scraper.metrics.counter_total("retries") == 1 and scraper.metrics.phase_calls["retry_sleep"] == 1
+    assert sleeps[0] == pytest.approx(RATE_LIMITED_RESET_SECONDS + 0.5, abs=1) # Until x-rate-limit-reset, not the fixed backoff
+    assert context.pages_created == 1 # The page is parked on about:blank and reused by the retry
+
+
+def test_empty_timeline(replay):
+    scraper, base_url, _ = replay
+    tweets, profile = scraper.scrape_twitter_info(ReplayContext(), f"{base_url}/bench_empty", True, include_profile=True)
+    assert tweets == [] and profile["legacy"]["statuses_count"] == 0
+
+
+@pytest.mark.parametrize("screen_name", ["bench_suspended", "bench_missing"])
+def test_unavailable_accounts(replay, screen_name):
+    scraper, base_url, _ = replay
+    with pytest.raises(scraper.AccountUnavailableException):
+        scraper.scrape_twitter_info(ReplayContext(), f"{base_url}/{screen_name}", True, include_profile=True)
+
+
+def test_profile_mode(replay):
+    scraper, base_url, _ = replay
+    profile = scraper.scrape_twitter_info(ReplayContext(), f"{base_url}/bench_user_0001", False)
+    assert profile["legacy"]["screen_name"] == "bench_user_0001"
@@ -0,0 +1,75 @@
+import json
+import os
+import time
+
+import twitter_scraping_cmds as scraper
+
+
+def test_problematic_usernames_add_and_lookup(tmp_path):
+    filename = str(tmp_path / "problematic.txt")
+    index = scraper.ProblematicUsernames(filename)
+    assert "@Alice" not in index
+    assert index.add("@Alice")
+    assert not index.add("alice") # Case-folded, @ stripped
+    assert "ALICE" in index and "@alice" in index and "alic" not in index # Exact match only
+    assert index.remove("Alice") and "alice" not in index
+    assert not index.remove("alice")
+
+
+def test_problematic_usernames_picks_up_other_writers(tmp_path):
+    filename = tmp_path / "problematic.txt"
+    filename.write_text("legacy_user\r\n", encoding="utf-8")
+    index = scraper.ProblematicUsernames(str(filename))
+    assert "legacy_user" in index
+    with open(filename, "a", encoding="utf-8") as f: f.write(f"other_process\t{int(time.time())}\n")
+    assert "other_process" in index # Appended tail read without a reload
+    with open(filename, "a", encoding="utf-8") as f: f.write("half_written") # No newline yet
+    assert "half_written" not in index
+    with open(filename, "a", encoding="utf-8") as f: f.write("\n")
+    assert "half_written" in index
+
+
+def test_problematic_usernames_reloads_rewritten_file(tmp_path):
+    filename = tmp_path / "problematic.txt"
+    filename.write_text("alice\nbob\n", encoding="utf-8")
+    index = scraper.ProblematicUsernames(str(filename))
+    assert "alice" in index
+    filename.write_text("carol\n", encoding="utf-8") # Truncated and rewritten by hand
+    assert "alice" not in index and "carol" in index
+    stat = os.stat(filename)
+    filename.write_text("dave_\n", encoding="utf-8") # Same size, rewritten in place
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert "carol" not in index and "dave_" in index
+    os.remove(filename)
+    assert "dave_" not in index
+
+
+def test_problematic_usernames_ttl(tmp_path):
+    filename = tmp_path / "problematic.txt"
+    filename.write_text(f"old_user\t{int(time.time()) - 10 * 86400}\nlegacy_user\nnew_user\t{int(time.time())}\n", encoding="utf-8")
+    index = scraper.ProblematicUsernames(str(filename), ttl_days=7)
+    assert "new_user" in index
+    assert "old_user" not in index and index.is_expired("old_user")
+    assert "legacy_user" not in index and index.is_expired("legacy_user") # No timestamp counts as expired
+    assert index.add("old_user") and "old_user" in index # Re-listed after the re-check
+
+
+def test_run_journal_resume(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    journal = scraper.RunJournal(filename)
+    journal.record("alice", "pending")
+    journal.record("alice", "pending", tweets_done=True)
+    journal.record("bob", "completed")
+    journal.record("carol", "problematic")
+    journal.record("dave", "rate_limited")
+    with open(filename, "a", encoding="utf-8") as f: f.write('{"username": "erin", "sta') # Torn line from a crash
+
+    resumed = scraper.RunJournal(filename)
+    assert resumed.entry("alice")["tweets_done"] and resumed.entry("alice")["state"] == "pending"
+    assert [name for name in ("alice", "bob", "carol", "dave", "erin") if resumed.is_finished(name)] == ["bob", "carol"]
+    assert resumed.entry("erin") == {}
+    with open(filename, encoding="utf-8") as f: lines = [json.loads(line) for line in f]
+    assert [entry["username"] for entry in lines] == ["alice", "bob", "carol", "dave"] # Compacted to one line per user
+
+    resumed.archive()
+    assert not os.path.exists(filename) and not resumed.is_finished("bob")
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import twitter_scraping_cmds as scraper
+
+
+def make_queue(tmp_path, worker_name, **kwargs):
+    return scraper.WorkQueue(str(tmp_path / "queue.db"), worker_name=worker_name, **kwargs)
+
+
+def test_claim_in_order_and_complete(tmp_path):
+    work_queue = make_queue(tmp_path, "w1")
+    assert work_queue.seed(["alice", "bob", "carol"]) == 3
+    assert work_queue.seed(["bob", "dave"]) == 1 # Already queued users are left alone
+    assert work_queue.claim() == (0, "alice")
+    assert work_queue.claim() == (1, "bob")
+    work_queue.complete("alice", "completed")
+    work_queue.complete("bob", "failed") # Goes back to pending, behind everyone else
+    assert work_queue.claimable_usernames() == ["carol", "dave", "bob"]
+    assert work_queue.status()["states"] == {"done": 1, "pending": 3}
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(tmp_path):
+    crashed_worker = make_queue(tmp_path, "crashed", lease_seconds=0.2)
+    crashed_worker.seed(["alice", "bob"])
+    assert crashed_worker.claim()[1] == "alice"
+    other_worker = make_queue(tmp_path, "other")
+    assert other_worker.claim()[1] == "bob" # alice's lease is still live
+    assert other_worker.claim() is None
+    time.sleep(0.3)
+    assert other_worker.claim()[1] == "alice"
+    crashed_worker.complete("alice", "completed") # Lost lease: the late result is ignored
+    assert other_worker.status()["states"] == {"leased": 2}
+    other_worker.complete("alice", "completed")
+    assert other_worker.status()["states"] == {"leased": 1, "done": 1}
+
+
+def test_renew_keeps_the_lease(tmp_path):
+    worker = make_queue(tmp_path, "w1", lease_seconds=0.3)
+    worker.seed(["alice"]); worker.claim()
+    for _ in range(3): time.sleep(0.15); worker.renew()
+    assert make_queue(tmp_path, "w2").claim() is None
+
+
+def test_max_attempts_and_release(tmp_path):
+    worker = make_queue(tmp_path, "w1", max_attempts=2)
+    worker.seed(["alice"])
+    for _ in range(2): assert worker.claim()[1] == "alice"; worker.complete("alice", "failed")
+    assert worker.claim() is None and worker.status()["states"] == {"failed": 1}
+    assert worker.requeue_failed() == 1
+    assert worker.claim()[1] == "alice"
+    worker.release_leases() # Ctrl+C: back to pending without using up an attempt
+    assert worker.claimable_usernames() == ["alice"]
+
+
+def test_concurrent_claims_never_share_a_user(tmp_path):
+    usernames = [f"user{index}" for index in range(40)]
+    make_queue(tmp_path, "seeder").seed(usernames)
+    claimed = []; claimed_lock = threading.Lock()
+
+    def worker(worker_name):
+        work_queue = make_queue(tmp_path, worker_name)
+        claim = work_queue.claim()
+        while claim is not None:
+            with claimed_lock: claimed.append(claim[1])
+            claim = work_queue.claim()
+    threads = [threading.Thread(target=worker, args=(f"w{index}",)) for index in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert sorted(claimed) == sorted(usernames)
+
+
+def test_work_queue_feed_counts_claims(tmp_path):
+    work_queue = make_queue(tmp_path, "w1")
+    work_queue.seed(["alice", "bob"])
+    work_queue.claim(); work_queue.complete("alice", "failed") # alice now sits behind bob at a higher position
+    feed = scraper.WorkQueueFeed(work_queue)
+    assert feed.get_nowait() == (0, "bob")
+    assert feed.get_nowait() == (1, "alice")
+    assert scraper.user_progress(1, None) == "claim 2"
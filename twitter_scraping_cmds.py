@@ -2,15 +2,33 @@
 # playwright install
 
 from playwright.sync_api import sync_playwright, BrowserContext, Page, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright, BrowserContext as AsyncBrowserContext, Page as AsyncPage, TimeoutError as AsyncPlaywrightTimeoutError
+import asyncio
 import json
 import time
 import os
 import pandas as pd
 import shutil # For rmtree
+from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
+import threading
+import queue
+import collections
+import gzip
+import io
+import sqlite3
+import contextlib
+import contextvars
+import datetime
+import math
+import socket
+import hashlib
+try: import zstandard # Optional: only needed for TWEETS_NDJSON_COMPRESSION = "zstd"
+except ImportError: zstandard = None
 
 # --- CONFIGURATION ---
 USERNAMES_FILE = "usernames.txt"
 PROBLEMATIC_USERNAMES_FILE = "problematic_usernames.txt"
+PROBLEMATIC_USERNAME_TTL_DAYS = None # e.g. 30 to re-check suspended/unavailable accounts after 30 days; None = never
 NUM_POSTS_TO_RETRIEVE = 200
 
 # Local retries within scrape_twitter_info for a single user operation
@@ -24,14 +42,136 @@ GLOBAL_RETRY_DELAY_SECONDS = 300 # Updated from S2 (5 minutes delay for global r
 
 PRIMARY_COLUMN_WAIT_TIMEOUT = 15000 # Max time to wait for primary column selector specifically
 
+# Saved login: the context starts from SESSION_STATE_FILE when present and only logs in if a single authenticated
+# request shows the session is no longer valid. The refreshed cookies are written back when the session closes.
+REUSE_SESSION_STATE = True
+SESSION_STATE_FILE = "state.json"
+# Public bearer token of the X web client, sent with the session check request (cookies carry the account identity).
+# Set the X_WEB_BEARER_TOKEN environment variable when X rotates it.
+X_WEB_BEARER_TOKEN = os.environ.get("X_WEB_BEARER_TOKEN", "AAAAAAAAAAAAAAAAAAAAANRILgAAAAAAnNwIzUejRCOuH5E6I8xnZz4puTs%3D1Zv7ttfk8LF81IUq16cHjhLTvJu4FA33AGWWjCpTnA")
+
+# Concurrency: each worker runs its own browser (sharing the initial login via storage_state) and pulls usernames from a shared queue
+NUM_WORKERS = 1 # 1 = process usernames sequentially, as before
+INTER_USER_DELAY_SECONDS = 10 # Per-worker pause between users (only used when ADAPTIVE_RATE_LIMITING is off)
+
+# Adaptive rate limiting: pace GraphQL-triggering actions from the x-rate-limit-* response headers instead of fixed sleeps
+ADAPTIVE_RATE_LIMITING = True
+RATE_LIMIT_BURST = 5 # Requests per operation that may go out back-to-back before pacing kicks in
+RATE_LIMIT_RESERVE = 1 # Requests left unused per window; at or below this we wait for x-rate-limit-reset
+
+# Multi-account pool: a directory of Playwright storage_state JSON files (one logged-in account each, e.g. a copy of
+# state.json per account). Work goes to the account with the most budget left; a rate-limited account is rotated out
+# until its reset instead of sleeping. None = single X_USERNAME/X_PASSWORD login.
+ACCOUNT_STORAGE_STATES_DIR = None
+SCRAPER_ENGINE = "sync" # "sync" (thread per worker) or "async" (one browser, NUM_WORKERS pages on a single event loop)
+# Direct GraphQL pagination: after the first UserTweets XHR, request the following pages through the context's
+# APIRequestContext (same cookies/headers) by following cursor-bottom, instead of scrolling and waiting for XHRs
+DIRECT_GRAPHQL_PAGINATION = False
+GRAPHQL_RECORD_DIR = None # e.g. "graphql_recordings"; saves every parsed GraphQL page for graphql_replay_server.py
+X_BASE_URL = "https://x.com" # Point at a local graphql_replay_server.py (e.g. "http://127.0.0.1:8765") for offline runs
+
+# GraphQL response cache: usable GraphQL responses are stored on disk under a hash of operation name + variables (user,
+# cursor...) and served locally while younger than the operation's TTL, to the pages via context.route and to direct
+# requests before they are paced or sent. Retries and reruns within the TTL then cost no rate-limit budget. Least
+# recently used entries are evicted once the directory grows past GRAPHQL_CACHE_MAX_MB. A cached first UserTweets page
+# can be up to its TTL old, so with INCREMENTAL_SCRAPING the first page (no cursor) is always fetched fresh.
+GRAPHQL_CACHE_DIR = None # e.g. "graphql_cache"; None = disabled
+GRAPHQL_CACHE_TTL_SECONDS = {"UserByScreenName": 12 * 3600, "UserTweets": 3600} # Operations not listed are never cached
+GRAPHQL_CACHE_MAX_MB = 512
+
+# Run journal: per-user progress is appended to this file so an interrupted run resumes where it stopped.
+# It is archived as <file>.<timestamp> once every user is finished, so the next run starts fresh.
+RUN_JOURNAL_FILE = "run_journal.jsonl"
+RESUME_FROM_JOURNAL = True
+
+# Distributed mode: scraper processes on this host claim users from one SQLite work queue instead of each walking
+# usernames.txt. Single host only: the queue (like TWEET_STORE_DB) uses SQLite WAL mode, which needs shared memory and
+# reliable file locks, so the database must be on a local disk, never on NFS/SMB or another network filesystem. A claimed user is leased for WORK_QUEUE_LEASE_SECONDS and the lease is
+# renewed every WORK_QUEUE_HEARTBEAT_SECONDS while the process lives; the lease of a dead worker expires and the user is
+# handed to the next claim. A user claimed WORK_QUEUE_MAX_ATTEMPTS times without finishing is marked failed. The run
+# journal is not used in this mode (the queue replaces it); see scrape_coordinator.py to seed and inspect the queue.
+WORK_QUEUE_DB = None # e.g. "work_queue.sqlite"; None = single-process mode
+WORK_QUEUE_LEASE_SECONDS = 900
+WORK_QUEUE_HEARTBEAT_SECONDS = 60
+WORK_QUEUE_MAX_ATTEMPTS = 3
+
+# Incremental mode: remember the newest tweet id per user, stop paginating once known tweets are reached, and merge new tweets into the stored file
+INCREMENTAL_SCRAPING = False
+
+# Account pre-check: before the timeline scrape, a user's status is resolved from a single UserByScreenName request
+# sent through the context's APIRequestContext, built from the UserByScreenName XHR of an earlier profile visit of the
+# same account (so the first user per account is not pre-checked). Suspended and nonexistent accounts go straight to
+# PROBLEMATIC_USERNAMES_FILE, protected accounts and accounts without posts only get their profile saved, and only live,
+# public accounts are scrolled. A status is reused for ACCOUNT_PRECHECK_MAX_AGE_HOURS. Off by default: it costs one extra
+# UserByScreenName request per user, which only pays off when usernames.txt has many dead or protected handles.
+ACCOUNT_PRECHECK = False
+ACCOUNT_PRECHECK_MAX_AGE_HOURS = 24
+
+# Priority scheduling: users are refreshed when they are due instead of all of usernames.txt in file order. A user's
+# refresh interval is the time they take to post SCHEDULE_TARGET_NEW_TWEETS tweets at their observed posting rate (from
+# legacy.created_at of the stored tweets), shortened for large follower counts, clamped to [SCHEDULE_MIN_INTERVAL_HOURS,
+# SCHEDULE_MAX_INTERVAL_HOURS] and doubled per consecutive failure. Never-scraped users go first, then the most overdue.
+# SCHEDULE_MAX_USERS_PER_RUN caps a run to a fixed request budget (None = every due user).
+PRIORITY_SCHEDULING = False # True: users refreshed within their interval are skipped, so a plain rerun may scrape nobody
+SCHEDULE_TARGET_NEW_TWEETS = 20
+SCHEDULE_MIN_INTERVAL_HOURS = 6
+SCHEDULE_MAX_INTERVAL_HOURS = 24 * 30
+SCHEDULE_MAX_USERS_PER_RUN = None
+
+# Tweet output: True = each new tweet is appended to <user>_last_200_tweets.ndjson (one JSON object per line) as it is
+# parsed, so tweets already fetched survive a late failure. This changes the output file name and format for consumers
+# of the default indented <user>_last_200_tweets.json written at the end (False).
+STREAM_TWEETS_NDJSON = False
+TWEETS_NDJSON_COMPRESSION = None # None, "gzip" (.ndjson.gz) or "zstd" (.ndjson.zst, needs `pip install zstandard`)
+
+# Normalized store: every saved tweet/profile is also upserted into one SQLite database keyed on rest_id, so cross-user
+# queries and reruns need neither directory globbing nor JSON re-parsing. None = per-user files only.
+TWEET_STORE_DB = None # e.g. "tweets.sqlite"
+TWEET_STORE_KEEP_RAW = False # Also keep each raw GraphQL object as a JSON text column
+TWEET_STORE_BATCH_SIZE = 500 # Rows per executemany batch
+
+# Browser/bandwidth: the scraper only reads GraphQL JSON, so heavy page assets can be aborted via context.route
+HEADLESS = True
+BLOCK_HEAVY_RESOURCES = True
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+BLOCKED_URL_SUBSTRINGS = ("/1.1/jot/", "/i/api/1.1/jot", "google-analytics.com", "googletagmanager.com", "ads-twitter.com", "analytics.twitter.com", "/i/csp_report")
+# Aborted requests never report a size, so savings are estimated per blocked request
+BLOCKED_RESOURCE_ESTIMATED_BYTES = {"image": 40000, "media": 500000, "font": 60000, "stylesheet": 30000, "analytics": 1500}
+
+COMBINED_PAGE_VISIT = True # Take the profile from the UserByScreenName XHR fired during the tweets visit; a separate profile pass only runs if it is missing
+# Adaptive scrolling: after a scroll the loop returns as soon as the next UserTweets response lands. If no UserTweets
+# request is even in flight, it scrolls again after SCROLL_WAIT_MIN_MS, doubling up to SCROLL_WAIT_MAX_MS per empty
+# scroll. The timeline ends at the first page without a new cursor-bottom; MAX_EMPTY_SCROLLS only guards a stalled page.
+SCROLL_WAIT_MIN_MS = 1000
+SCROLL_WAIT_MAX_MS = 8000
+XHR_RESPONSE_TIMEOUT_MS = 15000 # Longest wait for a UserTweets request that is already in flight
+MAX_EMPTY_SCROLLS = 6
+XHR_QUEUE_MAX_SIZE = 32 # Captured GraphQL responses waiting to be parsed per page; beyond it other XHRs are dropped (counted as xhr_dropped), UserTweets pages never
+
+# Browser lifecycle: pages are parked on about:blank and reused for the next operation instead of being closed and
+# recreated; a crashed page, context or browser is replaced on its own (no re-login), and each context is recycled
+# after CONTEXT_RECYCLE_USERS users to bound Chromium's memory growth. None = never recycle.
+REUSE_PAGES = True
+CONTEXT_RECYCLE_USERS = 50
+
+# Metrics: per-phase timers (navigation, primaryColumn, scroll waits, XHR reads, rate-limit/retry sleeps, disk writes...)
+# and counters (429s, GraphQL responses, tweets, retries). Every finished user is logged as one JSON line, the run ends
+# with a summary, and METRICS_PROMETHEUS_FILE is rewritten in Prometheus text format after every user (e.g. for
+# node_exporter's textfile collector). None disables either file.
+METRICS_LOG_FILE = "scrape_metrics.jsonl"
+METRICS_PROMETHEUS_FILE = "scrape_metrics.prom"
+
 # --- X.COM LOGIN CREDENTIALS (IMPORTANT: Replace with your actual credentials) ---
 X_USERNAME = "Replace with your X username/email/phone"  # Replace with your X username/email/phone
 X_PASSWORD = "Replace with your X password"  # Replace with your X password
 # --- END CONFIGURATION ---
 
+RATE_LIMIT_TEXT_MARKERS = ("rate limit", "too many requests", "temporarily locked")
+
 class RateLimitException(Exception):
-    """Custom exception for rate limit errors."""
-    pass
+    """Custom exception for rate limit errors. operation is the GraphQL operation that was limited, when known."""
+    def __init__(self, message, operation=None):
+        super().__init__(message); self.operation = operation
 
 class AccountUnavailableException(Exception):
     """Custom exception for account unavailable/suspended/non-existent issues."""
@@ -44,7 +184,7 @@ def login_to_x(page: Page):
         return False
     print("Attempting to log in to X.com...")
     try:
-        page.goto("https://x.com/login", timeout=60000, wait_until="domcontentloaded")
+        page.goto(f"{X_BASE_URL}/login", timeout=60000, wait_until="domcontentloaded")
         time.sleep(3) # Increased sleep after goto
         username_input_selector = "//input[@name='text']"
         page.wait_for_selector(username_input_selector, timeout=30000)
@@ -87,343 +227,2437 @@ def login_to_x(page: Page):
     except PlaywrightTimeoutError as pte: print(f"Timeout during login: {pte}"); return False
     except Exception as e: print(f"Error during login: {e}"); return False
 
-def check_page_for_account_issues(page: Page):
-    suspended_texts = ["Account suspended", "This account is suspended"]
-    non_existent_texts = ["This account doesn’t exist", "Hmm...this page doesn’t exist.", "Profile not found", "These posts aren't available", "This profile is not available"]
-    page.wait_for_timeout(1500) # Allow content to settle
-    page_content_lower = ""
+def session_state_is_valid(context: BrowserContext):
+    """Checks the context's cookies with one authenticated account/settings request instead of loading x.com/home."""
+    cookies = {cookie["name"]: cookie["value"] for cookie in context.cookies()}
+    if "auth_token" not in cookies: return False
     try:
-        body_element = page.locator("body")
-        if body_element.count() > 0: # Ensure body exists
-            body_text = body_element.inner_text(timeout=5000) # Wait up to 5s for text
-            page_content_lower = body_text.lower()
-        else:
-            print("Note: Body element not found for status check. Using full page content.")
-            page_content_lower = page.content().lower() # Fallback
-    except Exception as e:
-        print(f"Note: Could not get body text for status check: {e}. Will use full page content.")
-        try:
-            page_content_lower = page.content().lower()
-        except Exception as e_content:
-            print(f"Critical: Could not get any page content for status check: {e_content}")
-            return # Cannot determine, so don't raise an exception based on this
+        response = context.request.get(f"{X_BASE_URL}/i/api/1.1/account/settings.json", timeout=15000,
+                                       headers={"authorization": f"Bearer {X_WEB_BEARER_TOKEN}", "x-csrf-token": cookies.get("ct0", "")})
+    except Exception as e_check: print(f"Saved session check failed: {e_check}"); return False
+    if response.status == 429: return True # Authenticated but throttled; the scraper's own rate limiting takes over
+    return response.ok
+
+def save_session_state(context: BrowserContext, filename=None):
+    """Writes the context's cookies and local storage to filename (default SESSION_STATE_FILE) atomically (tmp file + os.replace)."""
+    filename = filename or SESSION_STATE_FILE
+    tmp_filename = f"{filename}.tmp"
+    try:
+        with open(tmp_filename, "w", encoding="utf-8") as f: json.dump(context.storage_state(), f, indent=4)
+        os.replace(tmp_filename, filename)
+    except Exception as e_save: print(f"Could not save session state to {filename}: {e_save}")
 
-    for text in suspended_texts:
+ACCOUNT_SUSPENDED_TEXTS = ["Account suspended", "This account is suspended"]
+ACCOUNT_NON_EXISTENT_TEXTS = ["This account doesn’t exist", "Hmm...this page doesn’t exist.", "Profile not found", "These posts aren't available", "This profile is not available"]
+
+def raise_for_account_issues(page_content_lower, current_url):
+    """Raises AccountUnavailableException if the page text or URL shows a suspended/non-existent account."""
+    for text in ACCOUNT_SUSPENDED_TEXTS:
         if text.lower() in page_content_lower:
             raise AccountUnavailableException(f"Account Issue (Text Match): '{text}'")
-    for text in non_existent_texts:
+    for text in ACCOUNT_NON_EXISTENT_TEXTS:
         if text.lower() in page_content_lower:
             raise AccountUnavailableException(f"Account Issue (Text Match): '{text}'")
 
-    current_url = page.url
     if "/i/unavailable" in current_url or "/i/suspend" in current_url or "/notifications/restricted" in current_url:
         raise AccountUnavailableException(f"Account Issue (URL Pattern): {current_url}")
 
-def scrape_twitter_info(context: BrowserContext, url: str, scrape_tweets_mode: bool, timeout_seconds=120):
-    _xhr_calls = []
+ACCOUNT_CHECK_TEXT_JS = "() => document.body ? document.body.innerText : document.documentElement.outerHTML" # Body text, else the raw page
+
+def check_page_for_account_issues(page: Page):
+    with metrics.phase("account_check"): page.wait_for_timeout(1500) # Allow content to settle
+    try: page_content_lower = page.evaluate(ACCOUNT_CHECK_TEXT_JS).lower()
+    except Exception as e_content:
+        print(f"Critical: Could not get any page content for status check: {e_content}")
+        return # Cannot determine, so don't raise an exception based on this
+    raise_for_account_issues(page_content_lower, page.url)
+
+def is_rate_limit_text(response_text):
+    return bool(response_text) and any(marker in response_text.lower() for marker in RATE_LIMIT_TEXT_MARKERS)
+
+def extract_timeline_instructions(json_response):
+    user_data_tree = json_response.get("data", {}).get("user", {}).get("result", {})
+    tl_v1 = user_data_tree.get("timeline", {}).get("timeline", {}); tl_v2 = user_data_tree.get("timeline_v2", {}).get("timeline", {})
+    if tl_v1 and "instructions" in tl_v1: return tl_v1.get("instructions", [])
+    elif tl_v2 and "instructions" in tl_v2: return tl_v2.get("instructions", [])
+    return []
+
+def extract_tweets_from_user_tweets_json(json_response):
+    """Returns the tweet objects of a UserTweets GraphQL payload in timeline order (TweetWithVisibilityResults unwrapped)."""
+    tweets = []
+    for instruction in extract_timeline_instructions(json_response):
+        if instruction.get("type") == "TimelineAddEntries":
+            for entry in instruction.get("entries", []):
+                content = entry.get("content", {}); item_content = content.get("itemContent", {})
+                if content.get("entryType") == "TimelineTimelineItem" and item_content.get("itemType") == "TimelineTweet":
+                    tweet_res_cont = item_content.get("tweet_results", {}); tweet_res = tweet_res_cont.get("result", {})
+                    actual_data = None
+                    if tweet_res.get("__typename") == "TweetWithVisibilityResults": actual_data = tweet_res.get("tweet")
+                    elif tweet_res.get("__typename") == "Tweet": actual_data = tweet_res
+                    if actual_data and "rest_id" in actual_data: tweets.append(actual_data)
+    return tweets
+
+def extract_bottom_cursor(json_response):
+    """Returns the cursor-bottom value of a UserTweets payload, or None at the end of the timeline."""
+    for instruction in extract_timeline_instructions(json_response):
+        if instruction.get("type") == "TimelineAddEntries": entries = instruction.get("entries", [])
+        elif instruction.get("type") == "TimelineReplaceEntry": entries = [instruction.get("entry", {})]
+        else: continue
+        for entry in entries:
+            content = entry.get("content", {})
+            if content.get("cursorType") == "Bottom" or entry.get("entryId", "").startswith("cursor-bottom"):
+                return content.get("value")
+    return None
+
+def is_last_timeline_page(json_response, previous_cursor=None):
+    """True if a UserTweets page ends the timeline: no cursor-bottom, the same cursor-bottom as the previous page, or nothing but cursor entries."""
+    cursor = extract_bottom_cursor(json_response)
+    if cursor is None or cursor == previous_cursor: return True
+    for instruction in extract_timeline_instructions(json_response):
+        if instruction.get("type") != "TimelineAddEntries": continue
+        if any(entry.get("content", {}).get("entryType") != "TimelineTimelineCursor" and not entry.get("entryId", "").startswith("cursor-") for entry in instruction.get("entries", [])): return False
+    return True
+
+def scroll_wait_ms(empty_scrolls):
+    """How long to wait for a scroll to start a UserTweets request: SCROLL_WAIT_MIN_MS, doubled per empty scroll so far."""
+    return min(SCROLL_WAIT_MAX_MS, SCROLL_WAIT_MIN_MS * 2 ** empty_scrolls)
+
+def add_new_tweets(json_response, tweets, found_ids, url, since_tweet_id=None):
+    """Appends the not-yet-seen tweets of a UserTweets payload to tweets (up to NUM_POSTS_TO_RETRIEVE), skipping ids at or
+    below since_tweet_id, and streams them to the tweet sink open for url. Returns how many were added."""
+    added = 0; sink = _tweet_sinks.get(url)
+    for actual_data in extract_tweets_from_user_tweets_json(json_response):
+        if len(tweets) >= NUM_POSTS_TO_RETRIEVE: break
+        tweet_id = actual_data["rest_id"]
+        if since_tweet_id and int(tweet_id) <= int(since_tweet_id): continue
+        if tweet_id not in found_ids:
+            tweets.append(actual_data); found_ids.add(tweet_id); added += 1
+            if sink: sink.write(actual_data)
+            if len(tweets) % 20 == 0: print(f"Retrieved {len(tweets)} tweets for {url}...")
+    if sink and added: sink.flush()
+    if added: metrics.count("tweets_collected", added)
+    return added
+
+def reached_known_tweets(json_response, since_tweet_id):
+    """True if a UserTweets page contains a tweet at or below the stored high-water mark (pinned tweets are a separate instruction and never match)."""
+    return bool(since_tweet_id) and any(int(tweet["rest_id"]) <= int(since_tweet_id) for tweet in extract_tweets_from_user_tweets_json(json_response))
+
+def replace_graphql_variables(request_url, **updates):
+    """Returns a captured GraphQL request_url with the given variables replaced; features/fieldToggles are kept as captured."""
+    parsed = urlparse(request_url); query = parse_qs(parsed.query, keep_blank_values=True)
+    variables = json.loads(query.get("variables", ["{}"])[0]); variables.update(updates)
+    query["variables"] = [json.dumps(variables, separators=(",", ":"))]
+    return urlunparse(parsed._replace(query=urlencode(query, doseq=True)))
+
+def build_user_tweets_page_url(request_url, cursor):
+    return replace_graphql_variables(request_url, cursor=cursor)
+
+def build_user_by_screen_name_url(request_url, screen_name):
+    return replace_graphql_variables(request_url, screen_name=screen_name)
+
+def account_status_from_user_by_screen_name(json_response):
+    """"available", "protected", "no_tweets", "suspended" or "not_found" for a UserByScreenName payload, or None when it
+    is unusable. Only an explicit UserUnavailable result, or error 63 (suspended) / 50 (not found) without a user result,
+    counts as a dead account, so a transient or partial GraphQL error never marks an account problematic."""
+    if not isinstance(json_response, dict) or not isinstance(json_response.get("data"), dict): return None
+    error_codes = {error.get("code") for error in json_response.get("errors") or [] if isinstance(error, dict)}
+    result = (json_response["data"].get("user") or {}).get("result") or {}
+    if result.get("__typename") == "UserUnavailable": return "suspended" if "suspend" in str(result.get("reason", "")).lower() else "not_found"
+    if not result:
+        if 63 in error_codes: return "suspended"
+        if 50 in error_codes: return "not_found"
+        return None
+    if json_response.get("errors") or result.get("__typename", "User") != "User" or not result.get("rest_id"): return None
+    legacy = result.get("legacy") or {}
+    if legacy.get("protected") or (result.get("privacy") or {}).get("protected"): return "protected"
+    if legacy.get("statuses_count") == 0: return "no_tweets"
+    return "available"
+
+def graphql_api_headers(request_headers):
+    # Cookies come from the context's own jar; pseudo/hop headers are recomputed by the request
+    return {k: v for k, v in request_headers.items() if not k.startswith(":") and k.lower() not in ("cookie", "content-length", "host", "accept-encoding")}
+
+def record_graphql_page(operation, request_url, url, json_response):
+    """Saves a parsed GraphQL page under GRAPHQL_RECORD_DIR/<screen_name>/ for offline replay. No-op unless configured."""
+    if not GRAPHQL_RECORD_DIR or not json_response: return
+    screen_name = url.rstrip('/').rsplit('/', 1)[-1]
+    variables = json.loads(parse_qs(urlparse(request_url).query).get("variables", ["{}"])[0])
+    record_dir = os.path.join(GRAPHQL_RECORD_DIR, screen_name); os.makedirs(record_dir, exist_ok=True)
+    record_filename = os.path.join(record_dir, f"{operation}_{time.time_ns()}.json")
+    with open(record_filename, "w", encoding="utf-8") as f:
+        json.dump({"operation": operation, "screen_name": screen_name, "variables": variables, "response": json_response}, f, ensure_ascii=False)
+
+def extract_profile_from_user_by_screen_name_json(json_response):
+    """Returns the user result of a UserByScreenName GraphQL payload, or None if it carries no usable profile."""
+    potential_user_data = json_response.get('data', {}).get('user', {}).get('result', {})
+    if potential_user_data.get('rest_id') and 'errors' not in json_response and potential_user_data.get('legacy'):
+        return potential_user_data
+    return None
+
+def graphql_operation_name(request_url):
+    """"https://x.com/i/api/graphql/<id>/UserTweets?..." -> "UserTweets"."""
+    return urlparse(request_url).path.rstrip("/").rsplit("/", 1)[-1]
+
+GRAPHQL_CACHE_STALE_TEMP_SECONDS = 3600
+GRAPHQL_CACHE_HIT_HEADERS = {"content-type": "application/json; charset=utf-8", "x-scraper-cache": "hit"}
+
+class GraphQLResponseCache:
+    """On-disk GraphQL response cache. An entry is <operation>-<sha256 of operation + canonical variables>.json.gz holding
+    the response text and when it was stored; features/fieldToggles are not part of the key, screen names are
+    case-insensitive. File mtime is when the entry was stored (expiry) and atime its last use, set explicitly on every hit
+    (LRU eviction). Entries are written through a temporary file and os.replace, so worker threads and processes can
+    share one directory; temporary files orphaned by an interrupted write are swept when the directory is scanned."""
+    def __init__(self, cache_dir, ttl_seconds, max_bytes):
+        self.cache_dir = cache_dir; self.ttl_seconds = dict(ttl_seconds); self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._total_bytes = None # Estimated size of the directory, from a scan on first store
+
+    def entry_filename(self, request_url):
+        """Cache file for a GraphQL request URL, or None if its operation is not cached."""
+        operation = graphql_operation_name(request_url)
+        if operation not in self.ttl_seconds: return None
+        try: variables = json.loads(parse_qs(urlparse(request_url).query).get("variables", ["{}"])[0])
+        except json.JSONDecodeError: return None
+        if isinstance(variables.get("screen_name"), str): variables["screen_name"] = variables["screen_name"].lower()
+        if INCREMENTAL_SCRAPING and operation == "UserTweets" and not variables.get("cursor"): return None # Newest tweets must be fresh
+        key = json.dumps([operation, variables], sort_keys=True, separators=(",", ":"))
+        return os.path.join(self.cache_dir, f"{operation}-{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json.gz")
+
+    def get(self, request_url):
+        """The cached response text for request_url, or None if absent or older than its operation's TTL."""
+        entry_filename = self.entry_filename(request_url)
+        if entry_filename is None: return None
+        operation = graphql_operation_name(request_url)
+        try:
+            with gzip.open(entry_filename, "rt", encoding="utf-8") as f: entry = json.load(f)
+            if time.time() - entry["stored_at"] > self.ttl_seconds[operation]: self._remove(entry_filename); entry = None
+        except (OSError, ValueError, KeyError, EOFError): entry = None # Missing, or truncated by a crash
+        if entry is None: metrics.count("graphql_cache_misses", operation=operation); return None
+        try: os.utime(entry_filename, (time.time(), os.path.getmtime(entry_filename))) # Most recently used; mtime stays the store time
+        except OSError: pass
+        metrics.count("graphql_cache_hits", operation=operation)
+        return entry["body"]
+
+    def put(self, request_url, response_text, json_response):
+        """Stores a parsed response unless its operation is not cached or it carries errors instead of data."""
+        entry_filename = self.entry_filename(request_url)
+        if entry_filename is None or not isinstance(json_response, dict) or not json_response.get("data") or json_response.get("errors"): return
+        temp_filename = f"{entry_filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try: replaced_bytes = os.path.getsize(entry_filename) # Refreshing an entry replaces its old copy
+        except OSError: replaced_bytes = 0
+        try:
+            with gzip.open(temp_filename, "wt", encoding="utf-8") as f: json.dump({"url": request_url, "stored_at": time.time(), "body": response_text}, f, ensure_ascii=False)
+            os.replace(temp_filename, entry_filename); entry_bytes = os.path.getsize(entry_filename)
+        except OSError as e_cache: print(f"Could not write GraphQL cache entry {entry_filename}: {e_cache}"); return
+        with self._lock:
+            if self._total_bytes is None: self._total_bytes = self._scan()[1]
+            else: self._total_bytes += entry_bytes - replaced_bytes
+            if self._total_bytes > self.max_bytes: self._evict()
+
+    def _remove(self, entry_filename):
+        """Deletes one entry and takes its size off the running total."""
+        try: entry_bytes = os.path.getsize(entry_filename); os.remove(entry_filename)
+        except OSError: return # Already removed by another worker
+        with self._lock:
+            if self._total_bytes is not None: self._total_bytes = max(0, self._total_bytes - entry_bytes)
+
+    def _scan(self):
+        """([(last_used, size, path)] of live entries, their total size); expired entries and temporary files left by
+        interrupted writes (older than GRAPHQL_CACHE_STALE_TEMP_SECONDS) are removed on the way."""
+        entries = []; now = time.time()
+        for dir_entry in os.scandir(self.cache_dir):
+            try: stat = dir_entry.stat()
+            except OSError: continue # Evicted by another process
+            if dir_entry.name.endswith(".tmp"): max_age = GRAPHQL_CACHE_STALE_TEMP_SECONDS
+            elif dir_entry.name.endswith(".json.gz"): max_age = self.ttl_seconds.get(dir_entry.name.split("-", 1)[0], 0)
+            else: continue
+            if now - stat.st_mtime > max_age:
+                with contextlib.suppress(OSError): os.remove(dir_entry.path)
+                continue
+            if dir_entry.name.endswith(".tmp"): continue # Being written by another worker
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, dir_entry.path))
+        return entries, sum(size for _, size, _ in entries)
+
+    def _evict(self):
+        """Removes least recently used entries until the directory is at 90% of max_bytes. Caller holds _lock."""
+        entries, self._total_bytes = self._scan(); evicted = 0
+        for _, size, path in sorted(entries):
+            if self._total_bytes <= self.max_bytes * 0.9: break
+            with contextlib.suppress(OSError): os.remove(path); evicted += 1
+            self._total_bytes -= size
+        if evicted: metrics.count("graphql_cache_evictions", evicted)
+
+    def handle_route(self, route):
+        """context.route handler for GraphQL XHRs: fulfills fresh cache hits, hands everything else to the next route."""
+        body = self.get(route.request.url) if route.request.method == "GET" else None
+        if body is None: return route.fallback()
+        route.fulfill(status=200, headers=GRAPHQL_CACHE_HIT_HEADERS, body=body)
+
+    async def async_handle_route(self, route):
+        body = self.get(route.request.url) if route.request.method == "GET" else None
+        if body is None: return await route.fallback()
+        await route.fulfill(status=200, headers=GRAPHQL_CACHE_HIT_HEADERS, body=body)
+
+_graphql_cache = None
+_graphql_cache_lock = threading.Lock()
+
+def graphql_cache():
+    """The GraphQLResponseCache for GRAPHQL_CACHE_DIR, opened on first use; None when the cache is disabled."""
+    global _graphql_cache
+    if not GRAPHQL_CACHE_DIR: return None
+    with _graphql_cache_lock:
+        if _graphql_cache is None: _graphql_cache = GraphQLResponseCache(GRAPHQL_CACHE_DIR, GRAPHQL_CACHE_TTL_SECONDS, GRAPHQL_CACHE_MAX_MB * 2 ** 20)
+        return _graphql_cache
+
+def cache_graphql_response(xhr, response_text, json_response):
+    """Stores a GraphQL response read by read_graphql_json, unless the cache itself served it."""
+    cache = graphql_cache()
+    if cache and xhr.headers.get("x-scraper-cache") != "hit": cache.put(xhr.url, response_text, json_response)
+
+class RateLimitScheduler:
+    """Token-bucket pacing per GraphQL operation, driven by x-rate-limit-limit/-remaining/-reset response headers.
+
+    The remaining budget is spread evenly over the time left until reset (GCRA with RATE_LIMIT_BURST of slack), so
+    workers sharing one account slow down before X starts answering 429. When the budget is exhausted, or a 429 did
+    happen, callers sleep exactly until the advertised reset. Operations without headers yet are not paced."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits = {} # operation -> {"limit": int, "remaining": int, "reset": epoch}
+        self._theoretical_arrival = {} # operation -> GCRA theoretical arrival time
+
+    def update_from_headers(self, request_url, headers):
+        try:
+            remaining = headers.get("x-rate-limit-remaining"); reset = headers.get("x-rate-limit-reset")
+            if remaining is None or reset is None: return
+            limit = headers.get("x-rate-limit-limit")
+            with self._lock:
+                self._limits[graphql_operation_name(request_url)] = {"limit": int(limit) if limit else None, "remaining": int(remaining), "reset": float(reset)}
+        except (AttributeError, TypeError, ValueError): pass # Malformed headers: keep the previous budget
+
+    def _reserve(self, operation, now):
+        """Returns how long the caller must wait before issuing one request for operation, and books that slot."""
+        info = self._limits.get(operation)
+        if not info or info["reset"] <= now: return 0.0
+        if info["remaining"] <= RATE_LIMIT_RESERVE: return info["reset"] - now + 1
+        interval = (info["reset"] - now) / info["remaining"]
+        arrival = max(self._theoretical_arrival.get(operation, now), now)
+        wait = max(0.0, arrival - RATE_LIMIT_BURST * interval - now)
+        self._theoretical_arrival[operation] = arrival + interval
+        info["remaining"] -= 1 # Optimistic until the next response header corrects it
+        return wait
+
+    def delay_for(self, *operations):
+        if not ADAPTIVE_RATE_LIMITING: return 0.0
+        now = time.time()
+        with self._lock: return max([self._reserve(operation, now) for operation in operations] or [0.0])
+
+    def acquire(self, *operations):
+        delay = self.delay_for(*operations)
+        if delay > 0:
+            print(f"Rate-limit pacing: waiting {delay:.1f}s for {'/'.join(operations)} ({self.describe()})")
+            with metrics.phase("rate_limit_wait"): time.sleep(delay)
+
+    async def async_acquire(self, *operations):
+        delay = self.delay_for(*operations)
+        if delay > 0:
+            print(f"Rate-limit pacing: waiting {delay:.1f}s for {'/'.join(operations)} ({self.describe()})")
+            with metrics.phase("rate_limit_wait"): await asyncio.sleep(delay)
+
+    def budget_fraction(self):
+        """Smallest remaining/limit ratio across known operations (1.0 when nothing is known yet)."""
+        now = time.time()
+        with self._lock:
+            fractions = [info["remaining"] / info["limit"] for info in self._limits.values() if info["limit"] and info["reset"] > now]
+        return min(fractions) if fractions else 1.0
+
+    def seconds_until_reset(self, *operations):
+        """Seconds until the exhausted budget (of the given operations, or any) resets, or None if unknown."""
+        now = time.time()
+        with self._lock:
+            resets = [info["reset"] for operation, info in self._limits.items()
+                      if (not operations or operation in operations) and info["remaining"] <= RATE_LIMIT_RESERVE and info["reset"] > now]
+        return max(resets) - now + 1 if resets else None
+
+    def snapshot(self):
+        """Current budget per operation: {operation: {"limit", "remaining", "reset_in_seconds"}}."""
+        now = time.time()
+        with self._lock:
+            return {operation: {"limit": info["limit"], "remaining": info["remaining"], "reset_in_seconds": max(0.0, info["reset"] - now)}
+                    for operation, info in self._limits.items()}
+
+    def describe(self):
+        return ", ".join(f"{operation} {budget['remaining']}/{budget['limit'] or '?'} reset in {budget['reset_in_seconds']:.0f}s"
+                         for operation, budget in sorted(self.snapshot().items())) or "no budget data yet"
+
+rate_limiter = RateLimitScheduler() # Budget of the single logged-in account; pooled accounts each carry their own
+
+class AccountPool:
+    """Logged-in accounts loaded from ACCOUNT_STORAGE_STATES_DIR, each with its own RateLimitScheduler. Rate limits are
+    per account, so a 429 on one account puts only that account into cooldown until its reset."""
+    def __init__(self, storage_state_paths):
+        self._lock = threading.Lock()
+        self.accounts = [{"name": os.path.splitext(os.path.basename(path))[0], "storage_state": path, "rate_limiter": RateLimitScheduler(),
+                          "cooldown_until": 0.0, "assigned": 0} for path in sorted(storage_state_paths)]
+
+    @classmethod
+    def from_dir(cls, storage_states_dir):
+        paths = [os.path.join(storage_states_dir, name) for name in os.listdir(storage_states_dir) if name.endswith(".json")]
+        if not paths: raise ValueError(f"No storage_state .json files found in {storage_states_dir}")
+        return cls(paths)
+
+    def pick(self, exclude=(), allow_cooling=False):
+        """Returns the account with the most budget left (fewest assignments on ties), skipping excluded names and
+        accounts in cooldown. With allow_cooling, falls back to the account whose cooldown ends first. None if none fit."""
+        now = time.time()
+        with self._lock:
+            candidates = [account for account in self.accounts if account["name"] not in exclude]
+            ready = [account for account in candidates if account["cooldown_until"] <= now]
+            if ready: account = max(ready, key=lambda account: (account["rate_limiter"].budget_fraction(), -account["assigned"]))
+            elif allow_cooling and candidates: account = min(candidates, key=lambda account: account["cooldown_until"])
+            else: return None
+            account["assigned"] += 1
+            return account
+
+    def mark_rate_limited(self, account):
+        cooldown = account["rate_limiter"].seconds_until_reset() or GLOBAL_RETRY_DELAY_SECONDS
+        with self._lock: account["cooldown_until"] = max(account["cooldown_until"], time.time() + cooldown)
+        print(f"Account '{account['name']}' rate limited; cooling down for {cooldown:.0f}s.")
+
+    def seconds_until_available(self):
+        now = time.time()
+        with self._lock: return max(0.0, min(account["cooldown_until"] for account in self.accounts) - now)
+
+    def describe(self):
+        now = time.time()
+        return "; ".join(f"{account['name']}: {account['rate_limiter'].describe()}" + (f" (cooling {account['cooldown_until'] - now:.0f}s)" if account["cooldown_until"] > now else "")
+                         for account in self.accounts)
+
+_context_accounts = {} # id(context) -> pooled account the context was created for
+_account_pool = None # Set by main() when ACCOUNT_STORAGE_STATES_DIR is configured
+
+def register_context_account(context, account):
+    if account: _context_accounts[id(context)] = account
+
+def unregister_context_account(context):
+    _context_accounts.pop(id(context), None)
+
+def rate_limiter_for(context):
+    account = _context_accounts.get(id(context))
+    return account["rate_limiter"] if account else rate_limiter
+
+def can_rotate_account(context, account_pool):
+    """True if a pooled account other than the context's own is ready, so a 429 should escalate instead of sleeping."""
+    account = _context_accounts.get(id(context))
+    if not account or not account_pool: return False
+    with account_pool._lock:
+        return any(other["name"] != account["name"] and other["cooldown_until"] <= time.time() for other in account_pool.accounts)
+
+def rate_limit_retry_delay(local_retries, limiter=None, *, operations=()):
+    """Local-retry pause after a 429: exactly until the advertised reset of operations (any, if empty) when known, else the fixed backoff."""
+    reset_delay = (limiter or rate_limiter).seconds_until_reset(*operations) if ADAPTIVE_RATE_LIMITING else None
+    if reset_delay is not None: return reset_delay
+    delay = LOCAL_OPERATION_RETRY_BASE_DELAY_SECONDS
+    if local_retries > 1 : # Apply increment for 2nd, 3rd... local retries
+        delay += (local_retries - 1) * LOCAL_OPERATION_RETRY_INCREMENT_SECONDS
+    return delay
+
+def parse_graphql_response(xhr, response_text, label="XHR", limiter=None):
+    """Parses a GraphQL response (a captured XHR or an APIResponse of either Playwright API) whose body the caller
+    already read; response_text is None if that failed. Raises RateLimitException on 429 or rate-limit text; returns
+    None for anything unusable."""
+    (limiter or rate_limiter).update_from_headers(xhr.url, xhr.headers); operation = graphql_operation_name(xhr.url)
+    metrics.count("graphql_responses", operation=operation)
+    if not xhr.ok:
+        if xhr.status == 429: metrics.count("http_429", operation=operation); raise RateLimitException(f"Status 429 on {label} {xhr.url}", operation)
+        print(f"{label} not OK: {xhr.status} for {xhr.url}. Text: {(response_text or '(Could not get text)')[:100]}."); return None
+    if response_text is None: print(f"{label} body could not be read for {xhr.url}."); return None
+    content_type = xhr.headers.get('content-type', '').lower()
+    if 'application/json' not in content_type:
+        if is_rate_limit_text(response_text): metrics.count("rate_limit_text", operation=operation); raise RateLimitException(f"Rate limit text in non-JSON {label} {xhr.url}. Text: {response_text[:100]}", operation)
+        print(f"{label} not JSON: {content_type} for {xhr.url}. Text: {response_text[:100]}."); return None
+    if not response_text: print(f"{label} empty for {xhr.url}."); return None
+    try: json_response = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        if is_rate_limit_text(response_text): metrics.count("rate_limit_text", operation=operation); raise RateLimitException(f"Rate limit (JSON decode text match) {label} {xhr.url}. Err: {e}. Text: {response_text[:100]}", operation)
+        print(f"Non-RL JSONErr {label} {xhr.url}: {e}. Text: {response_text[:100]}."); return None
+    cache_graphql_response(xhr, response_text, json_response)
+    return json_response
+
+def read_graphql_json(xhr, label="XHR", limiter=None):
+    """Reads and parses a GraphQL response with parse_graphql_response."""
+    with metrics.phase("xhr_read"):
+        try: response_text = xhr.text()
+        except Exception: response_text = None
+        return parse_graphql_response(xhr, response_text, label, limiter)
+
+def profile_from_json(xhr_url, url, json_response):
+    """Records one UserByScreenName response of url and returns its profile, or None if it has none."""
+    record_graphql_page("UserByScreenName", xhr_url, url, json_response)
+    return extract_profile_from_user_by_screen_name_json(json_response) if json_response else None
+
+def profile_from_response(xhr, url, limiter=None):
+    """Parses one UserByScreenName response captured during a tweets visit. A rate limit on it is reported but not
+    raised, so the tweets already collected in the same visit are kept."""
+    try: return profile_from_json(xhr.url, url, read_graphql_json(xhr, "Profile XHR", limiter))
+    except RateLimitException as rle_profile: print(f"Profile XHR rate limited during combined visit for {url}: {rle_profile}"); return None
+
+class GraphQLResponseInbox:
+    """page.on("response") target for both engines. Only XHRs of the given GraphQL operations are kept, in a bounded
+    FIFO the scrape loop drains, so every response is parsed exactly once and its Response object is released right
+    after instead of living in a list for the whole page. When the FIFO is full, UserTweets pages are still queued
+    (losing one would leave a hole in the timeline) and the oldest other response is dropped instead."""
+    def __init__(self, operations, maxsize=None):
+        self.operations = set(operations); self.maxsize = maxsize or XHR_QUEUE_MAX_SIZE
+        self._responses = collections.deque(); self.dropped = 0
+        self.in_flight = 0 # Wanted requests sent but not answered yet
+        self._arrived = None # asyncio.Event for async_wait, created on first use
+
+    @classmethod
+    def for_visit(cls, scrape_tweets_mode, include_profile=False):
+        """Inbox for one scrape_twitter_info visit: UserTweets, UserByScreenName, or both on a combined visit."""
+        return cls(["UserTweets", "UserByScreenName"] if scrape_tweets_mode and include_profile else ["UserTweets"] if scrape_tweets_mode else ["UserByScreenName"])
+
+    def is_wanted_request(self, request):
+        return request.resource_type == "xhr" and graphql_operation_name(request.url) in self.operations
+
+    def is_wanted(self, resp):
+        return self.is_wanted_request(resp.request)
+
+    def on_request(self, request):
+        if self.is_wanted_request(request): self.in_flight += 1
+
+    def on_request_failed(self, request):
+        if self.is_wanted_request(request): self.in_flight = max(0, self.in_flight - 1)
+
+    def _drop(self, operation):
+        self.dropped += 1; metrics.count("xhr_dropped", operation=operation)
+        print(f"XHR queue full ({self.maxsize}); dropping {operation} response.")
+
+    def on_response(self, resp):
+        if not self.is_wanted(resp): return
+        self.in_flight = max(0, self.in_flight - 1); operation = graphql_operation_name(resp.url)
+        if len(self._responses) >= self.maxsize:
+            evictable = next((queued for queued in self._responses if queued[0] != "UserTweets"), None)
+            if evictable is not None: self._responses.remove(evictable); self._drop(evictable[0])
+            elif operation != "UserTweets": self._drop(operation); return
+        self._responses.append((operation, resp))
+        if self._arrived is not None: self._arrived.set()
+
+    def is_idle(self):
+        """Nothing queued and no wanted request in flight."""
+        return not self._responses and not self.in_flight
+
+    def pop(self):
+        """(operation, response) of the oldest queued XHR, or (None, None) if the queue is empty."""
+        return self._responses.popleft() if self._responses else (None, None)
+
+    def _wait_slice_ms(self, start_time, timeout_ms, idle_ms):
+        """How long to wait before re-checking, or None to give up: after timeout_ms, or after idle_ms if no wanted
+        request is in flight by then (the page is not fetching anything)."""
+        elapsed_ms = (time.time() - start_time) * 1000
+        if elapsed_ms >= timeout_ms or (not self.in_flight and elapsed_ms >= idle_ms): return None
+        return max(min(timeout_ms - elapsed_ms, 250 if self.in_flight else max(idle_ms - elapsed_ms, 1)), 1) # Re-check in_flight at least every 250ms
+
+    def wait(self, page: Page, timeout_ms, idle_ms=None):
+        """Blocks until a wanted response is queued while letting Playwright dispatch events; see _wait_slice_ms for
+        when it gives up. Returns True if one is queued."""
+        start_time = time.time(); idle_ms = timeout_ms if idle_ms is None else idle_ms
+        while not self._responses:
+            slice_ms = self._wait_slice_ms(start_time, timeout_ms, idle_ms)
+            if slice_ms is None: break
+            try: page.wait_for_event("response", predicate=self.is_wanted, timeout=slice_ms)
+            except PlaywrightTimeoutError: pass
+        return bool(self._responses)
+
+    async def async_wait(self, timeout_ms, idle_ms=None):
+        """Async counterpart of wait: the async API dispatches events while this awaits, so on_response wakes it directly."""
+        start_time = time.time(); idle_ms = timeout_ms if idle_ms is None else idle_ms
+        if self._arrived is None: self._arrived = asyncio.Event()
+        while not self._responses:
+            slice_ms = self._wait_slice_ms(start_time, timeout_ms, idle_ms)
+            if slice_ms is None: break
+            self._arrived.clear()
+            try: await asyncio.wait_for(self._arrived.wait(), timeout=slice_ms / 1000)
+            except asyncio.TimeoutError: pass
+        return bool(self._responses)
+
+class PagePool:
+    """Warm pages of one browser context. release() detaches the listeners an operation added, navigates the page to
+    about:blank (dropping the profile's DOM, scripts and timers) and parks it for the next acquire(); crashed or closed
+    pages are closed/dropped instead, so a page crash never outlives the operation it happened in. release() always
+    returns None, so callers write page = pages.release(page) and a second release of the same page is a no-op."""
+    def __init__(self, context, max_idle=1):
+        self.context = context; self.max_idle = max_idle
+        self._idle = []; self._listeners = {} # id(page) -> [(event, handler)]
+        self._crashed = set() # id(page) of pages that fired "crash"
+
+    def _track(self, page):
+        page.on("crash", lambda crashed_page: self._crashed.add(id(crashed_page)))
+        metrics.count("pages_created")
+        return page
+
+    def _pop_idle(self):
+        while self._idle:
+            page = self._idle.pop()
+            if not page.is_closed() and id(page) not in self._crashed: metrics.count("pages_reused"); return page
+        return None
+
+    def acquire(self):
+        with metrics.phase("page_setup"): return self._pop_idle() or self._track(self.context.new_page())
+
+    async def async_acquire(self):
+        with metrics.phase("page_setup"): return self._pop_idle() or self._track(await self.context.new_page())
+
+    def listen(self, page, **handlers):
+        """page.on(event, handler) for each event=handler, remembered so release() can detach them."""
+        for event, handler in handlers.items():
+            page.on(event, handler); self._listeners.setdefault(id(page), []).append((event, handler))
+
+    def _detach(self, page):
+        for event, handler in self._listeners.pop(id(page), []):
+            try: page.remove_listener(event, handler)
+            except Exception: pass
+        return REUSE_PAGES and not page.is_closed() and id(page) not in self._crashed and len(self._idle) < self.max_idle
+
+    def release(self, page):
+        if page is None or page.is_closed(): return None
+        if self._detach(page):
+            try: page.goto("about:blank", timeout=10000); self._idle.append(page); return None
+            except Exception as e_reset: print(f"Note: Could not reset page to about:blank ({e_reset}); closing it.")
+        self._crashed.discard(id(page))
+        try: page.close()
+        except Exception as e_close: print(f"Note: Error closing page: {e_close}")
+        return None
+
+    async def async_release(self, page):
+        if page is None or page.is_closed(): return None
+        if self._detach(page):
+            try: await page.goto("about:blank", timeout=10000); self._idle.append(page); return None
+            except Exception as e_reset: print(f"Note: Could not reset page to about:blank ({e_reset}); closing it.")
+        self._crashed.discard(id(page))
+        try: await page.close()
+        except Exception as e_close: print(f"Note: Error closing page: {e_close}")
+        return None
+
+_page_pools = {} # id(context) -> PagePool
+
+def page_pool_for(context, max_idle=1):
+    pool = _page_pools.get(id(context))
+    if pool is None or pool.context is not context: pool = _page_pools[id(context)] = PagePool(context, max_idle)
+    return pool
+
+def drop_page_pool(context):
+    _page_pools.pop(id(context), None)
+
+def browser_is_connected(context):
+    """False once the browser behind context has crashed or been closed (persistent contexts have no browser object)."""
+    return context.browser is None or context.browser.is_connected()
+
+def cached_graphql_json(request_url):
+    """A fresh copy of the response to request_url from the GraphQL response cache, or None."""
+    cache = graphql_cache(); cached_text = cache.get(request_url) if cache else None
+    return json.loads(cached_text) if cached_text is not None else None
+
+def request_graphql_json(context: BrowserContext, request_url, headers, label, timeout_ms=30000):
+    """GETs a GraphQL URL through context.request (the pages' cookies), paced by the context's limiter, unless the
+    GraphQL response cache has a fresh copy. Same results as read_graphql_json; RateLimitException propagates."""
+    cached_json = cached_graphql_json(request_url)
+    if cached_json is not None: return cached_json
+    limiter = rate_limiter_for(context); limiter.acquire(graphql_operation_name(request_url))
+    with metrics.phase("api_request"): api_response = context.request.get(request_url, headers=headers, timeout=timeout_ms)
+    return read_graphql_json(api_response, label, limiter)
+
+class TimelineAttempt:
+    """Tweets collected by one attempt of scrape_twitter_info (or its async twin), fed one UserTweets page at a time,
+    whether the page came from a scrolled XHR or from a direct API request. done is set once the previously scraped
+    tweets (since_tweet_id) or the end of the timeline are reached."""
+    def __init__(self, url, since_tweet_id=None):
+        self.url = url; self.since_tweet_id = since_tweet_id
+        self.tweets = []; self.found_ids = set()
+        self.responses = 0; self.pages = 0 # UserTweets responses handed in / usable among them
+        self.last_cursor = None; self.done = False
+
+    def is_full(self):
+        return len(self.tweets) >= NUM_POSTS_TO_RETRIEVE
+
+    def add_page(self, page_url, json_response):
+        """Adds the tweets of one UserTweets response. Returns False if it was unusable."""
+        self.responses += 1
+        if not json_response or "data" not in json_response: return False
+        self.pages += 1; record_graphql_page("UserTweets", page_url, self.url, json_response)
+        add_new_tweets(json_response, self.tweets, self.found_ids, self.url, self.since_tweet_id)
+        if reached_known_tweets(json_response, self.since_tweet_id): self.done = True; print(f"Reached previously scraped tweets for {self.url}.")
+        elif is_last_timeline_page(json_response, self.last_cursor): self.done = True; print(f"Reached the end of the timeline for {self.url}. Found {len(self.tweets)}.")
+        self.last_cursor = extract_bottom_cursor(json_response)
+        return True
+
+    def next_api_page_url(self, request_url, deadline):
+        """URL of the next UserTweets page to request directly, or None once the attempt has enough or is done."""
+        if self.done or self.is_full() or not self.last_cursor or time.time() >= deadline: return None
+        return build_user_tweets_page_url(request_url, self.last_cursor)
+
+    def finish(self, empty_scrolls):
+        """The collected tweets, after logging how the attempt went. Raises AccountUnavailableException if the visit
+        never produced a UserTweets response even though the page was scrolled."""
+        if self.responses == 0 and not self.tweets and empty_scrolls > 3: # S1 logic
+            raise AccountUnavailableException(f"No UserTweets XHRs processed and no tweets found for {self.url} after {empty_scrolls} scrolls. Assuming account issue.")
+        if self.since_tweet_id: print(f"Incremental: {len(self.tweets)} new tweets for {self.url} since {self.since_tweet_id}.")
+        elif not self.tweets: print(f"No tweets found for {self.url} in this attempt.")
+        elif not self.is_full(): print(f"Warn: Retrieved {len(self.tweets)}/{NUM_POSTS_TO_RETRIEVE} for {self.url}.")
+        return self.tweets[:NUM_POSTS_TO_RETRIEVE]
+
+def paginate_user_tweets_via_api(context: BrowserContext, request_url, request_headers, attempt: TimelineAttempt, deadline):
+    """Follows cursor-bottom from the attempt's last page by issuing the next UserTweets requests through
+    context.request, which shares the logged-in cookies. RateLimitException propagates to the caller."""
+    api_headers = graphql_api_headers(request_headers); pages_before = attempt.pages
+    page_url = attempt.next_api_page_url(request_url, deadline)
+    while page_url:
+        if not attempt.add_page(page_url, request_graphql_json(context, page_url, api_headers, "UserTweets API")): print(f"Direct pagination stopped for {attempt.url}: unusable page."); break
+        page_url = attempt.next_api_page_url(request_url, deadline)
+    print(f"Direct pagination fetched {attempt.pages - pages_before} pages for {attempt.url}. Total tweets: {len(attempt.tweets)}.")
+
+PRIMARY_COLUMN_SELECTOR = "[data-testid='primaryColumn']"
+
+def primary_column_timeout_ms(remaining_seconds, url):
+    """How long to wait for the primary column with remaining_seconds of the operation left, or None if that is too little."""
+    timeout_ms = min(PRIMARY_COLUMN_WAIT_TIMEOUT, max(0, remaining_seconds * 1000) - 1000) # buffer
+    if timeout_ms > 1000: return timeout_ms
+    print(f"Not enough time remaining to wait for primary column for {url}. Remaining for selector: {timeout_ms}ms.")
+    return None
+
+def primary_column_missing(url, wait_error):
+    """The AccountUnavailableException for a profile page whose primary column never showed up without an explicit account message."""
+    print(f"Primary column not found for {url} but no explicit account issue messages. Assuming unavailable.")
+    return AccountUnavailableException(f"Primary column not found for {url} ({wait_error}), and no explicit suspension/non-existent message detected. Assuming unavailable.")
+
+def profile_visit_result(url, user_profile_data, profile_xhrs_seen, wait_seconds):
+    """What a profile-mode visit returns: the profile, or None if its UserByScreenName XHRs were unusable. Raises
+    AccountUnavailableException if none showed up at all."""
+    if user_profile_data: return user_profile_data
+    if not profile_xhrs_seen: # S1 logic
+        raise AccountUnavailableException(f"No UserByScreenName XHR detected for profile {url} within {wait_seconds:.1f}s. Assuming account issue.")
+    print(f"Could not find/process profile XHR for {url} in this attempt.")
+    return None
+
+def local_retry_delay(error, local_retries, context, url):
+    """Seconds to pause before local retry local_retries of a scrape_twitter_info attempt that failed with error, or
+    None to give up on the operation. Re-raises error when it must escalate instead: a rate limit that another pooled
+    account can take over or that outlasted MAX_LOCAL_OPERATION_RETRIES, or any error on a dead browser."""
+    if isinstance(error, RateLimitException):
+        print(f"RateLimitException (local attempt {local_retries}) for {url}: {error}")
+        if can_rotate_account(context, _account_pool):
+            print(f"Another account has budget left; escalating {url} for account rotation instead of pausing.")
+            raise error
+        if local_retries > MAX_LOCAL_OPERATION_RETRIES:
+            print(f"Max local retries for Rate Limits ({MAX_LOCAL_OPERATION_RETRIES}) reached for {url}. Escalating to main.")
+            raise error # Caught by the per-user global retry logic
+        # Until x-rate-limit-reset when known, otherwise S2's fixed backoff
+        delay = rate_limit_retry_delay(local_retries, rate_limiter_for(context), operations=(error.operation,) if error.operation else ())
+        print(f"Pausing for {delay:.0f}s before local retry {local_retries}/{MAX_LOCAL_OPERATION_RETRIES} for {url}...")
+        metrics.count("retries", kind="local_rate_limit")
+        return delay
+    print(f"Unhandled error during local attempt {local_retries} for {url}: {error}")
+    if not browser_is_connected(context): raise error # Retrying on a dead browser is pointless; the worker replaces it
+    if local_retries > MAX_LOCAL_OPERATION_RETRIES:
+        print(f"Max local retries for other errors ({MAX_LOCAL_OPERATION_RETRIES}) reached for {url}. Giving up on this operation for this user.")
+        return None
+    print(f"Pausing for 30s due to unhandled error before local retry {local_retries}/{MAX_LOCAL_OPERATION_RETRIES} for {url}...")
+    metrics.count("retries", kind="local_error")
+    return 30
+
+def scrape_twitter_info(context: BrowserContext, url: str, scrape_tweets_mode: bool, timeout_seconds=120, include_profile=False, since_tweet_id=None):
+    """Scrapes tweets (scrape_tweets_mode=True) or the profile of one user on a page of the context's PagePool. With include_profile in tweets
+    mode, the UserByScreenName XHR captured during the same visit is parsed too and a (tweets, profile) tuple is returned.
+    With since_tweet_id, only newer tweets are collected and scrolling stops once that id is reached."""
     page: Page = None
     local_retries = 0
+    limiter = rate_limiter_for(context)
+    pages = page_pool_for(context)
 
     while local_retries <= MAX_LOCAL_OPERATION_RETRIES:
-        current_attempt_tweets = []
-        current_attempt_found_ids = set()
-        attempt_processed_xhr_urls = set()
-        tweet_xhr_processed_count_this_attempt = 0
-        profile_xhr_processed_count_this_attempt = 0
-
         try:
-            if page and not page.is_closed():
-                try: page.close()
-                except Exception as e_pg_close_retry: print(f"Note: Error closing previous page on retry: {e_pg_close_retry}")
-
-            page = context.new_page()
-            _xhr_calls = []
-            page.on("response", lambda resp: _xhr_calls.append(resp) if (("UserTweets" in resp.url or "UserByScreenName" in resp.url) and resp.request.resource_type == "xhr") else None)
+            page = pages.release(page) # Left over from a failed attempt
+            page = pages.acquire() # A warm about:blank page when the previous operation left one
+            inbox = GraphQLResponseInbox.for_visit(scrape_tweets_mode, include_profile)
+            pages.listen(page, request=inbox.on_request, requestfailed=inbox.on_request_failed, response=inbox.on_response)
 
             overall_start_time = time.time()
+            remaining_seconds = lambda: timeout_seconds - (time.time() - overall_start_time)
 
             print(f"Navigating to profile: {url} (Local Attempt {local_retries + 1})")
-            page.goto(url, timeout=min(timeout_seconds * 1000, 60000), wait_until="domcontentloaded")
+            limiter.acquire("UserByScreenName", "UserTweets") # A profile load fires both
+            with metrics.phase("navigate"): page.goto(url, timeout=min(timeout_seconds * 1000, 60000), wait_until="domcontentloaded")
+            check_page_for_account_issues(page) # Initial check after load
 
-            try:
-                check_page_for_account_issues(page) # Initial check after load
-            except AccountUnavailableException:
-                if page and not page.is_closed():
-                    try: page.close()
-                    except Exception: pass
-                raise
-
-            if time.time() - overall_start_time >= timeout_seconds:
+            if remaining_seconds() <= 0:
                 print(f"Timeout after page load for {url}")
-                if page and not page.is_closed():
-                    try: page.close()
-                    except Exception: pass
+                page = pages.release(page)
                 return None
 
-            primary_column_selector = "[data-testid='primaryColumn']"
-            wait_for_primary_column_timeout_ms = 0 # Initialize
+            wait_for_primary_column_timeout_ms = primary_column_timeout_ms(remaining_seconds(), url)
             try:
-                elapsed_time_current_op = time.time() - overall_start_time
-                remaining_time_for_op_ms = max(0, (timeout_seconds - elapsed_time_current_op) * 1000)
-                wait_for_primary_column_timeout_ms = min(PRIMARY_COLUMN_WAIT_TIMEOUT, remaining_time_for_op_ms - 1000) # buffer
-
-                if wait_for_primary_column_timeout_ms <= 1000: # If less than 1s, likely not enough time
-                    print(f"Not enough time remaining to wait for primary column for {url}. Remaining for selector: {wait_for_primary_column_timeout_ms}ms.")
-                    raise PlaywrightTimeoutError("Insufficient time for primary column after load and checks.")
-
-                page.wait_for_selector(primary_column_selector, timeout=wait_for_primary_column_timeout_ms)
+                if wait_for_primary_column_timeout_ms is None: raise PlaywrightTimeoutError("Insufficient time for primary column after load and checks.")
+                with metrics.phase("primary_column"): page.wait_for_selector(PRIMARY_COLUMN_SELECTOR, timeout=wait_for_primary_column_timeout_ms)
             except PlaywrightTimeoutError as pte_selector:
-                print(f"Primary column not found for {url} within {wait_for_primary_column_timeout_ms/1000:.1f}s (adaptive). Re-checking for account issues...")
-                try:
-                    check_page_for_account_issues(page) # Re-check diligently
-                except AccountUnavailableException:
-                    if page and not page.is_closed():
-                        try: page.close()
-                        except Exception: pass
-                    raise
-                print(f"Primary column not found for {url} but no explicit account issue messages. Assuming unavailable.")
-                if page and not page.is_closed():
-                    try: page.close()
-                    except Exception: pass
-                raise AccountUnavailableException(f"Primary column not found for {url} ({pte_selector}), and no explicit suspension/non-existent message detected. Assuming unavailable.")
-            page.wait_for_timeout(2500) # Static wait after primary column appears
+                print(f"Primary column not found for {url} (adaptive wait). Re-checking for account issues...")
+                check_page_for_account_issues(page) # Re-check diligently
+                raise primary_column_missing(url, pte_selector)
 
             if scrape_tweets_mode:
-                xhr_url_substring = "/UserTweets"
-                page.mouse.wheel(0, 800); time.sleep(3) # Initial scroll
+                page.mouse.wheel(0, 800) # Initial scroll; the first UserTweets page is usually already in flight
                 print(f"Starting tweet retrieval for {url}. Target: {NUM_POSTS_TO_RETRIEVE}.")
-                no_new_xhr_scroll_count = 0; time_spent_on_user_tweets = 0; user_tweet_loop_start_time = time.time()
+                attempt = TimelineAttempt(url, since_tweet_id); no_new_xhr_scroll_count = 0; first_user_tweets_request = None; user_profile_data = None
 
-                while len(current_attempt_tweets) < NUM_POSTS_TO_RETRIEVE and time_spent_on_user_tweets < (timeout_seconds - (time.time() - overall_start_time) - 10) : # Ensure loop respects overall timeout
-                    time_spent_on_user_tweets = time.time() - user_tweet_loop_start_time
-                    current_xhr_calls_batch = [call for call in _xhr_calls if xhr_url_substring in call.url and call.url not in attempt_processed_xhr_urls]
-                    if not current_xhr_calls_batch:
+                while not attempt.is_full() and remaining_seconds() > 10:
+                    operation, xhr = inbox.pop()
+                    if xhr is None:
+                        with metrics.phase("scroll_wait"): got_xhr = inbox.wait(page, min(XHR_RESPONSE_TIMEOUT_MS, (remaining_seconds() - 10) * 1000), scroll_wait_ms(no_new_xhr_scroll_count))
+                        if got_xhr: continue # Woke up as soon as the next XHR landed
                         no_new_xhr_scroll_count += 1
-                        if no_new_xhr_scroll_count > 6: # Original value from S1
-                             print(f"No new XHRs after {no_new_xhr_scroll_count} scrolls for {url}. Found {len(current_attempt_tweets)}."); break
-                        page.mouse.wheel(0, 10000); time.sleep(4.5); continue
-                    else: no_new_xhr_scroll_count = 0
-
-                    for xhr in current_xhr_calls_batch:
-                        response_text = None; json_response = None
-                        tweet_xhr_processed_count_this_attempt +=1
-                        try:
-                            if not xhr.ok:
-                                if xhr.status == 429: raise RateLimitException(f"Status 429 on {xhr.url}")
-                                err_text = "(Could not get text)";
-                                try: err_text = xhr.text()
-                                except Exception: pass
-                                print(f"XHR not OK: {xhr.status} for {xhr.url}. Text: {err_text[:100]}."); attempt_processed_xhr_urls.add(xhr.url); continue
-                            content_type = xhr.headers.get('content-type', '').lower(); response_text = xhr.text()
-                            if 'application/json' not in content_type:
-                                if response_text and ("rate limit" in response_text.lower() or "too many requests" in response_text.lower() or "temporarily locked" in response_text.lower()):
-                                    raise RateLimitException(f"Rate limit text in non-JSON from {xhr.url}. Text: {response_text[:100]}")
-                                print(f"XHR not JSON: {content_type} for {xhr.url}. Text: {response_text[:100]}."); attempt_processed_xhr_urls.add(xhr.url); continue
-                            if not response_text: print(f"XHR empty for {xhr.url}."); attempt_processed_xhr_urls.add(xhr.url); continue
-                            json_response = json.loads(response_text)
-                            if "data" not in json_response: attempt_processed_xhr_urls.add(xhr.url); continue # Or errors key
-                            user_data_tree = json_response.get("data", {}).get("user", {}).get("result", {})
-                            timeline_instructions = []; tl_v1 = user_data_tree.get("timeline", {}).get("timeline", {}); tl_v2 = user_data_tree.get("timeline_v2", {}).get("timeline", {})
-                            if tl_v1 and "instructions" in tl_v1: timeline_instructions = tl_v1.get("instructions", [])
-                            elif tl_v2 and "instructions" in tl_v2: timeline_instructions = tl_v2.get("instructions", [])
-                            for instruction in timeline_instructions:
-                                if instruction.get("type") == "TimelineAddEntries":
-                                    for entry in instruction.get("entries", []):
-                                        content = entry.get("content", {}); item_content = content.get("itemContent", {})
-                                        if content.get("entryType") == "TimelineTimelineItem" and item_content.get("itemType") == "TimelineTweet":
-                                            tweet_res_cont = item_content.get("tweet_results", {}); tweet_res = tweet_res_cont.get("result", {})
-                                            actual_data = None
-                                            if tweet_res.get("__typename") == "TweetWithVisibilityResults": actual_data = tweet_res.get("tweet")
-                                            elif tweet_res.get("__typename") == "Tweet": actual_data = tweet_res
-                                            if actual_data and "rest_id" in actual_data:
-                                                tweet_id = actual_data["rest_id"]
-                                                if tweet_id not in current_attempt_found_ids:
-                                                    current_attempt_tweets.append(actual_data); current_attempt_found_ids.add(tweet_id)
-                                                    if len(current_attempt_tweets) % 20 == 0: print(f"Retrieved {len(current_attempt_tweets)} tweets for {url}...")
-                                                    if len(current_attempt_tweets) >= NUM_POSTS_TO_RETRIEVE: break
-                                    if len(current_attempt_tweets) >= NUM_POSTS_TO_RETRIEVE: break
-                            if len(current_attempt_tweets) >= NUM_POSTS_TO_RETRIEVE: break
-                            attempt_processed_xhr_urls.add(xhr.url)
-                        except json.JSONDecodeError as e:
-                            if response_text and ("rate limit" in response_text.lower() or "too many requests" in response_text.lower() or "temporarily locked" in response_text.lower()): raise RateLimitException(f"Rate limit (JSON decode text match) for {xhr.url}. Err: {e}. Text: {response_text[:100]}")
-                            print(f"Non-RL JSONErr for {xhr.url}: {e}. Text: {response_text[:100]}."); attempt_processed_xhr_urls.add(xhr.url); continue
-                        except RateLimitException: raise
-                        except (KeyError, TypeError) as e_d: print(f"Data structure err {xhr.url}: {e_d}."); attempt_processed_xhr_urls.add(xhr.url); continue
-                        except Exception as e_i: print(f"Unexpected err XHR {xhr.url}: {e_i}."); attempt_processed_xhr_urls.add(xhr.url); continue
-                        if len(current_attempt_tweets) >= NUM_POSTS_TO_RETRIEVE: break
-                    if len(current_attempt_tweets) >= NUM_POSTS_TO_RETRIEVE: break
-
-                if tweet_xhr_processed_count_this_attempt == 0 and not current_attempt_tweets and no_new_xhr_scroll_count > 3: # S1 logic
-                    if page and not page.is_closed():
-                        try: page.close()
-                        except Exception: pass
-                    raise AccountUnavailableException(f"No UserTweets XHRs processed and no tweets found for {url} after {no_new_xhr_scroll_count} scrolls. Assuming account issue.")
-
-                if not current_attempt_tweets: print(f"No tweets found for {url} in this attempt.")
-                elif len(current_attempt_tweets) < NUM_POSTS_TO_RETRIEVE: print(f"Warn: Retrieved {len(current_attempt_tweets)}/{NUM_POSTS_TO_RETRIEVE} for {url}.")
-
-                if page and not page.is_closed():
-                    try: page.close()
-                    except Exception as e_pg_close_tweet: print(f"Note: Error closing page after tweets: {e_pg_close_tweet}")
-                return current_attempt_tweets[:NUM_POSTS_TO_RETRIEVE]
+                        if no_new_xhr_scroll_count > MAX_EMPTY_SCROLLS:
+                            print(f"No new XHRs after {no_new_xhr_scroll_count} scrolls for {url}. Found {len(attempt.tweets)}."); break
+                        limiter.acquire("UserTweets"); page.mouse.wheel(0, 10000); continue
+                    if operation == "UserByScreenName": # Combined visit: parse the profile as soon as it arrives
+                        remember_user_by_screen_name_request(context, xhr)
+                        if user_profile_data is None: user_profile_data = profile_from_response(xhr, url, limiter)
+                        continue
+                    no_new_xhr_scroll_count = 0
+                    if not attempt.add_page(xhr.url, read_graphql_json(xhr, "XHR", limiter)): continue
+                    if attempt.done: break
+                    if DIRECT_GRAPHQL_PAGINATION: first_user_tweets_request = (xhr.url, xhr.request.all_headers()); break # Remaining pages are requested directly below
+                    if inbox.is_idle() and not attempt.is_full():
+                        limiter.acquire("UserTweets"); page.mouse.wheel(0, 10000) # Ask for the next page right away
+
+                if first_user_tweets_request: paginate_user_tweets_via_api(context, *first_user_tweets_request, attempt, overall_start_time + timeout_seconds - 10)
+                tweets = attempt.finish(no_new_xhr_scroll_count)
+
+                while include_profile and user_profile_data is None: # Profile XHR still queued behind the last tweet page
+                    operation, xhr = inbox.pop()
+                    if xhr is None: break
+                    if operation == "UserByScreenName": remember_user_by_screen_name_request(context, xhr); user_profile_data = profile_from_response(xhr, url, limiter)
+                page = pages.release(page)
+                return (tweets, user_profile_data) if include_profile else tweets
 
             else: # Profile Scraping
-                xhr_url_substring = "/UserByScreenName"; user_profile_data = None; loop_start_time = time.time()
-                # Ensure profile_xhr_wait_timeout respects overall operation timeout
-                profile_xhr_wait_timeout = max(20, timeout_seconds - (time.time() - overall_start_time) - 10) # 10s buffer
-                attempt_profile_processed_xhr_urls = set()
-                profile_xhr_found_for_attempt = False
-                wait_for_profile_xhr_start = time.time()
-
-                while not profile_xhr_found_for_attempt and (time.time() - wait_for_profile_xhr_start) < profile_xhr_wait_timeout :
-                    if any(xhr_url_substring in call.url for call in _xhr_calls):
-                        profile_xhr_found_for_attempt = True; break
-                    page.wait_for_timeout(500)
-
-                if not profile_xhr_found_for_attempt:
-                     if page and not page.is_closed():
-                         try: page.close()
-                         except Exception: pass
-                     raise AccountUnavailableException(f"No UserByScreenName XHR detected for profile {url} within {profile_xhr_wait_timeout:.1f}s. Assuming account issue.")
-
-                while user_profile_data is None and (time.time() - loop_start_time) < profile_xhr_wait_timeout and (time.time() - overall_start_time) < timeout_seconds:
-                    profile_api_calls = [xhr for xhr in _xhr_calls if xhr_url_substring in xhr.url and xhr.url not in attempt_profile_processed_xhr_urls]
-                    if not profile_api_calls and profile_xhr_processed_count_this_attempt > 0: # All processed calls checked
-                        break
-
-                    for call in profile_api_calls:
-                        response_text = None; json_response = None
-                        profile_xhr_processed_count_this_attempt +=1
-                        try:
-                            if not call.ok:
-                                if call.status == 429: raise RateLimitException(f"Status 429 on profile XHR {call.url}")
-                                err_text = "(Could not get text)";
-                                try: err_text = call.text()
-                                except Exception: pass
-                                print(f"Profile XHR not OK: {call.status} for {call.url}. Text: {err_text[:100]}."); attempt_profile_processed_xhr_urls.add(call.url); continue
-                            content_type = call.headers.get('content-type', '').lower(); response_text = call.text()
-                            if 'application/json' not in content_type:
-                                if response_text and ("rate limit" in response_text.lower() or "too many requests" in response_text.lower()): raise RateLimitException(f"Rate limit text in non-JSON profile XHR {call.url}. Text: {response_text[:100]}")
-                                print(f"Profile XHR not JSON: {content_type} for {call.url}. Text: {response_text[:100]}."); attempt_profile_processed_xhr_urls.add(call.url); continue
-                            if not response_text: print(f"Profile XHR empty for {call.url}."); attempt_profile_processed_xhr_urls.add(call.url); continue
-                            json_response = json.loads(response_text)
-                            potential_user_data = json_response.get('data', {}).get('user', {}).get('result', {})
-                            if potential_user_data.get('rest_id') and 'errors' not in json_response and potential_user_data.get('legacy'):
-                                user_profile_data = potential_user_data;
-                                if page and not page.is_closed():
-                                    try: page.close()
-                                    except Exception as e_pg_close_prof_succ: print(f"Note: Error closing page after profile success: {e_pg_close_prof_succ}")
-                                return user_profile_data
-                            attempt_profile_processed_xhr_urls.add(call.url)
-                        except json.JSONDecodeError as e_p_json:
-                            if response_text and ("rate limit" in response_text.lower() or "too many requests" in response_text.lower()): raise RateLimitException(f"Rate limit (JSON decode text match) profile {call.url}. Err: {e_p_json}. Text: {response_text[:100]}")
-                            print(f"Non-RL JSONErr profile {call.url}: {e_p_json}. Text: {response_text[:100]}."); attempt_profile_processed_xhr_urls.add(call.url)
-                        except RateLimitException: raise
-                        except (KeyError, TypeError) as e_p_key: print(f"Data structure err profile {call.url}: {e_p_key}."); attempt_profile_processed_xhr_urls.add(call.url)
-                        except Exception as e_p_other: print(f"Unexpected err profile XHR {call.url}: {e_p_other}."); attempt_profile_processed_xhr_urls.add(call.url)
-                    if user_profile_data is None: time.sleep(0.5)
-
-                if not user_profile_data and profile_xhr_processed_count_this_attempt == 0: # S1 logic
-                    if page and not page.is_closed():
-                        try: page.close()
-                        except Exception: pass
-                    raise AccountUnavailableException(f"No UserByScreenName XHRs were successfully processed for profile {url}. Assuming account issue.")
-
-                if user_profile_data:
-                    if page and not page.is_closed():
-                        try: page.close()
-                        except Exception as e_pg_close_prof_succ2: print(f"Note: Error closing page after profile success 2: {e_pg_close_prof_succ2}")
-                    return user_profile_data
-                else: print(f"Could not find/process profile XHR for {url} in this attempt.");
-
-            if page and not page.is_closed():
-                try: page.close()
-                except Exception as e_pg_close_final_op: print(f"Note: Error closing page at end of operation: {e_pg_close_final_op}")
-            return None
+                user_profile_data = None; profile_xhrs_seen = 0; loop_start_time = time.time()
+                profile_xhr_wait_timeout = max(20, remaining_seconds() - 10) # 10s buffer
+                while user_profile_data is None and time.time() - loop_start_time < profile_xhr_wait_timeout:
+                    operation, call = inbox.pop()
+                    if call is None:
+                        with metrics.phase("profile_wait"): inbox.wait(page, 500)
+                        continue
+                    profile_xhrs_seen += 1; remember_user_by_screen_name_request(context, call)
+                    user_profile_data = profile_from_json(call.url, url, read_graphql_json(call, "Profile XHR", limiter))
+                page = pages.release(page)
+                return profile_visit_result(url, user_profile_data, profile_xhrs_seen, profile_xhr_wait_timeout)
+
         except AccountUnavailableException: # Catch and re-raise to be handled by main
-            if page and not page.is_closed():
-                try: page.close()
-                except Exception: pass
+            page = pages.release(page)
             raise
-        except RateLimitException as rle:
-            print(f"RateLimitException (local attempt {local_retries + 1}) for {url}: {rle}")
-            local_retries += 1
-            if page and not page.is_closed():
-                try: page.close()
-                except Exception as e_pg_close_rle: print(f"Note: Error closing page on RLE: {e_pg_close_rle}")
-            if local_retries <= MAX_LOCAL_OPERATION_RETRIES:
-                # Updated delay calculation based on S2's constants
-                delay = LOCAL_OPERATION_RETRY_BASE_DELAY_SECONDS
-                if local_retries > 1 : # Apply increment for 2nd, 3rd... local retries
-                    delay += (local_retries - 1) * LOCAL_OPERATION_RETRY_INCREMENT_SECONDS
-                print(f"Pausing for {delay}s before local retry {local_retries}/{MAX_LOCAL_OPERATION_RETRIES} for {url}...")
-                time.sleep(delay)
-            else:
-                print(f"Max local retries for Rate Limits ({MAX_LOCAL_OPERATION_RETRIES}) reached for {url}. Escalating to main.")
-                raise # Re-raise to be caught by the main function's global retry logic
-        except Exception as e_user_op:
-            print(f"Unhandled error during local attempt {local_retries + 1} for {url}: {e_user_op}")
+        except Exception as e_attempt:
             local_retries += 1
-            if page and not page.is_closed():
-                try: page.close()
-                except Exception as e_pg_close_unhandled: print(f"Note: Error closing page on unhandled ex: {e_pg_close_unhandled}")
-            if local_retries <= MAX_LOCAL_OPERATION_RETRIES:
-                # Generic delay for other errors before local retry
-                print(f"Pausing for 30s due to unhandled error before local retry {local_retries}/{MAX_LOCAL_OPERATION_RETRIES} for {url}...")
-                time.sleep(30)
-            else:
-                print(f"Max local retries for other errors ({MAX_LOCAL_OPERATION_RETRIES}) reached for {url}. Giving up on this operation for this user.")
-                if page and not page.is_closed():
-                    try: page.close()
-                    except Exception: pass
-                return None # Give up on this specific scrape_twitter_info call
+            page = pages.release(page)
+            delay = local_retry_delay(e_attempt, local_retries, context, url) # Re-raises what must escalate
+            if delay is None: return None # Give up on this specific scrape_twitter_info call
+            with metrics.phase("retry_sleep"): time.sleep(delay)
 
     print(f"Failed to scrape {url} after {MAX_LOCAL_OPERATION_RETRIES + 1} local attempts.")
-    if page and not page.is_closed():
-        try: page.close()
-        except Exception as e_pg_close_fallthrough: print(f"Note: Error closing page in final fallthrough: {e_pg_close_fallthrough}")
+    page = pages.release(page)
     return None
 
+# --- Tweet files: NDJSON (optionally gzip/zstd) or the legacy JSON array ---
+TWEETS_FILE_SUFFIXES = (".ndjson.gz", ".ndjson.zst", ".ndjson", ".json")
+
+def tweets_output_filename(user_dir, sanitized_username, ndjson=None):
+    base_filename = os.path.join(user_dir, f"{sanitized_username}_last_{NUM_POSTS_TO_RETRIEVE}_tweets")
+    if not (STREAM_TWEETS_NDJSON if ndjson is None else ndjson): return base_filename + ".json"
+    return base_filename + ".ndjson" + {None: "", "gzip": ".gz", "zstd": ".zst"}[TWEETS_NDJSON_COMPRESSION]
+
+def tweets_base_filename(tweets_filename):
+    """<user>_last_200_tweets for any tweets file name (used to name the analysis CSV)."""
+    base_filename = os.path.basename(tweets_filename)
+    return next((base_filename[:-len(suffix)] for suffix in TWEETS_FILE_SUFFIXES if base_filename.endswith(suffix)), os.path.splitext(base_filename)[0])
+
+def open_tweets_text(filename, mode):
+    """Opens an NDJSON tweets file as text ("rt", "wt" or "at"), compressing by extension; .partial/.tmp suffixes are ignored."""
+    name = next((filename[:-len(suffix)] for suffix in (".partial", ".tmp") if filename.endswith(suffix)), filename)
+    if name.endswith(".gz"): return gzip.open(filename, mode, encoding="utf-8")
+    if name.endswith(".zst"):
+        if zstandard is None: raise RuntimeError(f"zstandard is not installed; pip install zstandard to read/write {filename}")
+        if "r" in mode: return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), read_across_frames=True, closefd=True), encoding="utf-8")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(filename, mode.replace("t", "b")), closefd=True), encoding="utf-8")
+    return open(filename, mode, encoding="utf-8")
+
+def iter_stored_tweets(filename):
+    """Yields the tweets of a tweets file one at a time. NDJSON is read line by line (a torn last line from an interrupted
+    write is skipped); a legacy .json array is loaded whole."""
+    if filename.endswith(".json"):
+        with open(filename, "r", encoding="utf-8") as f: yield from json.load(f)
+        return
+    with open_tweets_text(filename, "rt") as f:
+        try:
+            for line in f:
+                if not line.strip(): continue
+                try: yield json.loads(line)
+                except json.JSONDecodeError: print(f"Skipping unreadable line in {filename}.")
+        except EOFError: print(f"{filename} ends in an incomplete compressed block; using the tweets before it.")
+
+def write_tweets_ndjson(filename, tweets):
+    temp_filename = filename + ".tmp"
+    with open_tweets_text(temp_filename, "wt") as f:
+        for tweet in tweets: f.write(json.dumps(tweet, ensure_ascii=False) + "\n")
+    os.replace(temp_filename, filename)
+
+class TweetSink:
+    """Appends each new tweet as one NDJSON line to <tweets file>.partial while a user is scraped. Tweets repeated by a
+    retried attempt are written once. save_user_results promotes the partial file on success; after a failure it stays
+    on disk and the next run for the user continues it (carried_over tweets), and is then trimmed to the newest tweets."""
+    def __init__(self, final_filename):
+        self.final_filename = final_filename; self.filename = final_filename + ".partial"
+        self._file = None; self._seen_ids = set(); self.written = 0; self.carried_over = 0
+        if os.path.exists(self.filename):
+            kept_tweets = [tweet for tweet in iter_stored_tweets(self.filename) if "rest_id" in tweet]
+            write_tweets_ndjson(self.filename, kept_tweets) # Drop any torn tail before appending to it
+            self._seen_ids = {tweet["rest_id"] for tweet in kept_tweets}; self.written = self.carried_over = len(kept_tweets)
+            print(f"Continuing {self.filename} with {len(kept_tweets)} tweets from an earlier run.")
+
+    def write(self, tweet):
+        if tweet["rest_id"] in self._seen_ids: return
+        if self._file is None: self._file = open_tweets_text(self.filename, "at")
+        self._file.write(json.dumps(tweet, ensure_ascii=False) + "\n")
+        self._seen_ids.add(tweet["rest_id"]); self.written += 1
+
+    def flush(self):
+        if self._file: self._file.flush()
+
+    def close(self):
+        if self._file:
+            try: self._file.close()
+            except Exception as e_close: print(f"Error closing {self.filename}: {e_close}")
+            self._file = None
+
+    def newest_tweets(self, limit):
+        """The newest limit tweets of the partial file (earlier runs' and this run's), by id."""
+        self.close()
+        tweets = (tweet for tweet in iter_stored_tweets(self.filename) if "rest_id" in tweet) if os.path.exists(self.filename) else ()
+        return sorted(tweets, key=lambda tweet: int(tweet["rest_id"]), reverse=True)[:limit]
+
+    def promote(self, tweets):
+        """Moves the partial file into place as the final tweets file if it holds exactly tweets. False if nothing was
+        streamed, the file continues an earlier run, or retried attempts left other tweets in it; the caller then writes
+        tweets itself, so the file always matches what is stored and analyzed."""
+        self.close()
+        if not os.path.exists(self.filename) or self.carried_over or self._seen_ids != {tweet["rest_id"] for tweet in tweets}: return False
+        os.replace(self.filename, self.final_filename); return True
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.filename): os.remove(self.filename)
+
+_tweet_sinks = {} # profile url -> TweetSink of the user being scraped; add_new_tweets looks sinks up by url
+
+def open_tweet_sink(url, tweets_filename):
+    if not STREAM_TWEETS_NDJSON: return None
+    _tweet_sinks[url] = TweetSink(tweets_filename)
+    return _tweet_sinks[url]
+
+def close_tweet_sink(url):
+    sink = _tweet_sinks.pop(url, None)
+    if sink: sink.close()
+    return sink
+
+def returnValueFromData(data_dict, key_path, default=None):
+    return value_at_path(data_dict, compile_key_path(key_path), default)
+
+def compile_key_path(key_path):
+    """Parses a dotted key path once into (key, list_index) steps; list_index is None for non-numeric parts."""
+    return tuple((key_part, int(key_part) if key_part.isdigit() else None) for key_part in key_path.split('.'))
+
+def value_at_path(data_dict, compiled_path, default=None):
+    temp = data_dict
+    for key_part, list_index in compiled_path:
+        if type(temp) is dict: # Fast path: parsed JSON only ever holds plain dicts/lists
+            if key_part not in temp: return default
+            temp = temp[key_part]
+        elif isinstance(temp, list) and list_index is not None and list_index < len(temp): temp = temp[list_index]
+        elif isinstance(temp, dict) and key_part in temp: temp = temp[key_part]
+        else: return default
+    return temp
+
+tweet_key_to_key_mapping = {"tweet_id": "rest_id", "created_at": "legacy.created_at", "favorite_count": "legacy.favorite_count","full_text_legacy": "legacy.full_text", "full_text_note": "note_tweet.note_tweet_results.result.text","quote_count": "legacy.quote_count", "reply_count": "legacy.reply_count", "retweet_count": "legacy.retweet_count","bookmark_count": "legacy.bookmark_count", "views_count": "views.count", "lang": "legacy.lang","user_id_str": "core.user_results.result.rest_id", "name": "core.user_results.result.legacy.name","screen_name": "core.user_results.result.legacy.screen_name", "followers_count": "core.user_results.result.legacy.followers_count","is_blue_verified": "core.user_results.result.is_blue_verified"}
+profile_key_to_key_mapping = {"user_id": "rest_id", "screen_name": "legacy.screen_name", "name": "legacy.name", "description": "legacy.description", "location": "legacy.location", "created_at": "legacy.created_at","followers_count": "legacy.followers_count", "friends_count": "legacy.friends_count", "statuses_count": "legacy.statuses_count", "favourites_count": "legacy.favourites_count","listed_count": "legacy.listed_count", "media_count": "legacy.media_count", "protected": "legacy.protected", "verified": "legacy.verified", "is_blue_verified": "is_blue_verified"}
+compiled_tweet_key_paths = {key: compile_key_path(json_path) for key, json_path in tweet_key_to_key_mapping.items()}
+compiled_profile_key_paths = {key: compile_key_path(json_path) for key, json_path in profile_key_to_key_mapping.items()}
+
+def flatten_tweet(tweet_data):
+    """One tweet_key_to_key_mapping row for a raw tweet; full_text prefers the long-form note text."""
+    tweet_json = {key: value_at_path(tweet_data, compiled_path) for key, compiled_path in compiled_tweet_key_paths.items()}
+    note_text = tweet_json.pop("full_text_note"); legacy_text = tweet_json.pop("full_text_legacy")
+    tweet_json["full_text"] = note_text or legacy_text
+    return tweet_json
+
+def build_path_tree(compiled_paths, column_appenders):
+    """Merges compiled paths into a prefix tree so shared prefixes (legacy.*, core.user_results.result.*) are walked once
+    per tweet. Nodes are lists of (key, list_index, child_node, appenders_below, leaf_appenders)."""
+    root = {}
+    for key, compiled_path in compiled_paths.items():
+        node = root
+        for depth, step in enumerate(compiled_path):
+            entry = node.setdefault(step, {"children": {}, "below": [], "leaf": []})
+            entry["below"].append(column_appenders[key])
+            if depth == len(compiled_path) - 1: entry["leaf"].append(column_appenders[key])
+            node = entry["children"]
+    def freeze(node): return [(key_part, list_index, freeze(entry["children"]), entry["below"], entry["leaf"]) for (key_part, list_index), entry in node.items()]
+    return freeze(root)
+
+def _fill_from_path_tree(value, path_tree):
+    for key_part, list_index, child_tree, appenders_below, leaf_appenders in path_tree:
+        if type(value) is dict or isinstance(value, dict):
+            if key_part not in value:
+                for append_value in appenders_below: append_value(None)
+                continue
+            child_value = value[key_part]
+        elif isinstance(value, list) and list_index is not None and list_index < len(value): child_value = value[list_index]
+        else:
+            for append_value in appenders_below: append_value(None)
+            continue
+        for append_value in leaf_appenders: append_value(child_value)
+        if child_tree: _fill_from_path_tree(child_value, child_tree)
+
+def extract_tweet_columns(tweets):
+    """Flattens tweets (any iterable, consumed once) into {column: [values]} in the same column order as flatten_tweet,
+    so the DataFrame is built from column arrays instead of one dict per tweet."""
+    tweet_columns = {key: [] for key in compiled_tweet_key_paths}
+    path_tree = build_path_tree(compiled_tweet_key_paths, {key: tweet_columns[key].append for key in tweet_columns})
+    for tweet_data in tweets: _fill_from_path_tree(tweet_data, path_tree)
+    note_texts = tweet_columns.pop("full_text_note"); legacy_texts = tweet_columns.pop("full_text_legacy")
+    tweet_columns["full_text"] = [note_text or legacy_text for note_text, legacy_text in zip(note_texts, legacy_texts)]
+    return tweet_columns
+
+ENGAGEMENT_COLUMNS = ['favorite_count', 'retweet_count', 'reply_count']
+NUMERIC_TWEET_COLUMNS = ['favorite_count', 'retweet_count', 'reply_count', 'quote_count', 'bookmark_count', 'followers_count', 'views_count']
+
+def add_engagement_columns(tweets_df):
+    """Coerces the numeric columns and adds the above-average flags and overall averages in place.
+    Returns (rows used for the averages, averages Series), or (empty frame, None) if no row has all engagement counts."""
+    tweets_df[NUMERIC_TWEET_COLUMNS] = tweets_df[NUMERIC_TWEET_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    tweets_df_for_avg = tweets_df.dropna(subset=ENGAGEMENT_COLUMNS)
+    if tweets_df_for_avg.empty: return tweets_df_for_avg, None
+    averages = tweets_df_for_avg[ENGAGEMENT_COLUMNS].mean()
+    above_average = tweets_df[ENGAGEMENT_COLUMNS].gt(averages) # NaN counts compare False, as with the scalar >
+    tweets_df['above_avg_favorite'] = above_average['favorite_count']; tweets_df['above_avg_retweet'] = above_average['retweet_count']; tweets_df['above_avg_reply'] = above_average['reply_count']
+    tweets_df['above_average_engagement'] = above_average.any(axis=1)
+    tweets_df['average_favorite_count_overall'] = averages['favorite_count']; tweets_df['average_retweet_count_overall'] = averages['retweet_count']; tweets_df['average_reply_count_overall'] = averages['reply_count']
+    return tweets_df_for_avg, averages
+
 def analyze_and_save_tweets(json_filename, output_dir):
-    def returnValueFromData(data_dict, key_path, default=None):
-        temp = data_dict;
-        for key_part in key_path.split('.'):
-            if isinstance(temp, dict) and key_part in temp: temp = temp[key_part]
-            elif isinstance(temp, list) and key_part.isdigit() and int(key_part) < len(temp): temp = temp[int(key_part)]
-            else: return default
-        return temp
-    try:
-        with open(json_filename, "r", encoding="utf-8") as json_file: data_tweets = json.load(json_file)
-    except (FileNotFoundError, json.JSONDecodeError) as e: print(f"Error loading JSON {json_filename}: {e}"); return
-    if not data_tweets: print(f"No tweets in {json_filename}"); return
-    tweet_key_to_key_mapping = {"tweet_id": "rest_id", "created_at": "legacy.created_at", "favorite_count": "legacy.favorite_count","full_text_legacy": "legacy.full_text", "full_text_note": "note_tweet.note_tweet_results.result.text","quote_count": "legacy.quote_count", "reply_count": "legacy.reply_count", "retweet_count": "legacy.retweet_count","bookmark_count": "legacy.bookmark_count", "views_count": "views.count", "lang": "legacy.lang","user_id_str": "core.user_results.result.rest_id", "name": "core.user_results.result.legacy.name","screen_name": "core.user_results.result.legacy.screen_name", "followers_count": "core.user_results.result.legacy.followers_count","is_blue_verified": "core.user_results.result.is_blue_verified"}
-    tweets_list = []
-    for tweet_data in data_tweets:
-        tweet_json = {};
-        for key, json_path in tweet_key_to_key_mapping.items(): tweet_json[key] = returnValueFromData(tweet_data, json_path)
-        tweet_json["full_text"] = tweet_json.get("full_text_note") or tweet_json.get("full_text_legacy")
-        if "full_text_note" in tweet_json: del tweet_json["full_text_note"]
-        if "full_text_legacy" in tweet_json: del tweet_json["full_text_legacy"]
-        tweets_list.append(tweet_json)
-    tweets_df = pd.DataFrame(tweets_list)
+    """Writes <base>_analyzed.csv (or _analyzed_raw.csv without engagement counts) next to the tweets and returns the
+    analyzed DataFrame, or None if the file holds no tweets."""
+    try: tweet_columns = extract_tweet_columns(iter_stored_tweets(json_filename)) # Raw tweets are streamed; only the columns are kept
+    except (FileNotFoundError, json.JSONDecodeError) as e: print(f"Error loading tweets {json_filename}: {e}"); return
+    if not tweet_columns["tweet_id"]: print(f"No tweets in {json_filename}"); return
+    tweets_df = pd.DataFrame(tweet_columns)
     if tweets_df.empty: print(f'No valid tweet data in {json_filename}'); return
-    numeric_cols = ['favorite_count', 'retweet_count', 'reply_count', 'quote_count', 'bookmark_count', 'followers_count', 'views_count']
-    for col in numeric_cols: tweets_df[col] = pd.to_numeric(tweets_df[col], errors='coerce')
-    tweets_df_for_avg = tweets_df.dropna(subset=['favorite_count', 'retweet_count', 'reply_count'])
-    if tweets_df_for_avg.empty:
+    tweets_df_for_avg, averages = add_engagement_columns(tweets_df)
+    if averages is None:
         print(f'Not enough numeric data for analysis in {json_filename}.')
         if not tweets_df.empty:
-            base_filename = os.path.splitext(os.path.basename(json_filename))[0]; csv_filename = os.path.join(output_dir, f"{base_filename}_analyzed_raw.csv")
+            base_filename = tweets_base_filename(json_filename); csv_filename = os.path.join(output_dir, f"{base_filename}_analyzed_raw.csv")
             tweets_df.to_csv(csv_filename, index=False, encoding="utf-8-sig"); print(f"Saved raw data to {csv_filename}.")
-        return
-    avg_favorite = tweets_df_for_avg['favorite_count'].mean(); avg_retweet = tweets_df_for_avg['retweet_count'].mean(); avg_reply = tweets_df_for_avg['reply_count'].mean()
-    tweets_df['above_avg_favorite'] = tweets_df['favorite_count'] > avg_favorite; tweets_df['above_avg_retweet'] = tweets_df['retweet_count'] > avg_retweet; tweets_df['above_avg_reply'] = tweets_df['reply_count'] > avg_reply
-    tweets_df['above_average_engagement'] = (tweets_df['above_avg_favorite'] | tweets_df['above_avg_retweet'] | tweets_df['above_avg_reply'])
-    tweets_df['average_favorite_count_overall'] = avg_favorite; tweets_df['average_retweet_count_overall'] = avg_retweet; tweets_df['average_reply_count_overall'] = avg_reply
-    base_filename = os.path.splitext(os.path.basename(json_filename))[0]; csv_filename = os.path.join(output_dir, f"{base_filename}_analyzed.csv")
+        return tweets_df
+    avg_favorite, avg_retweet, avg_reply = averages['favorite_count'], averages['retweet_count'], averages['reply_count']
+    base_filename = tweets_base_filename(json_filename); csv_filename = os.path.join(output_dir, f"{base_filename}_analyzed.csv")
     tweets_df.to_csv(csv_filename, index=False, encoding="utf-8-sig"); print(f"Analyzed data saved to {csv_filename}")
     print(f"\n--- Analysis Summary for {json_filename} ---\nTotal: {len(tweets_df)}, Used for avg: {len(tweets_df_for_avg)}")
     print(f"Avg Fav: {avg_favorite:.2f}, Avg RT: {avg_retweet:.2f}, Avg Reply: {avg_reply:.2f}, Above Avg Engage: {tweets_df['above_average_engagement'].sum()}")
+    return tweets_df
+
+
+# --- Normalized SQLite store (TWEET_STORE_DB) ---
+TWEET_STORE_INTEGER_COLUMNS = {"favorite_count", "quote_count", "reply_count", "retweet_count", "bookmark_count", "views_count", "followers_count", "friends_count",
+                               "statuses_count", "favourites_count", "listed_count", "media_count", "protected", "verified", "is_blue_verified"}
+
+def _store_value(column, value):
+    if column not in TWEET_STORE_INTEGER_COLUMNS or value is None: return value
+    try: return int(value) # views.count arrives as a string; booleans become 0/1
+    except (TypeError, ValueError): return None
+
+class TweetStore:
+    """One SQLite database holding the flattened tweet_key_to_key_mapping / profile_key_to_key_mapping columns of every
+    scraped user. Rows are upserted in batches keyed on rest_id, so reruns and overlapping scrapes never duplicate a
+    tweet; later scrapes refresh its counts. Safe to share between worker threads, and between the worker processes of
+    a WORK_QUEUE_DB run (writers wait for each other's transactions)."""
+    def __init__(self, db_filename, keep_raw=False):
+        self.db_filename = db_filename; self.keep_raw = keep_raw
+        self.tweet_columns = [key for key in flatten_tweet({})]
+        self.profile_columns = list(profile_key_to_key_mapping)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_filename, check_same_thread=False, timeout=60) # Other WORK_QUEUE_DB workers may hold the write lock
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL") # Readers can query while a run is writing
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS tweets (tweet_id TEXT PRIMARY KEY, {', '.join(self._column_ddl(self.tweet_columns[1:]))}, scraped_at REAL, raw TEXT)")
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS profiles (user_id TEXT PRIMARY KEY, {', '.join(self._column_ddl(self.profile_columns[1:]))}, scraped_at REAL, raw TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS tweets_screen_name ON tweets (screen_name)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS tweets_user_id ON tweets (user_id_str)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS profiles_screen_name ON profiles (screen_name)")
+
+    @staticmethod
+    def _column_ddl(columns):
+        return [f"{column} {'INTEGER' if column in TWEET_STORE_INTEGER_COLUMNS else 'TEXT'}{' COLLATE NOCASE' if column == 'screen_name' else ''}" for column in columns]
+
+    def _upsert(self, table, columns, rows):
+        all_columns = columns + ["scraped_at", "raw"]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in all_columns[1:] if column != "raw" or self.keep_raw)
+        statement = f"INSERT INTO {table} ({', '.join(all_columns)}) VALUES ({', '.join('?' for _ in all_columns)}) ON CONFLICT({columns[0]}) DO UPDATE SET {updates}"
+        with self._lock, self._connection: # One transaction per call
+            for batch_start in range(0, len(rows), TWEET_STORE_BATCH_SIZE):
+                self._connection.executemany(statement, rows[batch_start:batch_start + TWEET_STORE_BATCH_SIZE])
+        return len(rows)
+
+    def upsert_tweets(self, tweets):
+        scraped_at = time.time(); rows = []
+        for tweet_data in tweets:
+            tweet_row = flatten_tweet(tweet_data)
+            if not tweet_row["tweet_id"]: continue
+            rows.append([_store_value(column, tweet_row[column]) for column in self.tweet_columns] + [scraped_at, json.dumps(tweet_data, ensure_ascii=False) if self.keep_raw else None])
+        return self._upsert("tweets", self.tweet_columns, rows)
+
+    def upsert_profile(self, profile_data):
+        if not profile_data or not profile_data.get("rest_id"): return 0
+        row = [_store_value(column, value_at_path(profile_data, compiled_path)) for column, compiled_path in compiled_profile_key_paths.items()]
+        return self._upsert("profiles", self.profile_columns, [row + [time.time(), json.dumps(profile_data, ensure_ascii=False) if self.keep_raw else None]])
+
+    def close(self):
+        with self._lock: self._connection.close()
+
+_tweet_store = None
+_tweet_store_lock = threading.Lock()
+
+def tweet_store():
+    """The shared TweetStore for TWEET_STORE_DB, opened on first use; None when the store is disabled."""
+    global _tweet_store
+    if not TWEET_STORE_DB: return None
+    with _tweet_store_lock:
+        if _tweet_store is None: _tweet_store = TweetStore(TWEET_STORE_DB, TWEET_STORE_KEEP_RAW)
+        return _tweet_store
+
+def store_user_results(sanitized_username, tweets_data, profile_data):
+    store = tweet_store()
+    if not store: return
+    try:
+        stored_tweets = store.upsert_tweets(tweets_data or []); stored_profiles = store.upsert_profile(profile_data)
+        print(f"Stored {stored_tweets} tweets and {stored_profiles} profile rows for {sanitized_username} in {TWEET_STORE_DB}.")
+    except sqlite3.Error as e_store: print(f"Error writing {sanitized_username} to {TWEET_STORE_DB}: {e_store}")
+
+
+# --- Shared bookkeeping (safe to call from concurrent workers) ---
+_worker_status_lock = threading.Lock()
+_worker_status = {} # worker_id -> {"username": ..., "state": ..., "processed": int, "outcomes": {outcome: count}}
+
+class ProblematicUsernames:
+    """Exact-match, case-folded index of PROBLEMATIC_USERNAMES_FILE, loaded once and kept in sync with the file.
+
+    The file stays append-only: "name" (legacy) or "name<TAB>added_epoch" marks a user, "-name<TAB>epoch" clears it.
+    Lines appended by other processes are picked up by reading only the new tail. With a TTL, entries older than
+    ttl_days are no longer treated as problematic so the account is re-checked; legacy lines without a timestamp
+    count as expired."""
+    def __init__(self, filename, ttl_days=None):
+        self.filename = filename; self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self._lock = threading.Lock()
+        self._added_at = {} # casefolded username -> epoch seconds (0 for legacy lines)
+        self._read_offset = 0
+        self._file_id = None # (st_dev, st_ino, st_mtime_ns) of the file when the index was last read
+        self._last_line = b"" # Last line read, which must still end at _read_offset if the file was only appended to
+
+    @staticmethod
+    def _key(username):
+        return username.strip().lstrip('@').casefold()
+
+    def _reset(self):
+        self._added_at = {}; self._read_offset = 0; self._file_id = None; self._last_line = b""
+
+    def _refresh(self):
+        try: stat = os.stat(self.filename)
+        except OSError: # No file (yet, or it was deleted)
+            if self._read_offset: self._reset()
+            return
+        if self._file_id is not None and (self._file_id[:2] != (stat.st_dev, stat.st_ino) or stat.st_size < self._read_offset): self._reset() # Replaced or truncated
+        if stat.st_size == self._read_offset:
+            if self._file_id is None or self._file_id[2] == stat.st_mtime_ns: return
+            self._reset() # Rewritten in place to the same size
+        with open(self.filename, "rb") as f: # Binary, so the offset is exact for CRLF files too
+            if self._read_offset:
+                f.seek(self._read_offset - len(self._last_line))
+                if f.read(len(self._last_line)) != self._last_line: self._reset(); f.seek(0) # Rewritten in place
+            initial_load = self._read_offset == 0; self._file_id = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+            for raw_line in f:
+                if not raw_line.endswith(b"\n") and not initial_load: break # Half-written line; picked up next time
+                self._read_offset += len(raw_line); self._last_line = raw_line
+                name, _, added_at = raw_line.decode("utf-8", errors="replace").strip().partition("\t")
+                if not name: continue
+                if name.startswith("-"): self._added_at.pop(self._key(name[1:]), None); continue
+                try: self._added_at[self._key(name)] = float(added_at) if added_at else 0.0
+                except ValueError: self._added_at[self._key(name)] = 0.0
+
+    def _is_active(self, key):
+        added_at = self._added_at.get(key)
+        if added_at is None: return False
+        return self.ttl_seconds is None or time.time() - added_at < self.ttl_seconds
+
+    def __contains__(self, username):
+        with self._lock:
+            self._refresh()
+            return self._is_active(self._key(username))
+
+    def is_expired(self, username):
+        """True if the user is listed but its TTL has run out, i.e. it is due for a re-check."""
+        with self._lock:
+            self._refresh()
+            key = self._key(username)
+            return key in self._added_at and not self._is_active(key)
+
+    def _append(self, line):
+        with open(self.filename, "a+", encoding="utf-8") as puf:
+            if puf.tell() > 0:
+                puf.seek(puf.tell() - 1)
+                if puf.read(1) != "\n": line = "\n" + line # Hand-edited file without a trailing newline
+            puf.write(line + "\n")
+        self._refresh() # Advance past our own line
+
+    def add(self, username):
+        """Marks username as problematic unless it already is (and not expired). Returns True if it was added."""
+        with self._lock:
+            self._refresh()
+            if self._is_active(self._key(username)): return False
+            self._append(f"{username}\t{int(time.time())}")
+            return True
+
+    def remove(self, username):
+        """Clears a listing (e.g. after an expired entry re-checked fine). Returns True if one was removed."""
+        with self._lock:
+            self._refresh()
+            if self._key(username) not in self._added_at: return False
+            self._append(f"-{username}\t{int(time.time())}")
+            return True
+
+_problematic_usernames = None
+_problematic_usernames_init_lock = threading.Lock()
+
+def problematic_usernames():
+    global _problematic_usernames
+    with _problematic_usernames_init_lock:
+        if _problematic_usernames is None: _problematic_usernames = ProblematicUsernames(PROBLEMATIC_USERNAMES_FILE, PROBLEMATIC_USERNAME_TTL_DAYS)
+        return _problematic_usernames
+
+def is_username_problematic(username):
+    return username in problematic_usernames()
+
+def mark_username_problematic(username):
+    """Records username in the problematic file unless already listed. Returns True if it was added."""
+    return problematic_usernames().add(username)
+
+class RunJournal:
+    """Append-only JSONL journal of per-user progress (pending, tweets_done/profile_done flags, completed, problematic,
+    rate_limited). Each line is the full entry for one user after an update, so the last line per user wins; a torn
+    final line from a crash is ignored. Entries are held in a dict for O(1) lookups."""
+    FINISHED_STATES = ("completed", "problematic")
+
+    def __init__(self, journal_filename):
+        self.journal_filename = journal_filename
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(journal_filename):
+            with open(journal_filename, "r", encoding="utf-8") as f:
+                for line in f:
+                    try: entry = json.loads(line)
+                    except json.JSONDecodeError: continue # Partially written last line
+                    if isinstance(entry, dict) and entry.get("username"): self._entries[entry["username"]] = entry
+            self._compact()
+
+    def _compact(self):
+        temp_filename = self.journal_filename + ".tmp"
+        with open(temp_filename, "w", encoding="utf-8") as f:
+            for entry in self._entries.values(): f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush(); os.fsync(f.fileno())
+        os.replace(temp_filename, self.journal_filename)
+
+    def entry(self, username):
+        with self._lock: return dict(self._entries.get(username, {}))
+
+    def is_finished(self, username):
+        with self._lock: return self._entries.get(username, {}).get("state") in self.FINISHED_STATES
+
+    def record(self, username, state, **flags):
+        with self._lock:
+            entry = dict(self._entries.get(username, {"username": username}))
+            entry.update(flags); entry["state"] = state; entry["updated_at"] = time.time()
+            self._entries[username] = entry
+            with open(self.journal_filename, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n"); f.flush(); os.fsync(f.fileno())
+
+    def archive(self):
+        with self._lock:
+            if os.path.exists(self.journal_filename):
+                archived_filename = f"{self.journal_filename}.{time.strftime('%Y%m%d-%H%M%S')}"
+                os.replace(self.journal_filename, archived_filename); print(f"Run complete. Journal archived to {archived_filename}.")
+            self._entries = {}
+
+_run_journal = None # Set by main() when RESUME_FROM_JOURNAL is enabled
+
+class WorkQueue:
+    """Shared SQLite work queue of a WORK_QUEUE_DB run, one row per user (pending, leased, done or failed). claim()
+    picks the first pending user, or one whose lease expired because its worker died, inside a BEGIN IMMEDIATE
+    transaction, so two workers can never lease the same user. A heartbeat thread renews every lease this process holds;
+    complete() only records an outcome while the lease is still ours. Connections are opened per call, so one instance
+    is safe to share between worker threads."""
+    FINISHED_OUTCOMES = ("completed", "partial", "problematic")
+
+    def __init__(self, db_filename, lease_seconds=900, max_attempts=3, worker_name=None):
+        self.db_filename = db_filename; self.lease_seconds = lease_seconds; self.max_attempts = max_attempts
+        self.worker_name = worker_name or f"{socket.gethostname()}:{os.getpid()}"
+        self._heartbeat_stop = threading.Event(); self._heartbeat_thread = None
+        with self._transaction() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS work_queue (username TEXT PRIMARY KEY, position INTEGER NOT NULL, state TEXT NOT NULL DEFAULT 'pending', "
+                               "worker TEXT, lease_expires_at REAL, attempts INTEGER NOT NULL DEFAULT 0, outcome TEXT, updated_at REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS work_queue_claim ON work_queue (state, position)")
+        with contextlib.closing(sqlite3.connect(db_filename, timeout=60)) as connection: connection.execute("PRAGMA journal_mode=WAL")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        connection = sqlite3.connect(self.db_filename, timeout=60, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE") # Write lock up front: a claim's SELECT and UPDATE must not interleave with another worker's
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction: connection.execute("ROLLBACK")
+            raise
+        finally: connection.close()
+
+    def seed(self, usernames, requeue=False):
+        """Appends usernames not queued yet, in the given order. With requeue, users already done or failed go back to
+        pending (attempts reset) in that order too, for a new round. Returns how many users became pending."""
+        now = time.time()
+        with self._transaction() as connection:
+            next_position = connection.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM work_queue").fetchone()[0]
+            changes_before = connection.total_changes
+            for offset, username in enumerate(usernames):
+                connection.execute("INSERT INTO work_queue (username, position, updated_at) VALUES (?, ?, ?) ON CONFLICT(username) DO "
+                                   + ("UPDATE SET state = 'pending', position = excluded.position, attempts = 0, worker = NULL, outcome = NULL, updated_at = excluded.updated_at WHERE state IN ('done', 'failed')" if requeue else "NOTHING"),
+                                   (username, next_position + offset, now))
+            return connection.total_changes - changes_before
+
+    def claim(self):
+        """Leases the next user to this worker. Returns (position, username), or None when nothing is claimable."""
+        now = time.time()
+        with self._transaction() as connection:
+            while True:
+                row = connection.execute("SELECT username, position, state, worker, attempts FROM work_queue WHERE state = 'pending' OR (state = 'leased' AND lease_expires_at < ?) "
+                                         "ORDER BY position LIMIT 1", (now,)).fetchone()
+                if row is None: return None
+                username, position, state, previous_worker, attempts = row
+                if state == "leased": print(f"Work queue: lease of {previous_worker} on {username} expired; reclaiming it.")
+                if attempts >= self.max_attempts:
+                    print(f"Work queue: {username} was claimed {attempts} times without finishing; marking it failed.")
+                    connection.execute("UPDATE work_queue SET state = 'failed', outcome = 'max_attempts', worker = NULL, updated_at = ? WHERE username = ?", (now, username))
+                    continue
+                connection.execute("UPDATE work_queue SET state = 'leased', worker = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ? WHERE username = ?",
+                                   (self.worker_name, now + self.lease_seconds, now, username))
+                return position, username
+
+    def renew(self):
+        """Extends every lease this worker holds; called by the heartbeat thread."""
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute("UPDATE work_queue SET lease_expires_at = ?, updated_at = ? WHERE worker = ? AND state = 'leased'", (now + self.lease_seconds, now, self.worker_name))
+
+    def complete(self, username, outcome):
+        """Finished outcomes mark the user done; anything else returns it to pending for another claim (failed once it
+        has used up max_attempts). Ignored with a note if our lease expired and another worker took the user meanwhile."""
+        with self._transaction() as connection:
+            row = connection.execute("SELECT attempts FROM work_queue WHERE username = ? AND worker = ? AND state = 'leased'", (username, self.worker_name)).fetchone()
+            if row is None: print(f"Work queue: lease on {username} was lost before it finished ({outcome}); the worker holding it now records the result."); return
+            state = "done" if outcome in self.FINISHED_OUTCOMES else "failed" if row[0] >= self.max_attempts else "pending"
+            # A retried user goes to the back, so the next claim does not pick it straight up again
+            connection.execute("UPDATE work_queue SET state = ?, outcome = ?, worker = NULL, lease_expires_at = NULL, updated_at = ?, "
+                               "position = CASE WHEN ? = 'pending' THEN (SELECT MAX(position) + 1 FROM work_queue) ELSE position END WHERE username = ?",
+                               (state, outcome, time.time(), state, username))
+
+    def release_leases(self):
+        """Returns this worker's unfinished users to pending (not counted as an attempt), e.g. on Ctrl+C."""
+        with self._transaction() as connection:
+            released = connection.execute("UPDATE work_queue SET state = 'pending', worker = NULL, lease_expires_at = NULL, attempts = MAX(attempts - 1, 0), updated_at = ? "
+                                          "WHERE worker = ? AND state = 'leased'", (time.time(), self.worker_name)).rowcount
+        if released: print(f"Work queue: released {released} unfinished leases.")
+
+    def requeue_failed(self):
+        with self._transaction() as connection:
+            return connection.execute("UPDATE work_queue SET state = 'pending', attempts = 0, outcome = NULL, updated_at = ? WHERE state = 'failed'", (time.time(),)).rowcount
+
+    def claimable_usernames(self):
+        with contextlib.closing(sqlite3.connect(self.db_filename, timeout=60)) as connection:
+            return [row[0] for row in connection.execute("SELECT username FROM work_queue WHERE state = 'pending' OR (state = 'leased' AND lease_expires_at < ?) ORDER BY position", (time.time(),))]
+
+    def status(self):
+        """{"states": {state: count}, "leases": {worker: [live, expired]}}."""
+        now = time.time()
+        with contextlib.closing(sqlite3.connect(self.db_filename, timeout=60)) as connection:
+            states = dict(connection.execute("SELECT state, COUNT(*) FROM work_queue GROUP BY state").fetchall())
+            leases = {worker: [live, expired] for worker, live, expired in connection.execute(
+                "SELECT worker, SUM(lease_expires_at >= ?), SUM(lease_expires_at < ?) FROM work_queue WHERE state = 'leased' GROUP BY worker", (now, now))}
+        return {"states": states, "leases": leases}
+
+    def describe(self):
+        status = self.status()
+        expired = sum(expired for _, expired in status["leases"].values())
+        return (f"{', '.join(f'{state}={count}' for state, count in sorted(status['states'].items())) or 'empty'}"
+                f"{f' ({expired} expired leases; any worker reclaims them)' if expired else ''}")
+
+    def start_heartbeat(self, interval_seconds):
+        def beat():
+            while not self._heartbeat_stop.wait(interval_seconds):
+                try: self.renew()
+                except sqlite3.Error as e_renew: print(f"Work queue heartbeat failed: {e_renew}")
+        self._heartbeat_thread = threading.Thread(target=beat, name="work-queue-heartbeat", daemon=True); self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        self._heartbeat_stop.set()
+        if self._heartbeat_thread: self._heartbeat_thread.join(timeout=5)
+
+class WorkQueueFeed:
+    """queue.Queue stand-in handed to the scrape workers in WORK_QUEUE_DB mode: get_nowait() claims the next user and
+    returns (claims made by this process so far - 1, username); the queue position is not a progress count once users
+    are requeued or seeded again."""
+    def __init__(self, work_queue): self.work_queue = work_queue; self.claimed = 0; self._lock = threading.Lock()
+    def get_nowait(self):
+        claimed = self.work_queue.claim()
+        if claimed is None: raise queue.Empty
+        with self._lock: self.claimed += 1; return self.claimed - 1, claimed[1]
+    def empty(self): return not self.work_queue.claimable_usernames()
+    def task_done(self): pass
+
+_work_queue = None # Set by main() when WORK_QUEUE_DB is configured
+
+def user_progress(user_index, total_users):
+    """"3/20", or "claim 3" in work queue mode, where the number of users this process will get is unknown."""
+    return f"{user_index + 1}/{total_users}" if total_users else f"claim {user_index + 1}"
+
+def journal_entry(username):
+    return _run_journal.entry(username) if _run_journal else {}
+
+def journal_record(username, state, **flags):
+    if _run_journal: _run_journal.record(username, state, **flags)
+
+def set_worker_status(worker_id, username, state, outcome=None):
+    with _worker_status_lock:
+        status = _worker_status.setdefault(worker_id, {"username": None, "state": "idle", "processed": 0, "outcomes": {}})
+        status["username"] = username; status["state"] = state
+        if outcome:
+            status["processed"] += 1; status["outcomes"][outcome] = status["outcomes"].get(outcome, 0) + 1
+    print(f"[Worker {worker_id}] {username}: {state}")
+
+_current_user_metrics = contextvars.ContextVar("current_user_metrics", default=None) # Per thread (sync) / per task (async)
+
+class ScrapeMetrics:
+    """Run-wide counters and per-phase timers. Time and counts are also attributed to the user the current worker thread
+    or asyncio task is processing (see start_user), which yields one JSON log line per user. Phases measure wall time, so
+    with several workers the phase totals are worker-seconds and can exceed the run's wall time."""
+    SLEEP_PHASES = ("rate_limit_wait", "retry_sleep", "inter_user_delay")
+
+    def __init__(self, log_filename=None, prometheus_filename=None):
+        self.log_filename = log_filename; self.prometheus_filename = prometheus_filename
+        self._lock = threading.Lock(); self.started_at = time.time()
+        self.counters = collections.Counter() # (name, ((label, value), ...)) -> total
+        self.phase_seconds = collections.Counter(); self.phase_calls = collections.Counter()
+        self.user_outcomes = collections.Counter(); self.user_seconds = 0.0
+
+    def count(self, name, value=1, **labels):
+        with self._lock: self.counters[(name, tuple(sorted(labels.items())))] += value
+        user_metrics = _current_user_metrics.get()
+        if user_metrics is not None: user_metrics["counters"][name] = user_metrics["counters"].get(name, 0) + value
+
+    def add_phase(self, phase, seconds):
+        with self._lock: self.phase_seconds[phase] += seconds; self.phase_calls[phase] += 1
+        user_metrics = _current_user_metrics.get()
+        if user_metrics is not None: user_metrics["phases"][phase] = user_metrics["phases"].get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        """Times the enclosed block (including any awaits inside it) as one call of phase."""
+        start_time = time.perf_counter()
+        try: yield
+        finally: self.add_phase(phase, time.perf_counter() - start_time)
+
+    def counter_total(self, name, counters=None):
+        if counters is None:
+            with self._lock: return sum(value for (counter_name, _), value in self.counters.items() if counter_name == name)
+        return counters.get(name, 0)
+
+    def log_event(self, event, **fields):
+        if not self.log_filename: return
+        line = json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str)
+        with self._lock:
+            with open(self.log_filename, "a", encoding="utf-8") as f: f.write(line + "\n")
+
+    def start_user(self, username):
+        """Makes username the current user of this thread/task; returns the record to pass to finish_user."""
+        user_metrics = {"user": username, "started_at": time.time(), "phases": {}, "counters": {}}
+        _current_user_metrics.set(user_metrics)
+        return user_metrics
+
+    def finish_user(self, user_metrics, outcome):
+        _current_user_metrics.set(None)
+        seconds = time.time() - user_metrics["started_at"]; counters = user_metrics["counters"]
+        with self._lock: self.user_outcomes[outcome] += 1; self.user_seconds += seconds
+        sleeping_seconds = sum(user_metrics["phases"].get(phase, 0.0) for phase in self.SLEEP_PHASES)
+        tweets = counters.get("tweets_collected", 0)
+        self.log_event("user_done", user=user_metrics["user"], outcome=outcome, seconds=round(seconds, 3), tweets=tweets,
+                       tweets_per_second=round(tweets / seconds, 3) if seconds else None, graphql_responses=counters.get("graphql_responses", 0),
+                       http_429=counters.get("http_429", 0), retries=counters.get("retries", 0), sleeping_seconds=round(sleeping_seconds, 3),
+                       working_seconds=round(seconds - sleeping_seconds, 3), phases={phase: round(value, 3) for phase, value in sorted(user_metrics["phases"].items())})
+        self.write_prometheus()
+
+    def summary(self):
+        """Run totals as a dict (also logged as the run_summary event)."""
+        wall_seconds = time.time() - self.started_at
+        with self._lock:
+            phase_seconds = dict(self.phase_seconds); phase_calls = dict(self.phase_calls); user_outcomes = dict(self.user_outcomes); user_seconds = self.user_seconds
+            labelled_counters = {f"{name}{{{','.join(f'{label}={value}' for label, value in labels)}}}" if labels else name: value for (name, labels), value in sorted(self.counters.items())}
+        sleeping_seconds = sum(phase_seconds.get(phase, 0.0) for phase in self.SLEEP_PHASES)
+        worker_seconds = user_seconds + phase_seconds.get("inter_user_delay", 0.0)
+        users = sum(user_outcomes.values()); tweets = self.counter_total("tweets_collected")
+        return {"wall_seconds": round(wall_seconds, 3), "users": users, "outcomes": user_outcomes, "tweets": tweets,
+                "tweets_per_second": round(tweets / wall_seconds, 3) if wall_seconds else None,
+                "graphql_responses_per_user": round(self.counter_total("graphql_responses") / users, 2) if users else None,
+                "worker_seconds": round(worker_seconds, 3), "sleeping_seconds": round(sleeping_seconds, 3), "working_seconds": round(worker_seconds - sleeping_seconds, 3),
+                "counters": labelled_counters, "phases": {phase: {"seconds": round(seconds, 3), "calls": phase_calls[phase]} for phase, seconds in sorted(phase_seconds.items())},
+                "rate_limits": rate_limit_snapshots()}
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items()); phase_seconds = sorted(self.phase_seconds.items()); phase_calls = dict(self.phase_calls)
+            user_outcomes = sorted(self.user_outcomes.items())
+        label_text = lambda labels: "{" + ",".join(f'{label}="{value}"' for label, value in labels) + "}" if labels else ""
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE scraper_{name}_total counter")
+            lines += [f"scraper_{name}_total{label_text(labels)} {value}" for (counter_name, labels), value in counters if counter_name == name]
+        lines.append("# TYPE scraper_phase_seconds_total counter")
+        lines += [f'scraper_phase_seconds_total{{phase="{phase}"}} {seconds:.3f}' for phase, seconds in phase_seconds]
+        lines.append("# TYPE scraper_phase_calls_total counter")
+        lines += [f'scraper_phase_calls_total{{phase="{phase}"}} {phase_calls[phase]}' for phase, _ in phase_seconds]
+        lines.append("# TYPE scraper_users_total counter")
+        lines += [f'scraper_users_total{{outcome="{outcome}"}} {count}' for outcome, count in user_outcomes]
+        lines.append("# TYPE scraper_rate_limit_remaining gauge")
+        for account_name, snapshot in rate_limit_snapshots().items():
+            lines += [f'scraper_rate_limit_remaining{{account="{account_name}",operation="{operation}"}} {budget["remaining"]}' for operation, budget in sorted(snapshot.items())]
+        lines.append("# TYPE scraper_run_seconds gauge")
+        lines.append(f"scraper_run_seconds {time.time() - self.started_at:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        """Rewrites prometheus_filename atomically, so a collector never reads a half-written file."""
+        if not self.prometheus_filename: return
+        temp_filename = f"{self.prometheus_filename}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_filename, "w", encoding="utf-8") as f: f.write(self.prometheus_text())
+            os.replace(temp_filename, self.prometheus_filename)
+        except OSError as e_metrics: print(f"Could not write metrics to {self.prometheus_filename}: {e_metrics}")
+
+    def print_summary(self):
+        summary = self.summary()
+        self.log_event("run_summary", **summary); self.write_prometheus()
+        print(f"\nRun metrics ({summary['wall_seconds']:.0f}s wall):")
+        print(f"  Users: {summary['users']} ({', '.join(f'{k}={v}' for k, v in sorted(summary['outcomes'].items())) or 'none'}); tweets: {summary['tweets']} "
+              f"({summary['tweets_per_second'] or 0:.2f}/s); GraphQL responses per user: {summary['graphql_responses_per_user'] or 0}")
+        with self._lock: retries = {dict(labels).get("kind"): value for (name, labels), value in sorted(self.counters.items()) if name == "retries"}
+        print(f"  429s: {self.counter_total('http_429')}; retries: {', '.join(f'{kind}={value}' for kind, value in retries.items()) or 'none'}")
+        print(f"  Pages: {self.counter_total('pages_created')} created, {self.counter_total('pages_reused')} reused; contexts recycled: {self.counter_total('context_recycles')}; "
+              f"browser restarts: {self.counter_total('browser_restarts')}")
+        if self.counter_total('xhr_dropped'): print(f"  XHRs dropped from full queues: {self.counter_total('xhr_dropped')}")
+        if GRAPHQL_CACHE_DIR:
+            print(f"  GraphQL cache: {self.counter_total('graphql_cache_hits')} hits, {self.counter_total('graphql_cache_misses')} misses, "
+                  f"{self.counter_total('graphql_cache_evictions')} evicted")
+        if summary["worker_seconds"]:
+            print(f"  Worker time {summary['worker_seconds']:.0f}s: working {summary['working_seconds']:.0f}s, sleeping {summary['sleeping_seconds']:.0f}s "
+                  f"({summary['sleeping_seconds'] / summary['worker_seconds']:.0%} on rate-limit pacing, retry backoff and inter-user delays)")
+        for phase, phase_summary in sorted(summary["phases"].items(), key=lambda item: -item[1]["seconds"]):
+            print(f"  {phase:<18}{phase_summary['seconds']:>10.1f}s{phase_summary['calls']:>8} calls{phase_summary['seconds'] / max(phase_summary['calls'], 1):>9.2f}s avg")
+        print(f"  Rate-limit budget: {_account_pool.describe() if _account_pool else rate_limiter.describe()}")
+
+def rate_limit_snapshots():
+    """{account name: RateLimitScheduler.snapshot()} for the pooled accounts, or the single account as "default"."""
+    if _account_pool: return {account["name"]: account["rate_limiter"].snapshot() for account in _account_pool.accounts}
+    return {"default": rate_limiter.snapshot()}
+
+metrics = ScrapeMetrics(METRICS_LOG_FILE, METRICS_PROMETHEUS_FILE)
+
+def print_worker_summary():
+    with _worker_status_lock:
+        for worker_id in sorted(_worker_status):
+            status = _worker_status[worker_id]
+            outcomes = ", ".join(f"{k}={v}" for k, v in sorted(status["outcomes"].items())) or "none"
+            print(f"[Worker {worker_id}] processed {status['processed']} users ({outcomes}). Last state: {status['state']}")
+
+class ResourceBlocker:
+    """context.route handler that aborts images, media, fonts, stylesheets and analytics beacons while letting
+    GraphQL XHRs through. Blocked requests are attributed to the screen name in the requesting page's URL."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_by_user = {} # screen_name -> {category: count}
+
+    def classify(self, request):
+        """Returns the block category for a request, or None if it must go through."""
+        request_url = request.url
+        if "/i/api/graphql/" in request_url: return None
+        if any(marker in request_url for marker in BLOCKED_URL_SUBSTRINGS): return "analytics"
+        if request.resource_type in BLOCKED_RESOURCE_TYPES: return request.resource_type
+        return None
+
+    def _count(self, request, category):
+        try: screen_name = urlparse(request.frame.page.url).path.strip("/").split("/")[0].lower()
+        except Exception: screen_name = "" # Service worker or detached frame
+        with self._lock:
+            user_stats = self._stats_by_user.setdefault(screen_name, {})
+            user_stats[category] = user_stats.get(category, 0) + 1
+
+    def handle_route(self, route):
+        category = self.classify(route.request)
+        if category is None: return route.continue_()
+        self._count(route.request, category)
+        route.abort()
+
+    async def async_handle_route(self, route):
+        category = self.classify(route.request)
+        if category is None: return await route.continue_()
+        self._count(route.request, category)
+        await route.abort()
+
+    def pop_user_summary(self, screen_name):
+        """Returns a one-line summary of what was blocked for screen_name and resets its counters."""
+        with self._lock: user_stats = self._stats_by_user.pop(screen_name.lower(), {})
+        blocked_requests = sum(user_stats.values())
+        estimated_bytes = sum(BLOCKED_RESOURCE_ESTIMATED_BYTES.get(category, 0) * count for category, count in user_stats.items())
+        breakdown = ", ".join(f"{category}={count}" for category, count in sorted(user_stats.items())) or "none"
+        return f"{blocked_requests} requests blocked, ~{estimated_bytes / 1024:.0f} KB saved ({breakdown})"
+
+class ScrapeSession:
+    """Playwright driver, browser and context used by one worker. Sync Playwright objects are bound to the
+    thread that created them, so every worker thread owns its own session; concurrent workers share the
+    logged-in cookies through storage_state instead of logging in separately. The browser stays up for the whole run:
+    a crashed browser is relaunched on its own (ensure_healthy) and the context is recycled every CONTEXT_RECYCLE_USERS users."""
+    def __init__(self, storage_state=None, account_pool=None):
+        self.playwright_manager = None; self.browser = None; self.context = None
+        self.storage_state = storage_state
+        self.resource_blocker = None
+        self.account_pool = account_pool; self.account = None
+        self.persist_state = False # True once this session owns a login worth writing back to SESSION_STATE_FILE
+        self.users_on_context = 0
+
+    def _new_context(self):
+        if self.account_pool:
+            if not self.account: self.account = self.account_pool.pick(allow_cooling=True)
+            self.storage_state = self.account["storage_state"]
+        self.context = self.browser.new_context(viewport={"width": 1920, "height": 1080}, storage_state=self.storage_state)
+        register_context_account(self.context, self.account)
+        if BLOCK_HEAVY_RESOURCES:
+            if not self.resource_blocker: self.resource_blocker = ResourceBlocker()
+            self.context.route("**/*", self.resource_blocker.handle_route)
+        if graphql_cache(): self.context.route("**/i/api/graphql/**", graphql_cache().handle_route) # Registered last, so it runs first
+
+    def start(self, login=True):
+        with metrics.phase("session_start"): return self._start(login)
+
+    def _start(self, login):
+        if not self.playwright_manager: self.playwright_manager = sync_playwright().start()
+        self.browser = self.playwright_manager.chromium.launch(headless=HEADLESS)
+        reuse_saved_state = login and not self.account_pool and REUSE_SESSION_STATE and os.path.exists(SESSION_STATE_FILE) and self.storage_state in (None, SESSION_STATE_FILE)
+        if reuse_saved_state: self.storage_state = SESSION_STATE_FILE
+        self._new_context()
+        if not login or self.account_pool: return True # Pooled storage states are already logged in
+        if reuse_saved_state:
+            if session_state_is_valid(self.context):
+                print(f"Reusing saved session from {SESSION_STATE_FILE}."); self.persist_state = True
+                return True
+            print(f"Saved session in {SESSION_STATE_FILE} is no longer valid. Logging in...")
+            self._close_context(); self.storage_state = None; self._new_context()
+        login_page = self.context.new_page()
+        logged_in = login_to_x(login_page)
+        try: login_page.close()
+        except Exception as e_login_close: print(f"Note: Could not close login page: {e_login_close}")
+        if logged_in and REUSE_SESSION_STATE:
+            save_session_state(self.context); self.persist_state = True
+            self.storage_state = SESSION_STATE_FILE
+        return logged_in
+
+    def ensure_healthy(self):
+        """Relaunches the browser (and context) if it crashed or disconnected, carrying the login over through the stored
+        state or pooled account instead of logging in again. Returns True if anything had to be replaced."""
+        if self.browser and self.browser.is_connected() and self.context: return False
+        print("Browser disconnected or crashed. Relaunching it...")
+        metrics.count("browser_restarts")
+        self.close_browser()
+        # Only a login that was never stored (REUSE_SESSION_STATE off) has to be redone
+        if not self.start(login=not self.account_pool and self.storage_state is None): print("Warn: Login failed after relaunching the browser.")
+        return True
+
+    def recover(self):
+        """Global retry: keeps the running browser (replacing it only if it died) and swaps in a fresh context on the same
+        cookies, re-picking the pooled account with the most budget. Returns False if a needed login failed."""
+        if self.ensure_healthy(): return self.context is not None
+        if self.account_pool: self._close_context(); self.account = None; self._new_context()
+        elif self.storage_state is not None: self._close_context(); self._new_context() # Without a stored login, the live context is the only copy
+        return True
+
+    def user_finished(self):
+        """Counts a processed user; every CONTEXT_RECYCLE_USERS users the context is replaced by a fresh one with the same
+        account and cookies, so its caches, service workers and leaked page memory do not pile up over a long run."""
+        self.users_on_context += 1
+        if not CONTEXT_RECYCLE_USERS or self.users_on_context < CONTEXT_RECYCLE_USERS or not self.context: return
+        print(f"Recycling browser context after {self.users_on_context} users.")
+        metrics.count("context_recycles")
+        self._close_context(); self._new_context()
+
+    def rotate_account(self):
+        """Puts the current pooled account into cooldown and switches the context to the best other account.
+        Returns False (leaving the session as is) when there is no pool or no other account is ready."""
+        if not self.account_pool or not self.account: return False
+        self.account_pool.mark_rate_limited(self.account)
+        next_account = self.account_pool.pick(exclude={self.account["name"]})
+        if not next_account: return False
+        self._close_context()
+        self.account = next_account
+        self._new_context()
+        return True
+
+    def _close_context(self):
+        if self.context:
+            if self.persist_state and browser_is_connected(self.context): save_session_state(self.context) # Keep cookies refreshed during the run
+            unregister_context_account(self.context); drop_page_pool(self.context); self.users_on_context = 0
+            try: self.context.close()
+            except Exception as e: print(f"Err closing context: {e}")
+            self.context = None
+
+    def close_browser(self):
+        self._close_context()
+        if self.browser:
+            try:
+                if self.browser.is_connected(): self.browser.close()
+            except Exception as e: print(f"Err closing browser: {e}")
+            self.browser = None
+
+    def stop(self):
+        self.close_browser()
+        if self.playwright_manager:
+            try: self.playwright_manager.stop()
+            except Exception as e: print(f"Error stopping playwright: {e}")
+            self.playwright_manager = None
+
+def prepare_user_dir(username_in_file):
+    """Creates the output directory for a user (or removes it if the user is known problematic). Returns (sanitized_username, profile_url, user_dir)."""
+    sanitized_username = username_in_file.lstrip('@')
+    profile_url = f"{X_BASE_URL}/{sanitized_username}"
+    user_dir = os.path.join(".", sanitized_username)
+    if problematic_usernames().is_expired(username_in_file): print(f"Problematic listing for '{username_in_file}' is older than {PROBLEMATIC_USERNAME_TTL_DAYS} days. Re-checking.")
+
+    is_problematic_before_scrape = is_username_problematic(username_in_file)
+    if not is_problematic_before_scrape:
+         os.makedirs(user_dir, exist_ok=True)
+    elif os.path.exists(user_dir):
+        print(f"User '{username_in_file}' was previously marked problematic, ensuring directory is removed.")
+        try: shutil.rmtree(user_dir)
+        except Exception as e_rm_pre: print(f"Note: Error removing pre-existing problematic user dir {user_dir}: {e_rm_pre}")
+    return sanitized_username, profile_url, user_dir
+
+def handle_account_unavailable(username_in_file, user_dir, auae):
+    print(f"AccountUnavailableException for user {username_in_file.lstrip('@')}: {auae}")
+    if mark_username_problematic(username_in_file):
+        print(f"Added '{username_in_file}' to {PROBLEMATIC_USERNAMES_FILE}.")
+    if os.path.exists(user_dir): # Ensure directory is removed for problematic accounts
+        try: shutil.rmtree(user_dir); print(f"Removed directory due to account issue: {user_dir}")
+        except OSError as e_rm: print(f"Error removing directory {user_dir} for problematic account: {e_rm}")
+
+ACCOUNT_STATUSES_SKIPPING_TIMELINE = ("protected", "no_tweets")
+_user_by_screen_name_requests = {} # pooled account name (None = single login) -> captured UserByScreenName (request_url, headers)
+
+def remember_user_by_screen_name_request(context: BrowserContext, xhr):
+    """Keeps the first UserByScreenName XHR a scrape visit of this context's account fires as the pre-check's request template."""
+    account_name = _context_accounts.get(id(context), {}).get("name")
+    if ACCOUNT_PRECHECK and account_name not in _user_by_screen_name_requests: _user_by_screen_name_requests[account_name] = (xhr.url, xhr.request.all_headers())
+
+def recent_account_precheck(user_dir, sanitized_username):
+    """(skip_timeline, fresh) from a pre-check stored within ACCOUNT_PRECHECK_MAX_AGE_HOURS."""
+    state = load_user_scrape_state(user_dir, sanitized_username)
+    fresh = time.time() - state.get("account_checked_at", 0) < ACCOUNT_PRECHECK_MAX_AGE_HOURS * 3600
+    return fresh and state.get("account_status") in ACCOUNT_STATUSES_SKIPPING_TIMELINE, fresh
+
+def apply_account_precheck(user_dir, sanitized_username, json_response):
+    """Stores the status from a pre-check UserByScreenName payload and returns (skip_timeline, profile). Raises
+    AccountUnavailableException for a suspended or nonexistent account; an unusable payload changes nothing."""
+    status = account_status_from_user_by_screen_name(json_response); metrics.count("account_precheck", status=status or "unknown")
+    if status in ("suspended", "not_found"): raise AccountUnavailableException(f"UserByScreenName reports the account as {status.replace('_', ' ')}")
+    if not status: return False, None
+    save_user_scrape_state(user_dir, sanitized_username, account_status=status, account_checked_at=time.time())
+    if status in ACCOUNT_STATUSES_SKIPPING_TIMELINE: print(f"Skipping the timeline of {sanitized_username}: the account pre-check found it {status.replace('_', ' ')}.")
+    return status in ACCOUNT_STATUSES_SKIPPING_TIMELINE, extract_profile_from_user_by_screen_name_json(json_response)
+
+def precheck_account(context: BrowserContext, sanitized_username, user_dir):
+    """Account pre-check of one claimed user, run by process_user before the timeline scrape: one UserByScreenName
+    request through context.request, paced by the same limiter as the scrape and built from the request a scrape visit
+    of the same account remembered (none yet: no pre-check). Returns (skip_timeline, profile) for process_user;
+    AccountUnavailableException propagates. A rate limit or failure leaves the user to the full scrape. Users checked
+    within ACCOUNT_PRECHECK_MAX_AGE_HOURS are not re-checked."""
+    skip_timeline, fresh = recent_account_precheck(user_dir, sanitized_username)
+    if fresh: return skip_timeline, None
+    captured_request = _user_by_screen_name_requests.get(_context_accounts.get(id(context), {}).get("name"))
+    if captured_request is None: return False, None
+    try: json_response = request_graphql_json(context, build_user_by_screen_name_url(captured_request[0], sanitized_username), graphql_api_headers(captured_request[1]), "Pre-check", timeout_ms=15000)
+    except RateLimitException as rle: print(f"Account pre-check of {sanitized_username} rate limited ({rle}); going to the full scrape."); return False, None
+    except Exception as e_precheck: print(f"Account pre-check failed for {sanitized_username}: {e_precheck}"); return False, None
+    return apply_account_precheck(user_dir, sanitized_username, json_response)
+
+class UserScrapeJob:
+    """One claimed user as process_user and async_process_user see it: what is already saved (run journal, account
+    pre-check), which scrape_twitter_info calls are still needed and what they returned, for save_user_results."""
+    def __init__(self, username_in_file, user_index, total_users):
+        print(f"\n--- Starting processing for user: {username_in_file} ({user_progress(user_index, total_users)}) ---")
+        self.username_in_file = username_in_file
+        self.sanitized_username, self.profile_url, self.user_dir = prepare_user_dir(username_in_file)
+        self.tweets = None; self.profile = None; self.rate_limited_out = False
+        self.tweets_already_saved = self.profile_already_saved = False; self.since_tweet_id = None
+
+    def start(self):
+        """Loads what earlier runs left for the user. Returns False (journaled as problematic) for a listed problematic user."""
+        if is_username_problematic(self.username_in_file):
+            print(f"Skipping {self.sanitized_username}: listed in {PROBLEMATIC_USERNAMES_FILE}.")
+            journal_record(self.username_in_file, "problematic")
+            return False
+        self.since_tweet_id = load_user_scrape_state(self.user_dir, self.sanitized_username).get("newest_tweet_id") if INCREMENTAL_SCRAPING else None
+        resume_entry = journal_entry(self.username_in_file)
+        self.tweets_already_saved = resume_entry.get("tweets_done", False); self.profile_already_saved = resume_entry.get("profile_done", False)
+        if self.tweets_already_saved or self.profile_already_saved: print(f"Resuming {self.sanitized_username} from run journal (tweets_done={self.tweets_already_saved}, profile_done={self.profile_already_saved}).")
+        return True
+
+    def needs_precheck(self):
+        return ACCOUNT_PRECHECK and not (self.tweets_already_saved and self.profile_already_saved)
+
+    def apply_precheck(self, precheck_result):
+        skip_timeline, precheck_profile = precheck_result
+        if precheck_profile and not self.profile_already_saved: self.profile = precheck_profile # The visit below only needs the timeline
+        if skip_timeline and not self.tweets_already_saved: self.tweets_already_saved = True; journal_record(self.username_in_file, "pending", tweets_done=True)
+
+    def mark_problematic(self, auae):
+        handle_account_unavailable(self.username_in_file, self.user_dir, auae); journal_record(self.username_in_file, "problematic")
+        return "problematic"
+
+    def open(self):
+        if not self.tweets_already_saved: open_tweet_sink(self.profile_url, tweets_output_filename(self.user_dir, self.sanitized_username))
+        journal_record(self.username_in_file, "pending")
+
+    def pending_scrapes(self, global_attempt):
+        """Keyword arguments of the scrape_twitter_info calls still needed, each decided after the previous one's
+        result was passed to record_scrape."""
+        if self.tweets is None and not self.tweets_already_saved:
+            if COMBINED_PAGE_VISIT and self.profile is None and not self.profile_already_saved:
+                print(f"Attempting to scrape tweets and profile in one visit for: {self.sanitized_username} (Global attempt {global_attempt})")
+                yield dict(scrape_tweets_mode=True, timeout_seconds=480, include_profile=True, since_tweet_id=self.since_tweet_id)
+            else:
+                print(f"Attempting to scrape tweets for: {self.sanitized_username} (Global attempt {global_attempt})")
+                yield dict(scrape_tweets_mode=True, timeout_seconds=480, since_tweet_id=self.since_tweet_id)
+        if self.profile is None and not self.profile_already_saved: # Not fetched yet, or missing from the combined visit
+            print(f"Attempting to scrape profile for: {self.sanitized_username} (Global attempt {global_attempt})")
+            yield dict(scrape_tweets_mode=False, timeout_seconds=90)
+
+    def record_scrape(self, scrape_kwargs, result):
+        if not scrape_kwargs["scrape_tweets_mode"]: self.profile = result
+        elif not scrape_kwargs.get("include_profile"): self.tweets = result
+        elif result: self.tweets, self.profile = result
+
+    def save(self, resource_blocker=None):
+        """Writes what was collected (save_user_results) and returns the user's outcome."""
+        if resource_blocker: print(f"Resource blocking for {self.sanitized_username}: {resource_blocker.pop_user_summary(self.sanitized_username)}")
+        return save_user_results(self.username_in_file, self.tweets, self.profile, self.rate_limited_out, close_tweet_sink(self.profile_url))
+
+def global_retry_delay(account_pool):
+    """Pause before a global retry after a persistent rate limit: until a pooled account cools down or the budget
+    resets when known, else GLOBAL_RETRY_DELAY_SECONDS."""
+    if account_pool: return account_pool.seconds_until_available() or GLOBAL_RETRY_DELAY_SECONDS
+    return (rate_limiter.seconds_until_reset() if ADAPTIVE_RATE_LIMITING else None) or GLOBAL_RETRY_DELAY_SECONDS
+
+def process_user(session: ScrapeSession, username_in_file, user_index, total_users):
+    """Scrapes, saves and analyzes one user. Returns an outcome string: completed, partial, failed or problematic."""
+    job = UserScrapeJob(username_in_file, user_index, total_users)
+    if not job.start(): return "problematic"
+    session.ensure_healthy() # A browser that crashed between users is replaced before it fails the first navigation
+    if job.needs_precheck():
+        try: job.apply_precheck(precheck_account(session.context, job.sanitized_username, job.user_dir))
+        except AccountUnavailableException as auae: return job.mark_problematic(auae)
+    job.open()
+
+    operation_completed_for_user = False
+    global_retry_count_for_user = 0; account_rotations_for_user = 0; browser_restarts_for_user = 0
+    while not operation_completed_for_user and global_retry_count_for_user <= MAX_GLOBAL_USER_RETRIES:
+        try:
+            for scrape_kwargs in job.pending_scrapes(global_retry_count_for_user + 1):
+                job.record_scrape(scrape_kwargs, scrape_twitter_info(session.context, job.profile_url, **scrape_kwargs))
+            operation_completed_for_user = True # Mark as completed if both ops (or those pending) succeed or return None (no RateLimitException)
+
+        except AccountUnavailableException as auae:
+            handle_account_unavailable(username_in_file, job.user_dir, auae)
+            operation_completed_for_user = True # Stop retrying for this user
+
+        except RateLimitException as rle_from_scraper:
+            print(f"Persistent RateLimitException for user {job.sanitized_username} after local retries: {rle_from_scraper}")
+            if account_rotations_for_user < len(session.account_pool.accounts if session.account_pool else []) and session.rotate_account():
+                account_rotations_for_user += 1; metrics.count("retries", kind="account_rotation")
+                print(f"Rotated to account '{session.account['name']}'. Retrying {job.sanitized_username} immediately.")
+                continue
+            global_retry_count_for_user += 1
+            if global_retry_count_for_user <= MAX_GLOBAL_USER_RETRIES:
+                print(f"--- Initiating GLOBAL RETRY {global_retry_count_for_user}/{MAX_GLOBAL_USER_RETRIES} for {job.sanitized_username} ---")
+                retry_delay = global_retry_delay(session.account_pool)
+                print(f"Waiting for {retry_delay:.0f} seconds before retrying on a fresh context...")
+                metrics.count("retries", kind="global")
+                with metrics.phase("retry_sleep"): time.sleep(retry_delay)
+                try:
+                    if not session.recover():
+                        print("FATAL: Failed to re-login after browser restart. Skipping user.")
+                        operation_completed_for_user = True # Give up on this user
+                    else:
+                        print("Fresh context ready. Retrying scraping for current user.")
+                        # Do NOT set operation_completed_for_user = True; allow loop to retry operations
+                except Exception as e_reinit:
+                    print(f"FATAL: Error during browser re-initialization: {e_reinit}. Skipping user.")
+                    operation_completed_for_user = True # Give up on this user
+            else:
+                print(f"Max global retries ({MAX_GLOBAL_USER_RETRIES}) reached for {job.sanitized_username} due to rate limits. Skipping user.")
+                operation_completed_for_user = True; job.rate_limited_out = True # Give up on this user
+
+        except Exception as e_other_op_error:
+            print(f"Unhandled error during scraping operations for {job.sanitized_username} in global attempt: {e_other_op_error}")
+            if browser_restarts_for_user < MAX_GLOBAL_USER_RETRIES and session.ensure_healthy(): # The browser died under us: retry on the relaunched one
+                browser_restarts_for_user += 1; metrics.count("retries", kind="browser_crash"); continue
+            operation_completed_for_user = True # Give up on this user for this cycle
+
+    return job.save(session.resource_blocker)
+
+def user_scrape_state_filename(user_dir, sanitized_username):
+    return os.path.join(user_dir, f"{sanitized_username}_scrape_state.json")
+
+def load_user_scrape_state(user_dir, sanitized_username):
+    """Returns the per-user scrape state (e.g. newest_tweet_id), or {} if none was stored yet."""
+    try:
+        with open(user_scrape_state_filename(user_dir, sanitized_username), "r", encoding="utf-8") as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError): return {}
+
+def save_user_scrape_state(user_dir, sanitized_username, **fields):
+    state = load_user_scrape_state(user_dir, sanitized_username); state.update(fields)
+    state_filename = user_scrape_state_filename(user_dir, sanitized_username); temp_filename = state_filename + ".tmp"
+    with open(temp_filename, "w", encoding="utf-8") as f: json.dump(state, f, indent=4)
+    os.replace(temp_filename, state_filename)
+
+# --- Priority scheduling: posting rate, followers and failures are kept in the per-user scrape state ---
+TWITTER_DATE_FORMAT = "%a %b %d %H:%M:%S %z %Y" # legacy.created_at, e.g. "Wed Oct 10 20:19:24 +0000 2018"
+
+def posting_rate_per_day(tweets, as_of=None):
+    """Tweets per day from the oldest of the given tweets up to as_of (default now), so an account that went quiet long
+    ago scores low even if it once posted in bursts. None if no tweet carries a parseable legacy.created_at."""
+    created_epochs = []
+    for tweet in tweets:
+        legacy = tweet.get("legacy") or tweet.get("tweet", {}).get("legacy") or {} # TweetWithVisibilityResults wraps the tweet
+        try: created_epochs.append(datetime.datetime.strptime(legacy["created_at"], TWITTER_DATE_FORMAT).timestamp())
+        except (KeyError, TypeError, ValueError): continue
+    if not created_epochs: return None
+    return len(created_epochs) / max((as_of or time.time()) - min(created_epochs), 3600) * 86400
+
+def record_user_schedule_state(user_dir, sanitized_username, outcome, tweets=None, profile=None, rate_limited=False):
+    """Stores what the scheduler needs after a user is processed: attempt/success times, consecutive failures, posting
+    rate and follower count. A user that only ran out of our rate-limit budget is left untouched, so it stays due."""
+    if rate_limited and outcome == "failed": return
+    state = load_user_scrape_state(user_dir, sanitized_username); now = time.time()
+    fields = {"last_attempt_at": now}
+    if outcome in ("completed", "partial"): fields.update(last_scraped_at=now, consecutive_failures=0)
+    else: fields["consecutive_failures"] = state.get("consecutive_failures", 0) + 1
+    if tweets is not None and outcome in ("completed", "partial"):
+        fields["posts_per_day"] = round(posting_rate_per_day(tweets, now) or 0.0, 4) # No dated tweets: treat as dormant
+    followers_count = (profile or {}).get("legacy", {}).get("followers_count")
+    if followers_count is not None: fields["followers_count"] = followers_count
+    save_user_scrape_state(user_dir, sanitized_username, **fields)
+
+def user_refresh_interval_hours(state):
+    posts_per_day = state.get("posts_per_day")
+    if posts_per_day is None: interval_hours = SCHEDULE_MIN_INTERVAL_HOURS # Rate unknown: refresh as often as allowed until it is
+    else:
+        interval_hours = SCHEDULE_TARGET_NEW_TWEETS / max(posts_per_day, 1e-3) * 24
+        interval_hours /= 1 + math.log10(1 + (state.get("followers_count") or 0)) / 6 # 1M followers: refreshed twice as often
+    return min(SCHEDULE_MAX_INTERVAL_HOURS, max(SCHEDULE_MIN_INTERVAL_HOURS, interval_hours)) * 2 ** min(state.get("consecutive_failures", 0), 4)
+
+def user_schedule_entry(username_in_file, now=None):
+    """Scheduling view of one user: {"username", "due", "priority" (hours since the last attempt / refresh interval),
+    "interval_hours", "hours_since"}. Read-only: for users scraped before scheduling existed, the rate, followers and last
+    scrape time are derived from the stored tweets/profile files but only written once the user is scraped again."""
+    sanitized_username = username_in_file.lstrip('@'); user_dir = os.path.join(".", sanitized_username); now = now or time.time()
+    if is_username_problematic(username_in_file): return {"username": username_in_file, "due": True, "priority": -1.0, "interval_hours": 0, "hours_since": 0} # Skipped without a request; keep them last
+    state = load_user_scrape_state(user_dir, sanitized_username)
+    tweets_filename = next((filename for filename in (tweets_output_filename(user_dir, sanitized_username), tweets_output_filename(user_dir, sanitized_username, ndjson=False)) if os.path.exists(filename)), None)
+    backfill = {}
+    if "last_attempt_at" not in state and tweets_filename:
+        backfill["last_attempt_at"] = backfill["last_scraped_at"] = os.path.getmtime(tweets_filename)
+        try: backfill["posts_per_day"] = round(posting_rate_per_day(iter_stored_tweets(tweets_filename), backfill["last_scraped_at"]) or 0.0, 4)
+        except (json.JSONDecodeError, OSError, RuntimeError) as e_stored: print(f"Could not read stored tweets {tweets_filename}: {e_stored}")
+        try:
+            with open(os.path.join(user_dir, f"{sanitized_username}_user_profile_info.json"), "r", encoding="utf-8") as f: followers_count = json.load(f).get("legacy", {}).get("followers_count")
+            if followers_count is not None: backfill["followers_count"] = followers_count
+        except (OSError, json.JSONDecodeError, AttributeError): pass
+    state.update(backfill)
+    if "last_attempt_at" not in state: return {"username": username_in_file, "due": True, "priority": float("inf"), "interval_hours": 0, "hours_since": None}
+    interval_hours = user_refresh_interval_hours(state); hours_since = (now - state["last_attempt_at"]) / 3600
+    return {"username": username_in_file, "due": hours_since >= interval_hours, "priority": hours_since / interval_hours, "interval_hours": interval_hours, "hours_since": hours_since}
+
+def schedule_usernames(usernames, now=None):
+    """Returns the due usernames, never-scraped first and then most overdue first (file order breaks ties), capped at
+    SCHEDULE_MAX_USERS_PER_RUN. Users not due yet are left for a later run."""
+    entries = [user_schedule_entry(username, now) for username in usernames]
+    due_entries = sorted((entry for entry in entries if entry["due"]), key=lambda entry: -entry["priority"])
+    waiting_entries = [entry for entry in entries if not entry["due"]]
+    if waiting_entries:
+        next_entry = min(waiting_entries, key=lambda entry: entry["interval_hours"] - entry["hours_since"])
+        print(f"Scheduling: {len(waiting_entries)} users not due yet (next: {next_entry['username']} in {next_entry['interval_hours'] - next_entry['hours_since']:.1f}h).")
+    if SCHEDULE_MAX_USERS_PER_RUN and len(due_entries) > SCHEDULE_MAX_USERS_PER_RUN:
+        print(f"Scheduling: {len(due_entries) - SCHEDULE_MAX_USERS_PER_RUN} due users deferred by SCHEDULE_MAX_USERS_PER_RUN={SCHEDULE_MAX_USERS_PER_RUN}.")
+        due_entries = due_entries[:SCHEDULE_MAX_USERS_PER_RUN]
+    never_scraped = sum(1 for entry in due_entries if entry["priority"] == float("inf"))
+    print(f"Scheduling: {len(due_entries)} users due ({never_scraped} never scraped, {len(due_entries) - never_scraped} refreshes).")
+    return [entry["username"] for entry in due_entries]
+
+def merge_with_stored_tweets(tweets_filename, new_tweets, legacy_tweets_filename=None):
+    """Merges freshly scraped tweets into the stored file's tweets (new copies win, newest first). Falls back to
+    legacy_tweets_filename (the old .json output) when tweets_filename does not exist yet."""
+    stored_filename = next((filename for filename in (tweets_filename, legacy_tweets_filename) if filename and os.path.exists(filename)), None)
+    try: stored_tweets = list(iter_stored_tweets(stored_filename)) if stored_filename else []
+    except (json.JSONDecodeError, OSError, RuntimeError) as e_stored: print(f"Could not read stored tweets {stored_filename}: {e_stored}"); stored_tweets = []
+    merged_by_id = {tweet["rest_id"]: tweet for tweet in stored_tweets if "rest_id" in tweet}
+    merged_by_id.update({tweet["rest_id"]: tweet for tweet in new_tweets})
+    print(f"Incremental merge for {tweets_filename}: {len(new_tweets)} new + {len(stored_tweets)} stored -> {len(merged_by_id)} tweets.")
+    return sorted(merged_by_id.values(), key=lambda tweet: int(tweet["rest_id"]), reverse=True)
+
+def save_user_results(username_in_file, tweets_data_for_current_user, profile_data_for_current_user, rate_limited=False, tweet_sink=None):
+    """Writes tweets/profile for a user, runs the analysis, records the outcome in the run journal and prints the final status. Returns the outcome string.
+    With a tweet_sink the streamed NDJSON becomes the tweets file; if no tweets came back it is kept for the next run."""
+    sanitized_username = username_in_file.lstrip('@')
+    user_dir = os.path.join(".", sanitized_username)
+    tweets_filename = tweets_output_filename(user_dir, sanitized_username)
+    # After all attempts for the user (either completed, rate-limited out, or other error)
+    is_problematic_after_scrape = is_username_problematic(username_in_file)
+
+    if not is_problematic_after_scrape: # Only save if not marked as problematic
+        if os.path.exists(user_dir): # Ensure user_dir exists (it might have been removed if problematic was found late)
+            if tweet_sink and tweet_sink.carried_over and tweets_data_for_current_user and not INCREMENTAL_SCRAPING:
+                tweets_data_for_current_user = tweet_sink.newest_tweets(NUM_POSTS_TO_RETRIEVE) # Same tweets in the file, the store and newest_tweet_id
+            if INCREMENTAL_SCRAPING and tweets_data_for_current_user is not None:
+                tweets_data_for_current_user = merge_with_stored_tweets(tweets_filename, tweets_data_for_current_user, tweets_output_filename(user_dir, sanitized_username, ndjson=False))
+            if tweets_data_for_current_user:
+                print(f"Final tweet data count for {sanitized_username}: {len(tweets_data_for_current_user)}.")
+                with metrics.phase("disk_write"):
+                    if not STREAM_TWEETS_NDJSON:
+                        with open(tweets_filename, "w", encoding="utf-8") as f: json.dump(tweets_data_for_current_user, f, indent=4, ensure_ascii=False)
+                    elif INCREMENTAL_SCRAPING or not (tweet_sink and tweet_sink.promote(tweets_data_for_current_user)): # A merge rewrites the whole file
+                        write_tweets_ndjson(tweets_filename, tweets_data_for_current_user)
+                        if tweet_sink: tweet_sink.discard()
+                print(f"Saved tweets to {tweets_filename}")
+                with metrics.phase("analysis"): analyze_and_save_tweets(tweets_filename, user_dir)
+                save_user_scrape_state(user_dir, sanitized_username, newest_tweet_id=max((tweet["rest_id"] for tweet in tweets_data_for_current_user), key=int))
+            else:
+                print(f"No tweet data collected for {sanitized_username} after all attempts.")
+                if tweet_sink and tweet_sink.written: print(f"Kept {tweet_sink.written} streamed tweets in {tweet_sink.filename}; the next run continues from them.")
+                # Clean up empty file if it was created then failed
+                if os.path.exists(tweets_filename) and os.path.getsize(tweets_filename) == 0:
+                    try: os.remove(tweets_filename); print(f"Removed empty tweet file: {tweets_filename}")
+                    except OSError as e: print(f"Error removing empty {tweets_filename}: {e}")
+
+            profile_filename = os.path.join(user_dir, f"{sanitized_username}_user_profile_info.json")
+            if profile_data_for_current_user:
+                with metrics.phase("disk_write"), open(profile_filename, "w", encoding="utf-8") as f: json.dump(profile_data_for_current_user, f, indent=4, ensure_ascii=False)
+                print(f"Profile data for {sanitized_username} saved to {profile_filename}")
+            else:
+                print(f"No profile data collected for {sanitized_username} after all attempts.")
+                if os.path.exists(profile_filename) and os.path.getsize(profile_filename) == 0:
+                    try: os.remove(profile_filename); print(f"Removed empty profile file: {profile_filename}")
+                    except OSError as e: print(f"Error removing empty {profile_filename}: {e}")
+            with metrics.phase("store_write"): store_user_results(sanitized_username, tweets_data_for_current_user, profile_data_for_current_user)
+        else:
+            print(f"User directory {user_dir} does not exist, skipping file saving for {sanitized_username}.")
+
+
+    # Final status message for the user
+    outcome = "failed"
+    if not is_problematic_after_scrape:
+        tweets_file_exists = os.path.exists(tweets_filename) and os.path.getsize(tweets_filename) > 0
+        profile_file_exists = os.path.exists(os.path.join(user_dir, f"{sanitized_username}_user_profile_info.json")) and \
+                              os.path.getsize(os.path.join(user_dir, f"{sanitized_username}_user_profile_info.json")) > 0
+
+        if tweets_file_exists and profile_file_exists: print(f"Successfully completed for {sanitized_username}."); outcome = "completed"
+        elif tweets_file_exists: print(f"Partially completed for {sanitized_username} (tweets OK, profile failed/not found)."); outcome = "partial"
+        elif profile_file_exists: print(f"Partially completed for {sanitized_username} (profile OK, tweets failed/not found)."); outcome = "partial"
+        elif os.path.exists(user_dir): # Directory exists but no data
+             print(f"Processing ultimately failed to yield data for {sanitized_username}.")
+        # If user_dir was removed (e.g. became problematic late), this won't print, which is fine.
+    else:
+        print(f"Processing for {sanitized_username} concluded as problematic."); outcome = "problematic"
+
+
+    if outcome == "problematic": journal_record(username_in_file, "problematic")
+    else:
+        if os.path.exists(user_dir): record_user_schedule_state(user_dir, sanitized_username, outcome, tweets_data_for_current_user, profile_data_for_current_user, rate_limited)
+        if outcome in ("completed", "partial") and problematic_usernames().remove(username_in_file): print(f"Cleared expired problematic listing for '{username_in_file}'.")
+        resume_entry = journal_entry(username_in_file)
+        tweets_done = resume_entry.get("tweets_done", False) or bool(tweets_data_for_current_user) and tweets_file_exists
+        profile_done = resume_entry.get("profile_done", False) or bool(profile_data_for_current_user) and profile_file_exists
+        journal_state = "completed" if tweets_done and profile_done else ("rate_limited" if rate_limited else "pending")
+        journal_record(username_in_file, journal_state, tweets_done=tweets_done, profile_done=profile_done)
+
+    print(f"--- Finished all attempts for {username_in_file} ---")
+    return outcome
+
+def run_scrape_worker(worker_id, session: ScrapeSession, username_queue: queue.Queue, total_users):
+    """Pulls (index, username) items off the shared queue until it is empty."""
+    while True:
+        try: user_index, username_in_file = username_queue.get_nowait()
+        except queue.Empty: break
+        user_metrics = metrics.start_user(username_in_file); outcome = "error"
+        try:
+            set_worker_status(worker_id, username_in_file, f"scraping ({user_progress(user_index, total_users)})")
+            outcome = process_user(session, username_in_file, user_index, total_users)
+            set_worker_status(worker_id, username_in_file, outcome, outcome=outcome)
+        except Exception as e_worker_user:
+            print(f"Unhandled error in worker {worker_id} for {username_in_file}: {e_worker_user}")
+            set_worker_status(worker_id, username_in_file, "error", outcome="error")
+        finally:
+            metrics.finish_user(user_metrics, outcome)
+            if _work_queue: _work_queue.complete(username_in_file, outcome)
+            username_queue.task_done()
+        session.user_finished()
+        if ADAPTIVE_RATE_LIMITING: print(f"[Worker {worker_id}] Rate-limit budget: {session.account_pool.describe() if session.account_pool else rate_limiter.describe()}") # Requests are paced individually
+        elif not username_queue.empty():
+            print(f"[Worker {worker_id}] Waiting for {INTER_USER_DELAY_SECONDS} seconds before processing next user...")
+            with metrics.phase("inter_user_delay"): time.sleep(INTER_USER_DELAY_SECONDS)
+    set_worker_status(worker_id, None, "finished")
+
+def _worker_thread_main(worker_id, storage_state, username_queue: queue.Queue, total_users, account_pool=None):
+    session = ScrapeSession(storage_state=storage_state, account_pool=account_pool)
+    try:
+        session.start(login=False) # Cookies from the initial login are already in storage_state
+        run_scrape_worker(worker_id, session, username_queue, total_users)
+    except Exception as e_worker:
+        print(f"Critical error in worker {worker_id}: {e_worker}")
+        set_worker_status(worker_id, None, f"crashed: {e_worker}")
+    finally:
+        session.stop()
+
+# --- Async engine: one browser, NUM_WORKERS pages driven from a single event loop ---
+async def async_check_page_for_account_issues(page: AsyncPage):
+    with metrics.phase("account_check"): await page.wait_for_timeout(1500) # Allow content to settle
+    try: page_content_lower = (await page.evaluate(ACCOUNT_CHECK_TEXT_JS)).lower()
+    except Exception as e_content:
+        print(f"Critical: Could not get any page content for status check: {e_content}")
+        return # Cannot determine, so don't raise an exception based on this
+    raise_for_account_issues(page_content_lower, page.url)
+
+async def async_read_graphql_json(xhr, label="XHR", limiter=None):
+    with metrics.phase("xhr_read"):
+        try: response_text = await xhr.text()
+        except Exception: response_text = None
+        return parse_graphql_response(xhr, response_text, label, limiter)
+
+async def async_profile_from_response(xhr, url, limiter=None):
+    try: return profile_from_json(xhr.url, url, await async_read_graphql_json(xhr, "Profile XHR", limiter))
+    except RateLimitException as rle_profile: print(f"Profile XHR rate limited during combined visit for {url}: {rle_profile}"); return None
+
+async def async_request_graphql_json(context: AsyncBrowserContext, request_url, headers, label, timeout_ms=30000):
+    cached_json = cached_graphql_json(request_url)
+    if cached_json is not None: return cached_json
+    limiter = rate_limiter_for(context); await limiter.async_acquire(graphql_operation_name(request_url))
+    with metrics.phase("api_request"): api_response = await context.request.get(request_url, headers=headers, timeout=timeout_ms)
+    return await async_read_graphql_json(api_response, label, limiter)
+
+async def async_paginate_user_tweets_via_api(context: AsyncBrowserContext, request_url, request_headers, attempt: TimelineAttempt, deadline):
+    api_headers = graphql_api_headers(request_headers); pages_before = attempt.pages
+    page_url = attempt.next_api_page_url(request_url, deadline)
+    while page_url:
+        if not attempt.add_page(page_url, await async_request_graphql_json(context, page_url, api_headers, "UserTweets API")): print(f"Direct pagination stopped for {attempt.url}: unusable page."); break
+        page_url = attempt.next_api_page_url(request_url, deadline)
+    print(f"Direct pagination fetched {attempt.pages - pages_before} pages for {attempt.url}. Total tweets: {len(attempt.tweets)}.")
+
+async def async_scrape_twitter_info(context: AsyncBrowserContext, url: str, scrape_tweets_mode: bool, timeout_seconds=120, include_profile=False, since_tweet_id=None):
+    """Async counterpart of scrape_twitter_info, on the same GraphQLResponseInbox: its async_wait is woken by the
+    response listener, so the loop awaits the next response instead of sleeping and rescanning a list."""
+    page: AsyncPage = None
+    local_retries = 0
+    limiter = rate_limiter_for(context)
+    pages = page_pool_for(context, max_idle=max(1, NUM_WORKERS)) # Workers share the context, so up to NUM_WORKERS pages are in use at once
+
+    while local_retries <= MAX_LOCAL_OPERATION_RETRIES:
+        try:
+            page = await pages.async_release(page) # Left over from a failed attempt
+            page = await pages.async_acquire()
+            inbox = GraphQLResponseInbox.for_visit(scrape_tweets_mode, include_profile)
+            pages.listen(page, request=inbox.on_request, requestfailed=inbox.on_request_failed, response=inbox.on_response)
+
+            overall_start_time = time.time()
+            remaining_seconds = lambda: timeout_seconds - (time.time() - overall_start_time)
+
+            print(f"Navigating to profile: {url} (Local Attempt {local_retries + 1})")
+            await limiter.async_acquire("UserByScreenName", "UserTweets") # A profile load fires both
+            with metrics.phase("navigate"): await page.goto(url, timeout=min(timeout_seconds * 1000, 60000), wait_until="domcontentloaded")
+            await async_check_page_for_account_issues(page) # Initial check after load
+
+            if remaining_seconds() <= 0:
+                print(f"Timeout after page load for {url}")
+                page = await pages.async_release(page)
+                return None
+
+            wait_for_primary_column_timeout_ms = primary_column_timeout_ms(remaining_seconds(), url)
+            try:
+                if wait_for_primary_column_timeout_ms is None: raise AsyncPlaywrightTimeoutError("Insufficient time for primary column after load and checks.")
+                with metrics.phase("primary_column"): await page.wait_for_selector(PRIMARY_COLUMN_SELECTOR, timeout=wait_for_primary_column_timeout_ms)
+            except AsyncPlaywrightTimeoutError as pte_selector:
+                print(f"Primary column not found for {url} (adaptive wait). Re-checking for account issues...")
+                await async_check_page_for_account_issues(page) # Re-check diligently
+                raise primary_column_missing(url, pte_selector)
+
+            if scrape_tweets_mode:
+                await page.mouse.wheel(0, 800) # Initial scroll
+                print(f"Starting tweet retrieval for {url}. Target: {NUM_POSTS_TO_RETRIEVE}.")
+                attempt = TimelineAttempt(url, since_tweet_id); no_new_xhr_scroll_count = 0; first_user_tweets_request = None; user_profile_data = None
+
+                while not attempt.is_full() and remaining_seconds() > 10:
+                    operation, xhr = inbox.pop()
+                    if xhr is None:
+                        with metrics.phase("scroll_wait"): got_xhr = await inbox.async_wait(min(XHR_RESPONSE_TIMEOUT_MS, (remaining_seconds() - 10) * 1000), scroll_wait_ms(no_new_xhr_scroll_count))
+                        if got_xhr: continue
+                        no_new_xhr_scroll_count += 1
+                        if no_new_xhr_scroll_count > MAX_EMPTY_SCROLLS:
+                            print(f"No new XHRs after {no_new_xhr_scroll_count} scrolls for {url}. Found {len(attempt.tweets)}."); break
+                        await limiter.async_acquire("UserTweets"); await page.mouse.wheel(0, 10000); continue
+                    if operation == "UserByScreenName": # Combined visit: parse the profile as soon as it arrives
+                        await async_remember_user_by_screen_name_request(context, xhr)
+                        if user_profile_data is None: user_profile_data = await async_profile_from_response(xhr, url, limiter)
+                        continue
+                    no_new_xhr_scroll_count = 0
+                    if not attempt.add_page(xhr.url, await async_read_graphql_json(xhr, "XHR", limiter)): continue
+                    if attempt.done: break
+                    if DIRECT_GRAPHQL_PAGINATION: first_user_tweets_request = (xhr.url, await xhr.request.all_headers()); break
+                    if inbox.is_idle() and not attempt.is_full():
+                        await limiter.async_acquire("UserTweets"); await page.mouse.wheel(0, 10000) # Ask for the next page right away instead of waiting out a timeout first
+
+                if first_user_tweets_request: await async_paginate_user_tweets_via_api(context, *first_user_tweets_request, attempt, overall_start_time + timeout_seconds - 10)
+                tweets = attempt.finish(no_new_xhr_scroll_count)
+
+                while include_profile and user_profile_data is None: # Profile XHR still queued behind the last tweet page
+                    operation, xhr = inbox.pop()
+                    if xhr is None: break
+                    if operation == "UserByScreenName": await async_remember_user_by_screen_name_request(context, xhr); user_profile_data = await async_profile_from_response(xhr, url, limiter)
+                page = await pages.async_release(page)
+                return (tweets, user_profile_data) if include_profile else tweets
+
+            else: # Profile Scraping
+                user_profile_data = None; profile_xhrs_seen = 0; loop_start_time = time.time()
+                profile_xhr_wait_timeout = max(20, remaining_seconds() - 10) # 10s buffer
+                while user_profile_data is None and time.time() - loop_start_time < profile_xhr_wait_timeout:
+                    operation, call = inbox.pop()
+                    if call is None:
+                        with metrics.phase("profile_wait"): await inbox.async_wait(500)
+                        continue
+                    profile_xhrs_seen += 1; await async_remember_user_by_screen_name_request(context, call)
+                    user_profile_data = profile_from_json(call.url, url, await async_read_graphql_json(call, "Profile XHR", limiter))
+                page = await pages.async_release(page)
+                return profile_visit_result(url, user_profile_data, profile_xhrs_seen, profile_xhr_wait_timeout)
+
+        except AccountUnavailableException: # Re-raised to be handled by async_process_user
+            page = await pages.async_release(page)
+            raise
+        except Exception as e_attempt:
+            local_retries += 1
+            page = await pages.async_release(page)
+            delay = local_retry_delay(e_attempt, local_retries, context, url) # Re-raises what must escalate
+            if delay is None: return None
+            with metrics.phase("retry_sleep"): await asyncio.sleep(delay)
+
+    print(f"Failed to scrape {url} after {MAX_LOCAL_OPERATION_RETRIES + 1} local attempts.")
+    page = await pages.async_release(page)
+    return None
+
+class AsyncContextPool:
+    """Browser contexts for the async engine: one shared context, or with an AccountPool one lazily created context per account.
+    Workers lease a context per user. After CONTEXT_RECYCLE_USERS leases a context is retired: new leases get a fresh one and
+    the old one is closed when its last worker releases it. A crashed or disconnected browser is relaunched by the next lease,
+    which recreates only the contexts (the storage states carry the logins)."""
+    def __init__(self, browser, account_pool=None, storage_state=None, resource_blocker=None, playwright_manager=None):
+        self.browser = browser; self.account_pool = account_pool; self.storage_state = storage_state
+        self.resource_blocker = resource_blocker; self.playwright_manager = playwright_manager # Needed to relaunch the browser
+        self._contexts = {}; self._leases = {} # id(context) -> [context, users leased, active leases]
+        self._lock = asyncio.Lock()
+
+    def pick_account(self, exclude=(), allow_cooling=False):
+        return self.account_pool.pick(exclude=exclude, allow_cooling=allow_cooling) if self.account_pool else None
+
+    async def _ensure_browser(self):
+        if self.browser.is_connected() or not self.playwright_manager: return
+        print("Async browser disconnected or crashed. Relaunching it and recreating its contexts...")
+        metrics.count("browser_restarts")
+        for context in self._contexts.values(): unregister_context_account(context); drop_page_pool(context)
+        self._contexts = {} # Dead contexts are closed as their leases are released
+        with metrics.phase("session_start"): self.browser = await self.playwright_manager.chromium.launch(headless=HEADLESS)
+
+    async def _close_context(self, context):
+        self._leases.pop(id(context), None); unregister_context_account(context); drop_page_pool(context)
+        try: await context.close()
+        except Exception as e: print(f"Error closing async context: {e}")
+
+    async def lease(self, account=None):
+        key = account["name"] if account else None
+        async with self._lock:
+            await self._ensure_browser()
+            context = self._contexts.get(key)
+            if context is not None and CONTEXT_RECYCLE_USERS and self._leases[id(context)][1] >= CONTEXT_RECYCLE_USERS:
+                print(f"Recycling async browser context{f' of account {key}' if key else ''} after {self._leases[id(context)][1]} users.")
+                metrics.count("context_recycles")
+                del self._contexts[key]
+                if not self._leases[id(context)][2]: await self._close_context(context)
+                context = None
+            if context is None:
+                with metrics.phase("session_start"):
+                    context = await self.browser.new_context(viewport={"width": 1920, "height": 1080}, storage_state=account["storage_state"] if account else self.storage_state)
+                    register_context_account(context, account)
+                    if self.resource_blocker: await context.route("**/*", self.resource_blocker.async_handle_route)
+                    if graphql_cache(): await context.route("**/i/api/graphql/**", graphql_cache().async_handle_route)
+                self._contexts[key] = context; self._leases[id(context)] = [context, 0, 0]
+            self._leases[id(context)][1] += 1; self._leases[id(context)][2] += 1
+            return context
+
+    async def release(self, context):
+        lease = self._leases.get(id(context))
+        if not lease: return
+        lease[2] -= 1
+        if lease[2] <= 0 and all(live_context is not context for live_context in self._contexts.values()): await self._close_context(context) # Retired or orphaned by a relaunch
+
+    async def switch(self, context, account=None):
+        """Releases context and leases the (possibly fresh) context of account instead."""
+        new_context = await self.lease(account); await self.release(context)
+        return new_context
+
+    async def close(self):
+        for context, _, _ in list(self._leases.values()): await self._close_context(context)
+        self._contexts = {}
+
+async def async_remember_user_by_screen_name_request(context: AsyncBrowserContext, xhr):
+    account_name = _context_accounts.get(id(context), {}).get("name")
+    if ACCOUNT_PRECHECK and account_name not in _user_by_screen_name_requests: _user_by_screen_name_requests[account_name] = (xhr.url, await xhr.request.all_headers())
+
+async def async_precheck_account(context: AsyncBrowserContext, sanitized_username, user_dir):
+    skip_timeline, fresh = recent_account_precheck(user_dir, sanitized_username)
+    if fresh: return skip_timeline, None
+    captured_request = _user_by_screen_name_requests.get(_context_accounts.get(id(context), {}).get("name"))
+    if captured_request is None: return False, None
+    try: json_response = await async_request_graphql_json(context, build_user_by_screen_name_url(captured_request[0], sanitized_username), graphql_api_headers(captured_request[1]), "Pre-check", timeout_ms=15000)
+    except RateLimitException as rle: print(f"Account pre-check of {sanitized_username} rate limited ({rle}); going to the full scrape."); return False, None
+    except Exception as e_precheck: print(f"Account pre-check failed for {sanitized_username}: {e_precheck}"); return False, None
+    return apply_account_precheck(user_dir, sanitized_username, json_response)
+
+async def async_process_user(contexts: AsyncContextPool, username_in_file, user_index, total_users):
+    """Async counterpart of process_user. A persistent rate limit first rotates to another pooled account; otherwise it waits until reset
+    (or GLOBAL_RETRY_DELAY_SECONDS) and retries on the shared context rather than restarting the browser, which other workers are still using."""
+    job = UserScrapeJob(username_in_file, user_index, total_users)
+    if not job.start(): return "problematic"
+    account = contexts.pick_account(allow_cooling=True); context = await contexts.lease(account)
+    if job.needs_precheck():
+        try: job.apply_precheck(await async_precheck_account(context, job.sanitized_username, job.user_dir))
+        except AccountUnavailableException as auae:
+            await contexts.release(context)
+            return job.mark_problematic(auae)
+    job.open()
+
+    operation_completed_for_user = False
+    global_retry_count_for_user = 0; account_rotations_for_user = 0; browser_restarts_for_user = 0
+    while not operation_completed_for_user and global_retry_count_for_user <= MAX_GLOBAL_USER_RETRIES:
+        try:
+            for scrape_kwargs in job.pending_scrapes(global_retry_count_for_user + 1):
+                job.record_scrape(scrape_kwargs, await async_scrape_twitter_info(context, job.profile_url, **scrape_kwargs))
+            operation_completed_for_user = True
+        except AccountUnavailableException as auae:
+            handle_account_unavailable(username_in_file, job.user_dir, auae)
+            operation_completed_for_user = True
+        except RateLimitException as rle_from_scraper:
+            print(f"Persistent RateLimitException for user {job.sanitized_username} after local retries: {rle_from_scraper}")
+            if account and account_rotations_for_user < len(contexts.account_pool.accounts):
+                contexts.account_pool.mark_rate_limited(account)
+                next_account = contexts.pick_account(exclude={account["name"]})
+                if next_account:
+                    account_rotations_for_user += 1; account = next_account; context = await contexts.switch(context, account); metrics.count("retries", kind="account_rotation")
+                    print(f"Rotated to account '{account['name']}'. Retrying {job.sanitized_username} immediately.")
+                    continue
+            global_retry_count_for_user += 1
+            if global_retry_count_for_user <= MAX_GLOBAL_USER_RETRIES:
+                retry_delay = global_retry_delay(contexts.account_pool)
+                print(f"--- GLOBAL RETRY {global_retry_count_for_user}/{MAX_GLOBAL_USER_RETRIES} for {job.sanitized_username} in {retry_delay:.0f}s ---")
+                metrics.count("retries", kind="global")
+                with metrics.phase("retry_sleep"): await asyncio.sleep(retry_delay)
+                if account: account = contexts.pick_account(allow_cooling=True)
+                context = await contexts.switch(context, account) # Fresh if it was recycled or its browser died meanwhile
+            else:
+                print(f"Max global retries ({MAX_GLOBAL_USER_RETRIES}) reached for {job.sanitized_username} due to rate limits. Skipping user.")
+                operation_completed_for_user = True; job.rate_limited_out = True
+        except Exception as e_other_op_error:
+            print(f"Unhandled error during scraping operations for {job.sanitized_username} in global attempt: {e_other_op_error}")
+            if browser_restarts_for_user < MAX_GLOBAL_USER_RETRIES and not browser_is_connected(context): # Retry on the relaunched browser
+                browser_restarts_for_user += 1; metrics.count("retries", kind="browser_crash"); context = await contexts.switch(context, account); continue
+            operation_completed_for_user = True
+    await contexts.release(context)
+
+    # File writes and pandas analysis are blocking; keep them off the event loop
+    return await asyncio.to_thread(job.save, contexts.resource_blocker)
+
+async def async_run_scrape_worker(worker_id, contexts: AsyncContextPool, username_queue: asyncio.Queue, total_users):
+    while True:
+        try: user_index, username_in_file = username_queue.get_nowait()
+        except (asyncio.QueueEmpty, queue.Empty): break
+        user_metrics = metrics.start_user(username_in_file); outcome = "error"
+        try:
+            set_worker_status(worker_id, username_in_file, f"scraping ({user_progress(user_index, total_users)})")
+            outcome = await async_process_user(contexts, username_in_file, user_index, total_users)
+            set_worker_status(worker_id, username_in_file, outcome, outcome=outcome)
+        except Exception as e_worker_user:
+            print(f"Unhandled error in worker {worker_id} for {username_in_file}: {e_worker_user}")
+            set_worker_status(worker_id, username_in_file, "error", outcome="error")
+        finally:
+            metrics.finish_user(user_metrics, outcome)
+            if _work_queue: _work_queue.complete(username_in_file, outcome)
+        if ADAPTIVE_RATE_LIMITING: print(f"[Worker {worker_id}] Rate-limit budget: {contexts.account_pool.describe() if contexts.account_pool else rate_limiter.describe()}")
+        elif not username_queue.empty():
+            print(f"[Worker {worker_id}] Waiting for {INTER_USER_DELAY_SECONDS} seconds before processing next user...")
+            with metrics.phase("inter_user_delay"): await asyncio.sleep(INTER_USER_DELAY_SECONDS)
+    set_worker_status(worker_id, None, "finished")
+
+async def async_main(usernames_to_scrape, storage_state=None, account_pool=None, username_queue=None):
+    """Scrapes all usernames with NUM_WORKERS concurrent pages in one browser, using a context created from storage_state
+    or, with an account_pool, one context per pooled account. A WorkQueueFeed as username_queue makes the workers claim
+    users from the shared work queue instead (usernames_to_scrape then only sizes the run)."""
+    if username_queue is None:
+        username_queue = asyncio.Queue()
+        for user_index, username_in_file in enumerate(usernames_to_scrape): username_queue.put_nowait((user_index, username_in_file))
+    num_workers = max(1, min(NUM_WORKERS, len(usernames_to_scrape)))
+
+    async with async_playwright() as playwright_manager:
+        browser = await playwright_manager.chromium.launch(headless=HEADLESS)
+        contexts = AsyncContextPool(browser, account_pool, storage_state, ResourceBlocker() if BLOCK_HEAVY_RESOURCES else None, playwright_manager)
+        try:
+            print(f"Starting {num_workers} async workers for {len(usernames_to_scrape)} users...")
+            await asyncio.gather(*(async_run_scrape_worker(worker_id, contexts, username_queue, None if isinstance(username_queue, WorkQueueFeed) else len(usernames_to_scrape)) for worker_id in range(1, num_workers + 1)))
+        finally:
+            await contexts.close()
+            try: await contexts.browser.close() # Not necessarily the one launched above
+            except Exception as e: print(f"Error closing async browser: {e}")
 
 def main():
     if not X_USERNAME or X_USERNAME == "YOUR_X_USERNAME_HERE" or not X_PASSWORD or X_PASSWORD == "YOUR_X_PASSWORD_HERE":
@@ -433,193 +2667,80 @@ def main():
     except FileNotFoundError: print(f"Error: '{USERNAMES_FILE}' not found."); return
     if not usernames_to_scrape: print(f"Error: '{USERNAMES_FILE}' is empty."); return
 
-    playwright_manager = None; browser = None; context = None
+    # Duplicates would have two workers writing the same user directory
+    unique_usernames = list(dict.fromkeys(usernames_to_scrape))
+    if len(unique_usernames) < len(usernames_to_scrape): print(f"Skipping {len(usernames_to_scrape) - len(unique_usernames)} duplicate usernames.")
+    usernames_to_scrape = unique_usernames
+
+    global _run_journal, metrics, _work_queue
+    metrics = ScrapeMetrics(METRICS_LOG_FILE, METRICS_PROMETHEUS_FILE) # Picks up config changed after import; times the whole run
+    if WORK_QUEUE_DB:
+        _work_queue = WorkQueue(WORK_QUEUE_DB, WORK_QUEUE_LEASE_SECONDS, WORK_QUEUE_MAX_ATTEMPTS)
+        queued_count = _work_queue.seed(schedule_usernames(usernames_to_scrape) if PRIORITY_SCHEDULING else usernames_to_scrape) # Users already queued are left alone
+        usernames_to_scrape = _work_queue.claimable_usernames()
+        print(f"Work queue {WORK_QUEUE_DB}: {queued_count} new users queued; {len(usernames_to_scrape)} claimable by worker {_work_queue.worker_name} ({_work_queue.describe()}).")
+        if not usernames_to_scrape: print("Nothing left to claim in the work queue."); return
+        _work_queue.start_heartbeat(WORK_QUEUE_HEARTBEAT_SECONDS)
+    elif RESUME_FROM_JOURNAL:
+        _run_journal = RunJournal(RUN_JOURNAL_FILE)
+        remaining_usernames = [username for username in usernames_to_scrape if not _run_journal.is_finished(username)]
+        if len(remaining_usernames) < len(usernames_to_scrape): print(f"Resuming from {RUN_JOURNAL_FILE}: skipping {len(usernames_to_scrape) - len(remaining_usernames)} users already finished.")
+        usernames_to_scrape = remaining_usernames
+        if not usernames_to_scrape: print("All users in the journal are already finished."); _run_journal.archive(); return
+    if PRIORITY_SCHEDULING and not _work_queue:
+        usernames_to_scrape = schedule_usernames(usernames_to_scrape)
+        if not usernames_to_scrape: print("No users are due for a refresh yet."); return
+    num_workers = max(1, min(NUM_WORKERS, len(usernames_to_scrape)))
+    global _account_pool
+    if ACCOUNT_STORAGE_STATES_DIR:
+        try: _account_pool = AccountPool.from_dir(ACCOUNT_STORAGE_STATES_DIR)
+        except (OSError, ValueError) as e_pool: print(f"Error loading account pool: {e_pool}"); return
+        print(f"Loaded {len(_account_pool.accounts)} accounts from {ACCOUNT_STORAGE_STATES_DIR}: {', '.join(account['name'] for account in _account_pool.accounts)}")
+    initial_session = ScrapeSession(account_pool=_account_pool)
 
     try:
-        playwright_manager = sync_playwright().start()
-        browser = playwright_manager.chromium.launch(headless=False)
-        context = browser.new_context(viewport={"width": 1920, "height": 1080})
-        login_page = context.new_page()
-        initial_logged_in = login_to_x(login_page)
-        try: login_page.close()
-        except Exception as e_login_close: print(f"Note: Could not close login page: {e_login_close}")
+        initial_logged_in = initial_session.start(login=True)
         if not initial_logged_in: print("Initial login failed. Results may be severely limited or fail.")
-        else: print("Initial login successful.")
-
-        current_user_index = 0
-        while current_user_index < len(usernames_to_scrape):
-            username_in_file = usernames_to_scrape[current_user_index]
-            if not username_in_file:
-                current_user_index += 1; continue
-
-            print(f"\n--- Starting processing for user: {username_in_file} ({current_user_index + 1}/{len(usernames_to_scrape)}) ---")
-            sanitized_username = username_in_file.lstrip('@')
-            profile_url = f"https://x.com/{sanitized_username}"
-            user_dir = os.path.join(".", sanitized_username)
-
-            is_problematic_before_scrape = False
-            if os.path.exists(PROBLEMATIC_USERNAMES_FILE):
-                with open(PROBLEMATIC_USERNAMES_FILE, 'r', encoding='utf-8') as p_check:
-                    if any(username_in_file in line for line in p_check):
-                        is_problematic_before_scrape = True
-
-            if not is_problematic_before_scrape:
-                 os.makedirs(user_dir, exist_ok=True)
-            elif os.path.exists(user_dir):
-                print(f"User '{username_in_file}' was previously marked problematic, ensuring directory is removed.")
-                try: shutil.rmtree(user_dir)
-                except Exception as e_rm_pre: print(f"Note: Error removing pre-existing problematic user dir {user_dir}: {e_rm_pre}")
-
-
-            operation_completed_for_user = False
-            global_retry_count_for_user = 0
-            tweets_data_for_current_user = None # Initialize before retry loop
-            profile_data_for_current_user = None # Initialize before retry loop
-
-            while not operation_completed_for_user and global_retry_count_for_user <= MAX_GLOBAL_USER_RETRIES:
-                try:
-                    # Attempt to scrape tweets only if not already successfully scraped in a previous global attempt (if applicable)
-                    if tweets_data_for_current_user is None: # Only attempt if not already fetched
-                        print(f"Attempting to scrape tweets for: {sanitized_username} (Global attempt {global_retry_count_for_user + 1})")
-                        tweets_data_for_current_user = scrape_twitter_info(context, profile_url, scrape_tweets_mode=True, timeout_seconds=480)
-
-                    # Attempt to scrape profile only if not already successfully scraped
-                    if profile_data_for_current_user is None: # Only attempt if not already fetched
-                        print(f"Attempting to scrape profile for: {sanitized_username} (Global attempt {global_retry_count_for_user + 1})")
-                        profile_data_for_current_user = scrape_twitter_info(context, profile_url, scrape_tweets_mode=False, timeout_seconds=90)
-
-                    operation_completed_for_user = True # Mark as completed if both ops (or those pending) succeed or return None (no RateLimitException)
-
-                except AccountUnavailableException as auae:
-                    print(f"AccountUnavailableException for user {sanitized_username}: {auae}")
-                    already_logged_problematic = False
-                    if os.path.exists(PROBLEMATIC_USERNAMES_FILE):
-                        with open(PROBLEMATIC_USERNAMES_FILE, 'r', encoding='utf-8') as p_check:
-                            if any(username_in_file in line for line in p_check): already_logged_problematic = True
-                    if not already_logged_problematic:
-                        with open(PROBLEMATIC_USERNAMES_FILE, "a", encoding="utf-8") as puf: puf.write(f"{username_in_file}\n")
-                        print(f"Added '{username_in_file}' to {PROBLEMATIC_USERNAMES_FILE}.")
-                    if os.path.exists(user_dir): # Ensure directory is removed for problematic accounts
-                        try: shutil.rmtree(user_dir); print(f"Removed directory due to account issue: {user_dir}")
-                        except OSError as e_rm: print(f"Error removing directory {user_dir} for problematic account: {e_rm}")
-                    operation_completed_for_user = True # Stop retrying for this user
-                    global_retry_count_for_user = MAX_GLOBAL_USER_RETRIES + 1 # Ensure exit from global retry loop
-
-                except RateLimitException as rle_from_scraper:
-                    print(f"Persistent RateLimitException for user {sanitized_username} after local retries: {rle_from_scraper}")
-                    global_retry_count_for_user += 1
-                    if global_retry_count_for_user <= MAX_GLOBAL_USER_RETRIES:
-                        print(f"--- Initiating GLOBAL RETRY {global_retry_count_for_user}/{MAX_GLOBAL_USER_RETRIES} for {sanitized_username} ---")
-                        print(f"Closing current browser session...")
-                        if context:
-                            try: context.close(); context = None;
-                            except Exception as e: print(f"Err closing context: {e}")
-                        if browser:
-                            try: browser.close(); browser = None;
-                            except Exception as e: print(f"Err closing browser: {e}")
-
-                        print(f"Waiting for {GLOBAL_RETRY_DELAY_SECONDS} seconds before re-initializing browser...")
-                        time.sleep(GLOBAL_RETRY_DELAY_SECONDS)
-                        try:
-                            print("Re-initializing browser and context...")
-                            if not playwright_manager: playwright_manager = sync_playwright().start()
-                            browser = playwright_manager.chromium.launch(headless=False)
-                            context = browser.new_context(viewport={"width": 1920, "height": 1080})
-                            temp_login_page = context.new_page()
-                            logged_in_after_retry = login_to_x(temp_login_page)
-                            try: temp_login_page.close()
-                            except Exception as e: print(f"Err closing temp login page: {e}")
-
-                            if not logged_in_after_retry:
-                                print("FATAL: Failed to re-login after browser restart. Skipping user.")
-                                operation_completed_for_user = True # Give up on this user
-                            else:
-                                print("Re-login successful. Retrying scraping for current user.")
-                                # Do NOT set operation_completed_for_user = True; allow loop to retry operations
-                        except Exception as e_reinit:
-                            print(f"FATAL: Error during browser re-initialization: {e_reinit}. Skipping user.")
-                            operation_completed_for_user = True # Give up on this user
-                    else:
-                        print(f"Max global retries ({MAX_GLOBAL_USER_RETRIES}) reached for {sanitized_username} due to rate limits. Skipping user.")
-                        operation_completed_for_user = True # Give up on this user
+        elif not _account_pool: print("Initial login successful.")
 
-                except Exception as e_other_op_error:
-                    print(f"Unhandled error during scraping operations for {sanitized_username} in global attempt: {e_other_op_error}")
-                    operation_completed_for_user = True # Give up on this user for this cycle
-
-            # After all attempts for the user (either completed, rate-limited out, or other error)
-            is_problematic_after_scrape = False
-            if os.path.exists(PROBLEMATIC_USERNAMES_FILE):
-                with open(PROBLEMATIC_USERNAMES_FILE, 'r', encoding='utf-8') as p_check_file:
-                    if any(username_in_file in line for line in p_check_file):
-                        is_problematic_after_scrape = True
-
-            if not is_problematic_after_scrape: # Only save if not marked as problematic
-                if os.path.exists(user_dir): # Ensure user_dir exists (it might have been removed if problematic was found late)
-                    tweets_filename = os.path.join(user_dir, f"{sanitized_username}_last_{NUM_POSTS_TO_RETRIEVE}_tweets.json")
-                    if tweets_data_for_current_user:
-                        print(f"Final tweet data count for {sanitized_username}: {len(tweets_data_for_current_user)}.")
-                        with open(tweets_filename, "w", encoding="utf-8") as f: json.dump(tweets_data_for_current_user, f, indent=4, ensure_ascii=False)
-                        print(f"Saved tweets to {tweets_filename}"); analyze_and_save_tweets(tweets_filename, user_dir)
-                    else:
-                        print(f"No tweet data collected for {sanitized_username} after all attempts.")
-                        # Clean up empty file if it was created then failed
-                        if os.path.exists(tweets_filename) and os.path.getsize(tweets_filename) == 0:
-                            try: os.remove(tweets_filename); print(f"Removed empty tweet file: {tweets_filename}")
-                            except OSError as e: print(f"Error removing empty {tweets_filename}: {e}")
-
-                    profile_filename = os.path.join(user_dir, f"{sanitized_username}_user_profile_info.json")
-                    if profile_data_for_current_user:
-                        with open(profile_filename, "w", encoding="utf-8") as f: json.dump(profile_data_for_current_user, f, indent=4, ensure_ascii=False)
-                        print(f"Profile data for {sanitized_username} saved to {profile_filename}")
-                    else:
-                        print(f"No profile data collected for {sanitized_username} after all attempts.")
-                        if os.path.exists(profile_filename) and os.path.getsize(profile_filename) == 0:
-                            try: os.remove(profile_filename); print(f"Removed empty profile file: {profile_filename}")
-                            except OSError as e: print(f"Error removing empty {profile_filename}: {e}")
-                else:
-                    print(f"User directory {user_dir} does not exist, skipping file saving for {sanitized_username}.")
-
-
-            # Final status message for the user
-            if not is_problematic_after_scrape:
-                tweets_file_exists = os.path.exists(os.path.join(user_dir, f"{sanitized_username}_last_{NUM_POSTS_TO_RETRIEVE}_tweets.json")) and \
-                                     os.path.getsize(os.path.join(user_dir, f"{sanitized_username}_last_{NUM_POSTS_TO_RETRIEVE}_tweets.json")) > 0
-                profile_file_exists = os.path.exists(os.path.join(user_dir, f"{sanitized_username}_user_profile_info.json")) and \
-                                      os.path.getsize(os.path.join(user_dir, f"{sanitized_username}_user_profile_info.json")) > 0
-
-                if tweets_file_exists and profile_file_exists: print(f"Successfully completed for {sanitized_username}.")
-                elif tweets_file_exists: print(f"Partially completed for {sanitized_username} (tweets OK, profile failed/not found).")
-                elif profile_file_exists: print(f"Partially completed for {sanitized_username} (profile OK, tweets failed/not found).")
-                elif os.path.exists(user_dir): # Directory exists but no data
-                     print(f"Processing ultimately failed to yield data for {sanitized_username}.")
-                # If user_dir was removed (e.g. became problematic late), this won't print, which is fine.
+        if SCRAPER_ENGINE == "async":
+            shared_storage_state = initial_session.context.storage_state() if not _account_pool else None
+            initial_session.stop() # The async engine drives its own browser from the logged-in cookies
+            asyncio.run(async_main(usernames_to_scrape, shared_storage_state, _account_pool, WorkQueueFeed(_work_queue) if _work_queue else None))
+        else:
+            if _work_queue: username_queue = WorkQueueFeed(_work_queue)
             else:
-                print(f"Processing for {sanitized_username} concluded as problematic.")
-
-
-            print(f"--- Finished all attempts for {username_in_file} ---")
-            current_user_index += 1
-            if current_user_index < len(usernames_to_scrape):
-                print(f"Waiting for 10 seconds before processing next user...")
-                time.sleep(10) # Inter-user delay
+                username_queue = queue.Queue()
+                for user_index, username_in_file in enumerate(usernames_to_scrape): username_queue.put((user_index, username_in_file))
+            total_users = None if _work_queue else len(usernames_to_scrape)
+            if num_workers == 1:
+                run_scrape_worker(1, initial_session, username_queue, total_users)
+            else:
+                shared_storage_state = initial_session.context.storage_state() if not _account_pool else None
+                initial_session.stop() # Each worker thread launches its own browser from the shared session cookies
+                print(f"Starting {num_workers} concurrent workers for {len(usernames_to_scrape)} users...")
+                workers = [threading.Thread(target=_worker_thread_main, args=(worker_id, shared_storage_state, username_queue, total_users, _account_pool), name=f"scrape-worker-{worker_id}", daemon=True)
+                           for worker_id in range(1, num_workers + 1)]
+                for worker in workers: worker.start()
+                for worker in workers: worker.join()
 
         print("\nAll users processed.")
+        print_worker_summary()
+        if _run_journal:
+            unfinished_usernames = [username for username in usernames_to_scrape if not _run_journal.is_finished(username)]
+            if unfinished_usernames: print(f"{len(unfinished_usernames)} users unfinished (e.g. rate limited); rerun to resume them from {RUN_JOURNAL_FILE}.")
+            else: _run_journal.archive()
+        if _work_queue: print(f"Work queue {WORK_QUEUE_DB}: {_work_queue.describe()}.")
 
     except Exception as e_outer_main:
         print(f"Critical error in script execution: {e_outer_main}")
     finally:
         print("\nCleaning up final browser session...")
-        if context:
-            try: context.close()
-            except Exception as e: print(f"Error closing final context: {e}")
-        if browser and browser.is_connected(): # Check if browser is still connected
-            try: browser.close()
-            except Exception as e: print(f"Error closing final browser: {e}")
-        if playwright_manager:
-            try: playwright_manager.stop()
-            except Exception as e: print(f"Error stopping playwright: {e}")
+        initial_session.stop()
+        if _work_queue: _work_queue.stop_heartbeat(); _work_queue.release_leases()
+        metrics.print_summary()
+        if _tweet_store: _tweet_store.close()
         print("Script finished.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()